@@ -0,0 +1,12 @@
+"""
+Banc de charge hors ligne de Frenchio
+
+Des serveurs factices (aiohttp) remplacent TMDB, les trackers (UNIT3D,
+Sharewood, YGG, ABN), les débrideurs (AllDebrid, TorBox, Debrid-Link) et le
+WebUI qBittorrent, avec une latence et un taux d'erreur réglables par
+service. Le pilote rejoue un mélange de requêtes `stream` puis `resolve`
+contre l'application de main.py et mesure latences, débit et appels amont
+par requête.
+
+    python -m bench --requests 500 --concurrency 20
+"""
@@ -0,0 +1,87 @@
+"""
+python -m bench [options]
+
+Exemples :
+    python -m bench --requests 1000 --concurrency 50
+    python -m bench --debrid none --qbit --resolve-ratio 0.5
+    python -m bench --latency 80 --profile ygg=400:0.05 --profile abn=250::0.01
+    python -m bench --replay upstream-corpus --replay-speed 0
+    python -m bench --workers 4 --concurrency 100
+    python -m bench --workers 4 --cache-backend redis
+"""
+import argparse
+import asyncio
+import json
+
+from bench import driver
+from bench.fakes import Profile, SERVICES
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m bench', description="Banc de charge hors ligne de Frenchio")
+    parser.add_argument('--requests', type=int, default=300, help="requêtes stream (défaut 300)")
+    parser.add_argument('--concurrency', type=int, default=20, help="requêtes en vol (défaut 20)")
+    parser.add_argument('--resolve-ratio', type=float, default=0.3,
+                        help="part des recherches suivies d'un resolve (défaut 0.3)")
+    parser.add_argument('--titles', type=int, default=200, help="taille du catalogue (défaut 200)")
+    parser.add_argument('--zipf', type=float, default=1.1,
+                        help="exposant de popularité des titres, 0 = uniforme (défaut 1.1)")
+    parser.add_argument('--releases', type=int, default=4, help="releases par source et par titre (défaut 4)")
+    parser.add_argument('--cached-ratio', type=float, default=0.5,
+                        help="part des torrents en cache chez le débrideur (défaut 0.5)")
+    parser.add_argument('--debrid', choices=['alldebrid', 'torbox', 'debridlink', 'none'], default='alldebrid')
+    parser.add_argument('--qbit', action='store_true', help="ajoute qBittorrent à la config utilisateur")
+    parser.add_argument('--qbit-ready-after', type=float, default=1.0,
+                        help="durée de téléchargement simulée d'un torrent (défaut 1 s)")
+    parser.add_argument('--qbit-ready-timeout', type=float, default=20.0, help="QBIT_READY_TIMEOUT de l'application")
+    parser.add_argument('--latency', type=float, default=50.0, help="latence moyenne des services (ms, défaut 50)")
+    parser.add_argument('--jitter', type=float, default=0.5, help="part aléatoire de la latence, 0 à 1 (défaut 0.5)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="proportion de réponses 503")
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help="proportion d'appels qui ne répondent pas")
+    parser.add_argument('--hang', type=float, default=30.0, help="durée d'un appel qui ne répond pas (s)")
+    parser.add_argument('--profile', action='append', default=[], metavar='SERVICE=MS[:ERREURS[:TIMEOUTS]]',
+                        help=f"profil d'un service ({', '.join(SERVICES)})")
+    parser.add_argument('--replay', metavar='DIR',
+                        help="rejoue un corpus enregistré (UPSTREAM_MODE=record) au lieu des serveurs factices")
+    parser.add_argument('--replay-speed', type=float, default=1.0,
+                        help="facteur des durées enregistrées, 0 = réponses immédiates (défaut 1)")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="lance `python main.py` avec WORKERS=N dans un processus à part (défaut 0 : application "
+                             "dans le processus du banc)")
+    parser.add_argument('--cache-backend', choices=['none', 'memory', 'sqlite', 'redis'], default='none',
+                        help="cache partagé de l'application (CACHE_BACKEND) ; redis = serveur factice du banc "
+                             "(défaut none, sqlite avec --workers)")
+    parser.add_argument('--request-timeout', type=float, default=120.0, help="timeout client du pilote (s)")
+    parser.add_argument('--settle', type=float, default=1.0,
+                        help="stabilité des compteurs amont attendue en fin de phase (s)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log-level', default='WARNING', help="niveau de log de l'application (INFO = production)")
+    parser.add_argument('--json', action='store_true', help="rapport au format JSON")
+    options = parser.parse_args()
+    if options.replay and options.qbit:
+        parser.error("--qbit cannot be combined with --replay (the qBittorrent client is not recorded)")
+
+    options.default_profile = Profile(
+        latency=options.latency / 1000, jitter=options.jitter,
+        error_rate=options.error_rate, timeout_rate=options.timeout_rate, hang=options.hang
+    )
+    options.profiles = {}
+    for spec in options.profile:
+        name, _, value = spec.partition('=')
+        if name not in SERVICES or not value:
+            parser.error(f"invalid --profile {spec!r}")
+        options.profiles[name] = Profile.parse(value, options.default_profile)
+    return options
+
+
+def main():
+    options = parse_args()
+    reports = asyncio.run(driver.run(options))
+    if options.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        print(driver.render(reports))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Catalogue déterministe des serveurs factices
+
+Les titres, releases et .torrent sont dérivés de leur index : le pilote et
+les serveurs factices (dans un autre processus) retrouvent les mêmes données
+sans rien partager. Les .torrent sont valides (info hash réel, pièces
+cohérentes avec la taille) pour que le chemin qBittorrent soit le vrai.
+"""
+import hashlib
+import random
+import re
+
+IMDB_BASE = 9000000
+TMDB_BASE = 500000
+SEASONS = 2
+EPISODES = 8
+PIECE_LENGTH = 16 * 1024 * 1024
+
+QUALITIES = ("1080p", "2160p", "720p", "1080p")
+LANGUAGES = ("MULTI", "TRUEFRENCH", "VOSTFR", "FRENCH")
+
+_TITLE_RE = re.compile(r'Bench (Movie|Show) (\d+)', re.IGNORECASE)
+_EPISODE_RE = re.compile(r'S(\d{1,2})(?:E(\d{1,2}))?', re.IGNORECASE)
+
+
+def bencode(value):
+    if isinstance(value, int):
+        return b'i%de' % value
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, bytes):
+        return b'%d:%s' % (len(value), value)
+    if isinstance(value, list):
+        return b'l' + b''.join(bencode(v) for v in value) + b'e'
+    if isinstance(value, dict):
+        items = sorted((k.encode() if isinstance(k, str) else k, v) for k, v in value.items())
+        return b'd' + b''.join(bencode(k) + bencode(v) for k, v in items) + b'e'
+    raise TypeError(f"cannot bencode {type(value).__name__}")
+
+
+class Title:
+    __slots__ = ('index', 'kind', 'name', 'year')
+
+    def __init__(self, index):
+        self.index = index
+        # Un titre sur trois est une série
+        self.kind = 'series' if index % 3 == 0 else 'movie'
+        self.name = f"Bench {'Show' if self.kind == 'series' else 'Movie'} {index}"
+        self.year = 1990 + index % 35
+
+    @property
+    def imdb_id(self):
+        return f"tt{IMDB_BASE + self.index}"
+
+    @property
+    def tmdb_id(self):
+        return TMDB_BASE + self.index
+
+    def details(self):
+        """Réponse TMDB /movie/{id} ou /tv/{id}"""
+        if self.kind == 'movie':
+            return {"id": self.tmdb_id, "title": self.name, "original_title": self.name,
+                    "release_date": f"{self.year}-06-01"}
+        return {
+            "id": self.tmdb_id, "name": self.name, "original_name": self.name,
+            "first_air_date": f"{self.year}-09-01",
+            "seasons": [{"season_number": s, "episode_count": EPISODES} for s in range(1, SEASONS + 1)],
+        }
+
+
+class Release:
+    __slots__ = ('id', 'source', 'name', 'files', 'torrent', 'info_hash', 'size')
+
+    def __init__(self, id, source, name, files, seed):
+        self.id = id
+        self.source = source
+        self.name = name
+        # [(chemin relatif, taille)] ; un seul fichier = torrent mono-fichier
+        self.files = files
+        self.size = sum(size for _, size in files)
+        digest = hashlib.sha1(seed.encode()).digest()
+        pieces = digest * (-(-self.size // PIECE_LENGTH))
+        info = {"piece length": PIECE_LENGTH, "pieces": pieces}
+        if len(files) == 1:
+            # Torrent mono-fichier : le nom est celui du fichier
+            info.update(name=files[0][0], length=files[0][1])
+        else:
+            info.update(name=name, files=[{"length": size, "path": path.split('/')} for path, size in files])
+        self.torrent = bencode({"announce": "http://tracker.bench.invalid/announce", "info": info})
+        self.info_hash = hashlib.sha1(bencode(info)).hexdigest()
+
+    def file_paths(self):
+        """Chemins complets tels que les montre qBittorrent (disposition Original)"""
+        if len(self.files) == 1:
+            return list(self.files)
+        return [(f"{self.name}/{path}", size) for path, size in self.files]
+
+
+class Catalog:
+    def __init__(self, titles=200, releases=4, cached_ratio=0.5):
+        self.size = titles
+        self.per_source = releases
+        self.cached_ratio = cached_ratio
+        self._releases = {}
+        self.by_id = {}
+        self.by_hash = {}
+
+    def titles(self):
+        return [Title(i) for i in range(1, self.size + 1)]
+
+    def title(self, index):
+        index = int(index)
+        return Title(index) if 1 <= index <= self.size else None
+
+    def by_imdb(self, imdb_id):
+        digits = str(imdb_id).replace('tt', '')
+        return self.title(int(digits) - IMDB_BASE) if digits.isdigit() else None
+
+    def by_tmdb(self, tmdb_id):
+        return self.title(int(tmdb_id) - TMDB_BASE) if str(tmdb_id).isdigit() else None
+
+    def parse_query(self, query):
+        """Titre, saison et épisode d'une recherche textuelle ("Bench Show 3 S01E02")"""
+        match = _TITLE_RE.search(query or '')
+        if not match:
+            return None, None, None
+        title = self.title(match.group(2))
+        episode_match = _EPISODE_RE.search(query[match.end():])
+        if not episode_match:
+            return title, None, None
+        season = int(episode_match.group(1))
+        episode = int(episode_match.group(2)) if episode_match.group(2) else None
+        return title, season, episode
+
+    def releases(self, source, title, season=None, episode=None):
+        """Releases d'une source pour un film, un épisode ou (sans épisode) un pack saison"""
+        if title is None:
+            return []
+        if title.kind == 'movie':
+            season = episode = None
+        elif season is None or not 1 <= season <= SEASONS or (episode is not None and not 1 <= episode <= EPISODES):
+            return []
+        key = (source, title.index, season, episode)
+        releases = self._releases.get(key)
+        if releases is None:
+            count = self.per_source if episode is not None or title.kind == 'movie' else max(self.per_source // 2, 1)
+            releases = self._releases[key] = [self._make(source, title, season, episode, k) for k in range(count)]
+        return releases
+
+    def _make(self, source, title, season, episode, k):
+        seed = f"{source}:{title.index}:{season}:{episode}:{k}"
+        rng = random.Random(seed)
+        quality = QUALITIES[k % len(QUALITIES)]
+        tags = f"{LANGUAGES[(title.index + k) % len(LANGUAGES)]}.{quality}.WEB.x264-{source.upper()}{k}"
+        base = title.name.replace(' ', '.')
+        if title.kind == 'movie':
+            name = f"{base}.{title.year}.{tags}"
+            files = [(f"{name}.mkv", rng.randint(1500, 9000) * 1024 * 1024)]
+            files = files if k % 2 == 0 else [files[0], (f"{name}.nfo", 4096)]
+        elif episode is not None:
+            name = f"{base}.S{season:02d}E{episode:02d}.{tags}"
+            files = [(f"{name}.mkv", rng.randint(300, 2500) * 1024 * 1024)]
+        else:
+            name = f"{base}.S{season:02d}.{tags}"
+            files = [(f"{base}.S{season:02d}E{e:02d}.{tags}.mkv", rng.randint(300, 2500) * 1024 * 1024)
+                     for e in range(1, EPISODES + 1)]
+            files.append((f"{name}.nfo", 4096))
+        release = Release(len(self.by_id) + 1, source, name, files, seed)
+        self.by_id[release.id] = release
+        self.by_hash[release.info_hash] = release
+        return release
+
+    def release(self, release_id):
+        try:
+            return self.by_id.get(int(release_id))
+        except (TypeError, ValueError):
+            return None
+
+    def is_cached(self, info_hash):
+        """Présence (déterministe) du torrent dans le cache des débrideurs"""
+        return int(info_hash[:8], 16) / 0xffffffff < self.cached_ratio
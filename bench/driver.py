@@ -0,0 +1,354 @@
+"""
+Pilote de charge : rejoue un mélange de requêtes contre get_app()
+
+Phase `stream` : recherches de films et d'épisodes, titres tirés selon une
+loi de Zipf (les titres populaires reviennent, comme en production, et
+profitent des caches). Phase `resolve` : une partie des streams retournés
+est ouverte, en privilégiant les premiers de la liste comme le fait un
+utilisateur. Les appels amont sont comptés par les serveurs factices ; le
+travail de fond déclenché par une phase (prefetch, nettoyage AllDebrid...)
+lui est attribué en attendant que les compteurs se stabilisent.
+
+Avec `--workers N`, l'application tourne dans un processus à part, lancée
+comme en production (`python main.py`, WORKERS=N) : la comparaison de
+`--workers 1` et `--workers 4` mesure le passage à plusieurs cœurs.
+
+Avec `--replay DIR`, pas de serveurs factices : l'application rejoue un
+corpus enregistré en production (UPSTREAM_MODE=record) et le pilote rejoue
+les recherches reçues pendant l'enregistrement.
+"""
+import asyncio
+import base64
+import importlib
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+
+import aiohttp
+from aiohttp import web
+
+import replay
+from bench import fakes
+from bench.catalog import Catalog, SEASONS, EPISODES
+
+# Services dont l'URL de base est remplacée par celle du serveur factice (UPSTREAM_URL_<NOM>)
+OVERRIDDEN = ("tmdb", "sharewood", "ygg", "abn", "alldebrid", "torbox", "debridlink")
+
+DEBRID_KEYS = {
+    "alldebrid": "alldebrid_key",
+    "torbox": "torbox_key",
+    "debridlink": "debridlink_key",
+}
+
+# Valeur des secrets masqués d'un corpus : assez longue pour être masquée à nouveau au rejeu
+# (passkey Sharewood dans le chemin notamment)
+REPLAY_SECRET = "replay" + "0" * 26
+
+
+def encode_config(config):
+    """Config encodée comme dans l'URL de l'addon ; c'est un segment de chemin, on évite un "/" dans le base64"""
+    for padding in range(64):
+        encoded = base64.b64encode(json.dumps({**config, "_": "x" * padding}).encode()).decode()
+        if '/' not in encoded:
+            return encoded
+    raise RuntimeError("could not encode config without '/'")
+
+
+def user_config(options, urls):
+    """Config utilisateur encodée comme dans l'URL de l'addon"""
+    config = {
+        "tmdb_key": "bench-tmdb",
+        "trackers": [{"url": urls['unit3d'], "token": "bench-token"}],
+        "sharewood_passkey": "bench-sharewood",
+        "ygg_passkey": "bench-ygg",
+        "abn_username": "bench",
+        "abn_password": "bench",
+    }
+    if options.debrid != 'none':
+        config[DEBRID_KEYS[options.debrid]] = "bench-debrid"
+    if options.qbit:
+        config["qbittorrent"] = {
+            "host": urls['qbittorrent'], "username": "bench", "password": "bench",
+            "public_url": f"{urls['cdn']}/dl/qbittorrent",
+        }
+    return encode_config(config)
+
+
+def stream_paths(options):
+    """Chemins /stream/... (sans la config) tirés selon la popularité des titres"""
+    rng = random.Random(options.seed)
+    titles = Catalog(options.titles).titles()
+    weights = [1 / rank ** options.zipf for rank in range(1, len(titles) + 1)]
+    rng.shuffle(titles)
+    for title in rng.choices(titles, weights, k=options.requests):
+        if title.kind == 'movie':
+            yield f"/stream/movie/{title.imdb_id}.json"
+        else:
+            yield f"/stream/series/{title.imdb_id}:{rng.randint(1, SEASONS)}:{rng.randint(1, EPISODES)}.json"
+
+
+def _unmask(value):
+    if value == replay.MASK:
+        return REPLAY_SECRET
+    if isinstance(value, dict):
+        return {k: _unmask(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_unmask(v) for v in value]
+    return value
+
+
+def replay_paths(options, kind):
+    """
+    Requêtes `kind` (stream, resolve) reçues pendant l'enregistrement du corpus,
+    dans l'ordre ; les recherches sont répétées jusqu'à `requests`
+    """
+    with open(os.path.join(options.replay, replay.INBOUND_LOG), encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    paths = []
+    for entry in entries:
+        if not entry['path'].startswith(f"/{kind}/"):
+            continue
+        config = _unmask(entry['config'])
+        # Client qBittorrent synchrone : hors corpus
+        config.pop('qbittorrent', None)
+        paths.append(f"/{encode_config(config)}{entry['path']}")
+    if kind != 'stream' or not paths:
+        return paths
+    return [paths[i % len(paths)] for i in range(options.requests)]
+
+
+def pick_resolves(streams, ratio, rng):
+    """Streams ouverts après une recherche : le premier le plus souvent, sinon l'un des cinq premiers"""
+    if not streams or rng.random() >= ratio:
+        return None
+    stream = streams[0] if rng.random() < 0.6 else rng.choice(streams[:5])
+    url = urllib.parse.urlsplit(stream['url'])
+    return f"{url.path}?{url.query}" if url.query else url.path
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+async def run_phase(session, base, paths, concurrency, on_response=None):
+    """Envoie `paths` avec `concurrency` requêtes en vol, retourne ([(durée, statut)], durée totale)"""
+    samples = []
+    pending = iter(paths)
+
+    async def worker():
+        for path in pending:
+            start = time.perf_counter()
+            try:
+                async with session.get(base + path, allow_redirects=False) as resp:
+                    body = await resp.read()
+                    status = resp.status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                body, status = None, type(e).__name__
+            samples.append((time.perf_counter() - start, status))
+            if on_response and status == 200:
+                on_response(body)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return samples, time.perf_counter() - start
+
+
+async def fake_stats(session, control, settle):
+    """Compteurs des serveurs factices, une fois stables depuis `settle` secondes (travail de fond)"""
+    deadline = time.monotonic() + max(settle * 10, 10)
+    previous = None
+    while True:
+        async with session.get(f"{control}/stats") as resp:
+            stats = await resp.json()
+        if stats == previous or time.monotonic() > deadline:
+            return stats
+        previous = stats
+        await asyncio.sleep(settle)
+
+
+def summarize(name, samples, elapsed, upstream):
+    durations = sorted(d for d, _ in samples)
+    statuses = {}
+    for _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    count = len(samples) or 1
+    return {
+        "phase": name,
+        "requests": len(samples),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(durations) / count * 1000, 1),
+            "p50": round(percentile(durations, 0.50) * 1000, 1),
+            "p95": round(percentile(durations, 0.95) * 1000, 1),
+            "p99": round(percentile(durations, 0.99) * 1000, 1),
+            "max": round((durations[-1] if durations else 0) * 1000, 1),
+        },
+        "status": statuses,
+        "upstream_per_request": {
+            service: round(s["calls"] / count, 2) for service, s in sorted(upstream.items())
+        },
+        "upstream_injected": {
+            service: {"errors": s["errors"], "timeouts": s["timeouts"]}
+            for service, s in sorted(upstream.items()) if s["errors"] or s["timeouts"]
+        },
+        "upstream_routes": {service: s["routes"] for service, s in sorted(upstream.items())},
+    }
+
+
+def prepare_environment(options, urls):
+    if options.replay:
+        os.environ['UPSTREAM_MODE'] = 'replay'
+        os.environ['UPSTREAM_CORPUS'] = options.replay
+        os.environ['UPSTREAM_REPLAY_SPEED'] = str(options.replay_speed)
+    for name in OVERRIDDEN if urls else ():
+        os.environ[f"UPSTREAM_URL_{name.upper()}"] = urls[name]
+    # Un proxy configuré sur la machine ne doit pas intercepter les appels locaux
+    no_proxy = os.environ.get('NO_PROXY', '')
+    os.environ['NO_PROXY'] = ','.join(filter(None, [no_proxy, '127.0.0.1', 'localhost']))
+    # Cache disque propre au banc : un cache chaud d'une exécution précédente fausserait la mesure
+    os.environ.setdefault('TORRENT_CACHE_DIR', tempfile.mkdtemp(prefix='frenchio-bench-'))
+    if options.cache_backend == 'redis':
+        if 'redis' not in urls:
+            raise RuntimeError("--cache-backend redis needs the fake servers (not available with --replay)")
+        os.environ['CACHE_BACKEND'] = 'redis'
+        os.environ['REDIS_URL'] = urls['redis']
+    elif options.cache_backend == 'sqlite':
+        os.environ['CACHE_BACKEND'] = 'sqlite'
+        os.environ.setdefault('SHARED_STORE_PATH', os.path.join(tempfile.mkdtemp(prefix='frenchio-bench-'), 'cache.db'))
+    elif options.cache_backend == 'memory':
+        os.environ['CACHE_BACKEND'] = 'memory'
+    os.environ.setdefault('QBIT_READY_TIMEOUT', str(options.qbit_ready_timeout))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def start_workers(options):
+    """Lance `python main.py` avec WORKERS=N ; retourne (processus, URL de base) une fois l'application prête"""
+    port = free_port()
+    env = {**os.environ, 'WORKERS': str(options.workers), 'HOST': '127.0.0.1', 'PORT': str(port)}
+    main_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+    process = subprocess.Popen([sys.executable, main_path], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(f"{base}/manifest.json") as resp:
+                    if resp.status == 200:
+                        break
+            except aiohttp.ClientError:
+                pass
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("application workers did not start")
+            await asyncio.sleep(0.2)
+    # Laisse le temps à tous les workers d'ouvrir leur socket
+    await asyncio.sleep(1)
+    return process, base
+
+
+async def run(options):
+    settings = {
+        "catalog": {"titles": options.titles, "releases": options.releases, "cached_ratio": options.cached_ratio},
+        "default": options.default_profile,
+        "profiles": options.profiles,
+        "qbit_ready_after": options.qbit_ready_after,
+        "seed": options.seed,
+    }
+    process, urls, control = None, {}, None
+    if not options.replay:
+        process, endpoints = fakes.start(settings)
+        urls, control = endpoints['urls'], endpoints['control']
+    prepare_environment(options, urls)
+
+    runner, workers = None, None
+    if options.workers:
+        workers, base = await start_workers(options)
+    else:
+        # main lit sa configuration à l'import : seulement maintenant que l'environnement est prêt
+        main = importlib.import_module('main')
+        logging.getLogger().setLevel(options.log_level)
+
+        runner = web.AppRunner(await main.get_app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+    rng = random.Random(options.seed)
+    resolves = []
+
+    def collect(body):
+        path = pick_resolves(json.loads(body).get('streams', []), options.resolve_ratio, rng)
+        if path:
+            resolves.append(path)
+
+    reports = []
+    try:
+        connector = aiohttp.TCPConnector(limit=options.concurrency)
+        timeout = aiohttp.ClientTimeout(total=options.request_timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            if options.replay:
+                # Resolve enregistrés tels quels : ceux tirés des réponses ne seraient pas dans le corpus
+                phases = [
+                    ("stream", lambda: replay_paths(options, 'stream'), None),
+                    ("resolve", lambda: replay_paths(options, 'resolve'), None),
+                ]
+            else:
+                config = user_config(options, urls)
+                phases = [
+                    ("stream", lambda: (f"/{config}{path}" for path in stream_paths(options)), collect),
+                    # Les URLs de resolve retournées contiennent déjà la config
+                    ("resolve", lambda: list(resolves), None),
+                ]
+            for name, paths, on_response in phases:
+                if control:
+                    async with session.post(f"{control}/reset"):
+                        pass
+                samples, elapsed = await run_phase(session, base, paths(), options.concurrency, on_response)
+                if not samples:
+                    continue
+                # Rejeu : pas de compteurs amont (le corpus n'est pas instrumenté)
+                upstream = await fake_stats(session, control, options.settle) if control else {}
+                reports.append(summarize(name, samples, elapsed, upstream))
+    finally:
+        if runner:
+            await runner.cleanup()
+        if workers:
+            workers.terminate()
+            workers.wait(60)
+        if process:
+            process.terminate()
+            process.join(5)
+    return reports
+
+
+def render(reports):
+    lines = []
+    for r in reports:
+        lat = r["latency_ms"]
+        lines.append(
+            f"{r['phase']:<8} {r['requests']:>6} req  {r['elapsed_s']:>8.2f} s  {r['throughput_rps']:>8.2f} req/s  "
+            f"p50 {lat['p50']:.0f} ms  p95 {lat['p95']:.0f} ms  p99 {lat['p99']:.0f} ms  max {lat['max']:.0f} ms"
+        )
+        lines.append("  status: " + "  ".join(f"{s}={n}" for s, n in sorted(r["status"].items())))
+        lines.append("  upstream calls/request: " + ("  ".join(
+            f"{service} {n:g}" for service, n in r["upstream_per_request"].items()) or "-"))
+        for service, injected in r["upstream_injected"].items():
+            lines.append(f"  injected on {service}: {injected['errors']} errors, {injected['timeouts']} timeouts")
+    return '\n'.join(lines)
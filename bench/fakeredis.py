@@ -0,0 +1,115 @@
+"""
+Serveur Redis factice (protocole RESP2, en mémoire)
+
+Remplace un vrai Redis pour le banc et les essais de cachebackends.RedisBackend :
+seules les commandes qu'il envoie sont prises en charge (PING, AUTH, SELECT,
+GET, MGET, SET avec NX / PX / EX, DEL, EXISTS, DBSIZE, FLUSHDB). Les
+expirations sont vérifiées à la lecture. Les commandes reçues sont comptées
+par nom.
+"""
+import asyncio
+import time
+from collections import Counter
+
+
+class FakeRedis:
+    def __init__(self, password=None):
+        self.password = password
+        self.data = {}
+        self.commands = Counter()
+        self._server = None
+
+    def _get(self, key):
+        item = self.data.get(key)
+        if item is not None and item[1] is not None and item[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return item and item[0]
+
+    def _set(self, args):
+        key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+        expires = None
+        for i, option in enumerate(options):
+            if option in (b'PX', b'EX'):
+                amount = int(args[2 + i + 1])
+                expires = time.monotonic() + (amount / 1000 if option == b'PX' else amount)
+        if b'NX' in options and self._get(key) is not None:
+            return None
+        self.data[key] = (value, expires)
+        return 'OK'
+
+    def execute(self, command, args, session):
+        name = command.upper().decode()
+        self.commands[name] += 1
+        if self.password and not session.get('auth') and name != 'AUTH':
+            return RuntimeError('NOAUTH Authentication required.')
+        if name == 'PING':
+            return 'PONG'
+        if name == 'AUTH':
+            if args[-1].decode() != self.password:
+                return RuntimeError('WRONGPASS invalid username-password pair')
+            session['auth'] = True
+            return 'OK'
+        if name == 'SELECT':
+            return 'OK'
+        if name == 'GET':
+            return self._get(args[0])
+        if name == 'MGET':
+            return [self._get(key) for key in args]
+        if name == 'SET':
+            return self._set(args)
+        if name == 'DEL':
+            return sum(1 for key in args if self._get(key) is not None and self.data.pop(key))
+        if name == 'EXISTS':
+            return sum(1 for key in args if self._get(key) is not None)
+        if name == 'DBSIZE':
+            return len(self.data)
+        if name == 'FLUSHDB':
+            self.data.clear()
+            return 'OK'
+        return RuntimeError(f"ERR unknown command '{name}'")
+
+    @staticmethod
+    def _encode(reply):
+        if reply is None:
+            return b'$-1\r\n'
+        if isinstance(reply, RuntimeError):
+            return f"-{reply}\r\n".encode()
+        if isinstance(reply, str):
+            return f"+{reply}\r\n".encode()
+        if isinstance(reply, int):
+            return b':%d\r\n' % reply
+        if isinstance(reply, bytes):
+            return b'$%d\r\n%s\r\n' % (len(reply), reply)
+        return b'*%d\r\n' % len(reply) + b''.join(FakeRedis._encode(r) for r in reply)
+
+    async def _handle(self, reader, writer):
+        session = {}
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                count = int(line[1:-2])
+                parts = []
+                for _ in range(count):
+                    length = int((await reader.readline())[1:-2])
+                    parts.append((await reader.readexactly(length + 2))[:-2])
+                writer.write(self._encode(self.execute(parts[0], parts[1:], session)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Démarre le serveur, retourne son URL redis://"""
+        self._server = await asyncio.start_server(self._handle, host, port)
+        port = self._server.sockets[0].getsockname()[1]
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}{host}:{port}/0"
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
@@ -0,0 +1,708 @@
+"""
+Serveurs factices des services externes
+
+Chaque service tourne sur son propre port local avec un profil de latence et
+d'erreurs. Ils reproduisent les formats de réponse que lisent les modules de
+services/ (pas toute l'API). L'ensemble tourne dans un processus séparé : le
+client qBittorrent est synchrone et ne doit pas partager la boucle, ni le
+GIL, de l'application mesurée.
+"""
+import asyncio
+import multiprocessing
+import random
+import re
+import time
+import urllib.parse
+from collections import Counter
+
+from aiohttp import web
+
+from bench.catalog import Catalog
+from bench.fakeredis import FakeRedis
+from torrent import parse_torrent, TorrentParseError
+
+SERVICES = ("tmdb", "unit3d", "sharewood", "ygg", "abn", "alldebrid", "torbox", "debridlink", "qbittorrent", "cdn")
+
+_BTIH_RE = re.compile(r'btih:([0-9a-fA-F]{40})')
+
+
+class Profile:
+    """
+    Latence et erreurs injectées par un service. La latence suit une loi
+    décalée exponentielle de moyenne `latency` : `jitter` (0 à 1) est la part
+    aléatoire, qui donne une queue de distribution réaliste.
+    """
+
+    __slots__ = ('latency', 'jitter', 'error_rate', 'timeout_rate', 'hang')
+
+    def __init__(self, latency=0.05, jitter=0.5, error_rate=0.0, timeout_rate=0.0, hang=30.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+
+    @classmethod
+    def parse(cls, spec, default):
+        """`LATENCE_MS[:TAUX_ERREUR[:TAUX_TIMEOUT]]`, les champs absents gardent la valeur par défaut"""
+        parts = spec.split(':')
+        return cls(
+            latency=float(parts[0]) / 1000 if parts[0] else default.latency,
+            jitter=default.jitter,
+            error_rate=float(parts[1]) if len(parts) > 1 and parts[1] else default.error_rate,
+            timeout_rate=float(parts[2]) if len(parts) > 2 and parts[2] else default.timeout_rate,
+            hang=default.hang,
+        )
+
+    def delay(self, rng):
+        fixed = self.latency * (1 - self.jitter)
+        if self.jitter <= 0 or self.latency <= 0:
+            return fixed
+        return fixed + rng.expovariate(1 / (self.latency * self.jitter))
+
+
+class Stats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = Counter()
+        self.errors = Counter()
+        self.timeouts = Counter()
+        self.routes = Counter()
+
+    def as_dict(self):
+        return {
+            name: {
+                "calls": self.calls[name],
+                "errors": self.errors[name],
+                "timeouts": self.timeouts[name],
+                "routes": {route: n for (service, route), n in self.routes.items() if service == name},
+            }
+            for name in SERVICES if self.calls[name]
+        }
+
+
+def profile_middleware(name, profile, stats, rng):
+    @web.middleware
+    async def middleware(request, handler):
+        resource = request.match_info.route.resource
+        stats.calls[name] += 1
+        stats.routes[(name, resource.canonical if resource else request.path)] += 1
+        roll = rng.random()
+        if roll < profile.timeout_rate:
+            stats.timeouts[name] += 1
+            await asyncio.sleep(profile.hang)
+        else:
+            await asyncio.sleep(profile.delay(rng))
+        if profile.timeout_rate <= roll < profile.timeout_rate + profile.error_rate:
+            stats.errors[name] += 1
+            return web.Response(status=503, text="injected error")
+        return await handler(request)
+
+    return middleware
+
+
+def _torrent_response(catalog, release_id):
+    release = catalog.release(release_id)
+    if release is None:
+        raise web.HTTPNotFound()
+    return web.Response(body=release.torrent, content_type='application/x-bittorrent')
+
+
+def tmdb_app(catalog, urls):
+    async def find(request):
+        title = catalog.by_imdb(request.match_info['imdb_id'])
+        results = [{"id": title.tmdb_id}] if title else []
+        return web.json_response({
+            "movie_results": results if title and title.kind == 'movie' else [],
+            "tv_results": results if title and title.kind == 'series' else [],
+        })
+
+    async def details(request):
+        title = catalog.by_tmdb(request.match_info['tmdb_id'])
+        kind = 'movie' if request.match_info['kind'] == 'movie' else 'series'
+        if title is None or title.kind != kind:
+            return web.json_response({"success": False, "status_code": 34}, status=404)
+        return web.json_response(title.details())
+
+    app = web.Application()
+    app.router.add_get('/find/{imdb_id}', find)
+    app.router.add_get('/{kind:movie|tv}/{tmdb_id}', details)
+    return app
+
+
+def unit3d_app(catalog, urls):
+    async def search(request):
+        query = request.query
+        if 'tmdbId' in query:
+            title = catalog.by_tmdb(query['tmdbId'])
+        else:
+            title = catalog.by_imdb(query.get('imdbId', ''))
+        season = int(query['seasonNumber']) if query.get('seasonNumber') else None
+        episode = int(query['episodeNumber']) if query.get('episodeNumber') else None
+        token = query.get('api_token', '')
+        data = [{
+            "type": "torrent",
+            "id": str(r.id),
+            "attributes": {
+                "name": r.name,
+                "size": r.size,
+                "info_hash": r.info_hash,
+                "tmdb_id": title.tmdb_id,
+                "imdb_id": title.imdb_id[2:],
+                "seeders": 10 + r.id % 50,
+                "download_link": f"{urls['unit3d']}/torrent/download/{r.id}?api_token={token}",
+            },
+        } for r in catalog.releases('unit3d', title, season, episode)]
+        return web.json_response({"data": data})
+
+    async def download(request):
+        return _torrent_response(catalog, request.match_info['id'])
+
+    app = web.Application()
+    app.router.add_get('/api/torrents/filter', search)
+    app.router.add_get('/torrent/download/{id}', download)
+    return app
+
+
+def sharewood_app(catalog, urls):
+    async def search(request):
+        passkey = request.match_info['passkey']
+        title, season, episode = catalog.parse_query(request.query.get('name', ''))
+        return web.json_response([{
+            "id": r.id,
+            "name": r.name,
+            "size": r.size,
+            "info_hash": r.info_hash,
+            "download_url": f"{urls['sharewood']}/{passkey}/download/{r.id}",
+        } for r in catalog.releases('sharewood', title, season, episode)])
+
+    async def download(request):
+        return _torrent_response(catalog, request.match_info['id'])
+
+    app = web.Application()
+    app.router.add_get('/{passkey}/search', search)
+    app.router.add_get('/{passkey}/download/{id}', download)
+    return app
+
+
+def ygg_app(catalog, urls):
+    async def search(request):
+        query = request.query
+        if query.get('tmdb_id'):
+            title = catalog.by_tmdb(query['tmdb_id'])
+            season = int(query['season']) if query.get('season') else None
+            episode = int(query['episode']) if query.get('episode') else None
+        else:
+            title, season, episode = catalog.parse_query(query.get('q', ''))
+        releases = catalog.releases('ygg', title, season, episode)
+        if episode is not None:
+            # Une recherche d'épisode remonte aussi les packs de la saison
+            releases = releases + catalog.releases('ygg', title, season)
+        return web.json_response([{"id": r.id, "title": r.name} for r in releases])
+
+    async def details(request):
+        release = catalog.release(request.match_info['id'])
+        if release is None:
+            raise web.HTTPNotFound()
+        return web.json_response({"id": release.id, "title": release.name, "size": release.size, "hash": release.info_hash})
+
+    async def download(request):
+        return _torrent_response(catalog, request.match_info['id'])
+
+    app = web.Application()
+    app.router.add_get('/torrents', search)
+    app.router.add_get('/torrent/{id}', details)
+    app.router.add_get('/torrent/{id}/download', download)
+    return app
+
+
+def abn_app(catalog, urls):
+    def size_text(size):
+        # Format français de la page de recherche : "1,52 Go"
+        return f"{size / 1024 ** 3:.2f} Go".replace('.', ',')
+
+    def page(body):
+        return web.Response(text=f"<html><body>{body}</body></html>", content_type='text/html')
+
+    async def login_form(request):
+        return page('<form method="post"><input name="__RequestVerificationToken" type="hidden" value="bench-csrf" /></form>')
+
+    async def login(request):
+        form = await request.post()
+        if form.get('__RequestVerificationToken') != 'bench-csrf':
+            return page('<p>Session expirée</p>')
+        return page('<form id="logoutForm" action="/Home/Logout"></form>')
+
+    async def search(request):
+        title, season, episode = catalog.parse_query(request.query.get('Search', ''))
+        rows = ''.join(
+            f'<tr><td><a href="/Torrent/Details?ReleaseId={r.id}">{r.name}</a></td>'
+            f'<td>{size_text(r.size)}</td><td>{10 + r.id % 40}</td><td>{r.id % 5}</td></tr>'
+            for r in catalog.releases('abn', title, season, episode)
+        )
+        return page(f'<table>{rows}</table>')
+
+    async def details(request):
+        release = catalog.release(request.query.get('ReleaseId'))
+        if release is None:
+            raise web.HTTPNotFound()
+        return page(f'<h1>{release.name}</h1><p>Hash : <span class="text-italic">{release.info_hash.upper()}</span></p>')
+
+    async def download(request):
+        return _torrent_response(catalog, request.query.get('ReleaseId'))
+
+    app = web.Application()
+    app.router.add_get('/Home/Login', login_form)
+    app.router.add_post('/Home/Login', login)
+    app.router.add_get('/Torrent', search)
+    app.router.add_get('/Torrent/Details', details)
+    app.router.add_get('/Torrent/Download', download)
+    return app
+
+
+def _cdn_link(urls, release, path):
+    return f"{urls['cdn']}/dl/{release.info_hash}/{urllib.parse.quote(path)}"
+
+
+def alldebrid_app(catalog, urls):
+    # apikey -> {hash: id}, pour que status/delete reflètent ce qui a été uploadé
+    accounts = {}
+    ids = iter(range(1, 1 << 62))
+
+    def ok(data):
+        return web.json_response({"status": "success", "data": data})
+
+    async def status(request):
+        account = accounts.get(request.query.get('apikey'), {})
+        return ok({"magnets": [
+            {"id": mid, "hash": h, "statusCode": 4 if catalog.is_cached(h) else 1}
+            for h, mid in account.items()
+        ]})
+
+    async def delete(request):
+        form = await request.post()
+        account = accounts.get(form.get('apikey'), {})
+        for h, mid in list(account.items()):
+            if str(mid) == form.get('id'):
+                del account[h]
+        return ok({"message": "Magnet was successfully deleted"})
+
+    async def upload(request):
+        form = await request.post()
+        account = accounts.setdefault(form.get('apikey'), {})
+        magnets = []
+        for h in form.getall('magnets[]', []):
+            h = h.lower()
+            mid = account.setdefault(h, next(ids))
+            release = catalog.by_hash.get(h)
+            magnets.append({
+                "magnet": h, "hash": h, "id": mid,
+                "name": release.name if release else h,
+                "size": release.size if release else 0,
+                "ready": catalog.is_cached(h),
+            })
+        return ok({"magnets": magnets})
+
+    async def files(request):
+        form = await request.post()
+        account = accounts.get(form.get('apikey'), {})
+        by_id = {str(mid): h for h, mid in account.items()}
+        magnets = []
+        for mid in form.getall('id[]', []):
+            h = by_id.get(mid)
+            release = catalog.by_hash.get(h) if h else None
+            if release is None or not catalog.is_cached(h):
+                magnets.append({"id": mid, "error": {"code": "MAGNET_NOT_READY", "message": "Magnet is not ready"}})
+                continue
+            entries = [{"n": path.split('/')[-1], "s": size, "l": _cdn_link(urls, release, path)}
+                       for path, size in release.file_paths()]
+            if len(release.files) > 1:
+                entries = [{"n": release.name, "e": entries}]
+            magnets.append({"id": mid, "files": entries})
+        return ok({"magnets": magnets})
+
+    async def unlock(request):
+        return ok({"link": f"{request.query.get('link', '')}?unlocked=1", "filename": "", "filesize": 0})
+
+    app = web.Application()
+    app.router.add_get('/magnet/status', status)
+    app.router.add_post('/magnet/delete', delete)
+    app.router.add_post('/magnet/upload', upload)
+    app.router.add_post('/magnet/files', files)
+    app.router.add_get('/link/unlock', unlock)
+    return app
+
+
+def torbox_app(catalog, urls):
+    torrent_ids = {}
+
+    def torbox_files(release):
+        return [{"id": i, "name": path, "short_name": path.split('/')[-1], "size": size}
+                for i, (path, size) in enumerate(release.file_paths())]
+
+    async def checkcached(request):
+        h = request.query.get('hash', '').lower()
+        release = catalog.by_hash.get(h)
+        if release is None or not catalog.is_cached(h):
+            return web.json_response({"success": True, "detail": "No cached torrents", "data": {}})
+        return web.json_response({"success": True, "detail": "Found cached torrents", "data": {
+            h: {"name": release.name, "size": release.size, "hash": h, "files": torbox_files(release)}
+        }})
+
+    async def createtorrent(request):
+        form = await request.post()
+        match = _BTIH_RE.search(form.get('magnet', ''))
+        if not match:
+            return web.json_response({"success": False, "error": "INVALID_MAGNET", "detail": "Invalid magnet"}, status=400)
+        h = match.group(1).lower()
+        torrent_id = torrent_ids.setdefault(h, len(torrent_ids) + 1)
+        cached = catalog.is_cached(h)
+        return web.json_response({
+            "success": True,
+            "detail": "Found Cached Torrent. Using Cached Torrent." if cached else "Successfully created torrent.",
+            "data": {"torrent_id": torrent_id, "hash": h, "auth_id": "bench"},
+        })
+
+    async def mylist(request):
+        by_id = {str(tid): h for h, tid in torrent_ids.items()}
+        h = by_id.get(request.query.get('id'))
+        release = catalog.by_hash.get(h) if h else None
+        if release is None:
+            return web.json_response({"success": False, "error": "NOT_FOUND", "detail": "Torrent not found"}, status=404)
+        files = torbox_files(release) if catalog.is_cached(h) else []
+        return web.json_response({"success": True, "data": {
+            "id": torrent_ids[h], "hash": h, "name": release.name, "size": release.size,
+            "download_finished": bool(files), "files": files,
+        }})
+
+    async def requestdl(request):
+        by_id = {str(tid): h for h, tid in torrent_ids.items()}
+        h = by_id.get(request.query.get('torrent_id'))
+        release = catalog.by_hash.get(h) if h else None
+        paths = release.file_paths() if release else []
+        try:
+            path = paths[int(request.query.get('file_id', ''))][0]
+        except (ValueError, IndexError):
+            return web.json_response({"success": False, "error": "NOT_FOUND", "detail": "File not found"}, status=404)
+        return web.json_response({"success": True, "data": _cdn_link(urls, release, path)})
+
+    app = web.Application()
+    app.router.add_get('/torrents/checkcached', checkcached)
+    app.router.add_post('/torrents/createtorrent', createtorrent)
+    app.router.add_get('/torrents/mylist', mylist)
+    app.router.add_get('/torrents/requestdl', requestdl)
+    return app
+
+
+def debridlink_app(catalog, urls):
+    seedbox_ids = {}
+
+    async def add(request):
+        payload = await request.json()
+        h = str(payload.get('url', '')).lower()
+        release = catalog.by_hash.get(h)
+        if release is None:
+            return web.json_response({"success": False, "error": "torrentNotFound"})
+        torrent_id = seedbox_ids.setdefault(h, f"bench-{len(seedbox_ids) + 1}")
+        cached = catalog.is_cached(h)
+        return web.json_response({"success": True, "value": {
+            "id": torrent_id, "hashString": h, "name": release.name, "totalSize": release.size,
+            "downloadPercent": 100 if cached else 0, "error": 0,
+            "files": [{"id": f"{torrent_id}-{i}", "name": path.split('/')[-1], "size": size,
+                       "downloadUrl": _cdn_link(urls, release, path), "downloadPercent": 100 if cached else 0}
+                      for i, (path, size) in enumerate(release.file_paths())],
+        }})
+
+    async def remove(request):
+        torrent_id = request.match_info['id']
+        for h, tid in list(seedbox_ids.items()):
+            if tid == torrent_id:
+                del seedbox_ids[h]
+        return web.json_response({"success": True, "value": [torrent_id]})
+
+    app = web.Application()
+    app.router.add_post('/seedbox/add', add)
+    app.router.add_delete('/seedbox/{id}/remove', remove)
+    return app
+
+
+def cdn_app(catalog, urls):
+    async def link(request):
+        # Les liens débridés ne sont que vérifiés (HEAD du cache de résolution), jamais lus
+        return web.Response(headers={"Content-Type": "video/x-matroska", "Accept-Ranges": "bytes"})
+
+    app = web.Application()
+    app.router.add_route('*', '/dl/{path:.+}', link)
+    return app
+
+
+class FakeQBittorrent:
+    """
+    WebUI qBittorrent en mémoire. Un torrent démarré se "télécharge" en
+    `ready_after` secondes : pièces de début/fin d'abord (first/last piece
+    priority), puis dans l'ordre.
+    """
+
+    def __init__(self, ready_after=1.0, free_space=500 * 1024 ** 3):
+        self.ready_after = ready_after
+        self.free_space = free_space
+        self.torrents = {}
+        self.rid = 0
+
+    def _progress(self, t):
+        if t['started'] is None:
+            return t['done']
+        if self.ready_after <= 0:
+            return 1.0
+        return min(t['done'] + (time.monotonic() - t['started']) / self.ready_after, 1.0)
+
+    def _piece_states(self, t):
+        n = t['meta'].num_pieces
+        have = int(self._progress(t) * n)
+        order = [0, n - 1] + list(range(1, n - 1)) if t['flp'] and n > 1 else list(range(n))
+        states = [0] * n
+        for i in order[:have]:
+            states[i] = 2
+        return states
+
+    def _view(self, t):
+        progress = self._progress(t)
+        if t['started'] is None:
+            state = 'stoppedUP' if progress >= 1 else 'stoppedDL'
+        else:
+            state = 'uploading' if progress >= 1 else 'downloading'
+        size = t['meta'].total_size
+        return {
+            "hash": t['hash'], "name": t['meta'].name, "size": size, "total_size": size,
+            "progress": progress, "state": state, "has_metadata": True,
+            "seq_dl": t['seq'], "f_l_piece_prio": t['flp'],
+            "added_on": int(t['added']), "completion_on": 0, "ratio": 0.0, "seeding_time": 0,
+            "amount_left": int(size * (1 - progress)), "save_path": "/downloads",
+        }
+
+    @staticmethod
+    async def _params(request):
+        params = dict(request.query)
+        if request.method == 'POST' and request.content_type != 'multipart/form-data':
+            params.update(await request.post())
+        return params
+
+    def _hashes(self, params):
+        value = params.get('hashes', '')
+        return list(self.torrents) if value == 'all' else [h.lower() for h in value.split('|') if h]
+
+    def _get(self, params, key='hash'):
+        t = self.torrents.get(params.get(key, '').lower())
+        if t is None:
+            raise web.HTTPNotFound(text="Torrent hash was not found")
+        return t
+
+    async def login(self, request):
+        response = web.Response(text="Ok.")
+        response.set_cookie('SID', 'bench')
+        return response
+
+    async def version(self, request):
+        return web.Response(text="v5.0.0")
+
+    async def api_version(self, request):
+        return web.Response(text="2.11.2")
+
+    async def add(self, request):
+        reader = await request.multipart()
+        fields = {}
+        torrents = []
+        async for part in reader:
+            if part.filename:
+                # Les .torrent sont les parties fichier, quel que soit leur nom
+                torrents.append(bytes(await part.read()))
+            else:
+                fields[part.name] = await part.text()
+        stopped = fields.get('stopped', fields.get('paused', 'false')).lower() == 'true'
+        for data in torrents:
+            try:
+                meta = parse_torrent(data)
+            except TorrentParseError:
+                return web.Response(text="Fails.", status=415)
+            if meta.info_hash in self.torrents:
+                continue
+            self.torrents[meta.info_hash] = {
+                "hash": meta.info_hash, "meta": meta, "added": time.time(),
+                "started": None if stopped else time.monotonic(), "done": 0.0,
+                "seq": fields.get('sequentialDownload', 'false').lower() == 'true',
+                "flp": fields.get('firstLastPiecePrio', 'false').lower() == 'true',
+                "priorities": [1] * len(meta.files),
+            }
+        return web.Response(text="Ok.")
+
+    async def info(self, request):
+        params = await self._params(request)
+        hashes = set(self._hashes(params)) if params.get('hashes') else None
+        return web.json_response([self._view(t) for h, t in self.torrents.items() if hashes is None or h in hashes])
+
+    async def files(self, request):
+        t = self._get(await self._params(request))
+        progress = self._progress(t)
+        return web.json_response([{
+            "index": f.index, "name": f.name, "size": f.size, "progress": progress,
+            "priority": t['priorities'][f.index], "is_seed": progress >= 1,
+            "piece_range": [f.first_piece, f.last_piece], "availability": 1,
+        } for f in t['meta'].files])
+
+    async def properties(self, request):
+        t = self._get(await self._params(request))
+        meta = t['meta']
+        return web.json_response({
+            "piece_size": meta.piece_length, "pieces_num": meta.num_pieces,
+            "total_size": meta.total_size, "save_path": "/downloads", "addition_date": int(t['added']),
+        })
+
+    async def piece_states(self, request):
+        return web.json_response(self._piece_states(self._get(await self._params(request))))
+
+    async def file_priority(self, request):
+        params = await self._params(request)
+        t = self._get(params)
+        for index in params.get('id', '').split('|'):
+            if index.isdigit() and int(index) < len(t['priorities']):
+                t['priorities'][int(index)] = int(params.get('priority', 1))
+        return web.Response()
+
+    async def start(self, request):
+        for h in self._hashes(await self._params(request)):
+            t = self.torrents.get(h)
+            if t is not None and t['started'] is None:
+                t['started'] = time.monotonic()
+        return web.Response()
+
+    async def stop(self, request):
+        for h in self._hashes(await self._params(request)):
+            t = self.torrents.get(h)
+            if t is not None and t['started'] is not None:
+                t['done'], t['started'] = self._progress(t), None
+        return web.Response()
+
+    async def delete(self, request):
+        for h in self._hashes(await self._params(request)):
+            self.torrents.pop(h, None)
+        return web.Response()
+
+    async def toggle_sequential(self, request):
+        for h in self._hashes(await self._params(request)):
+            if h in self.torrents:
+                self.torrents[h]['seq'] = not self.torrents[h]['seq']
+        return web.Response()
+
+    async def toggle_first_last(self, request):
+        for h in self._hashes(await self._params(request)):
+            if h in self.torrents:
+                self.torrents[h]['flp'] = not self.torrents[h]['flp']
+        return web.Response()
+
+    async def maindata(self, request):
+        # Toujours une vue complète : suffisant pour MainDataWatcher, qui gère full_update
+        self.rid += 1
+        return web.json_response({
+            "rid": self.rid, "full_update": True,
+            "torrents": {h: self._view(t) for h, t in self.torrents.items()},
+            "server_state": {"free_space_on_disk": self.free_space},
+        })
+
+    def app(self):
+        app = web.Application()
+        routes = {
+            'auth/login': self.login,
+            'app/version': self.version,
+            'app/webapiVersion': self.api_version,
+            'torrents/add': self.add,
+            'torrents/info': self.info,
+            'torrents/files': self.files,
+            'torrents/properties': self.properties,
+            'torrents/pieceStates': self.piece_states,
+            'torrents/filePrio': self.file_priority,
+            'torrents/start': self.start,
+            'torrents/resume': self.start,
+            'torrents/stop': self.stop,
+            'torrents/pause': self.stop,
+            'torrents/delete': self.delete,
+            'torrents/toggleSequentialDownload': self.toggle_sequential,
+            'torrents/toggleFirstLastPiecePrio': self.toggle_first_last,
+            'sync/maindata': self.maindata,
+        }
+        for path, handler in routes.items():
+            app.router.add_route('*', f'/api/v2/{path}', handler)
+        return app
+
+
+FAKES = {
+    "tmdb": tmdb_app,
+    "unit3d": unit3d_app,
+    "sharewood": sharewood_app,
+    "ygg": ygg_app,
+    "abn": abn_app,
+    "alldebrid": alldebrid_app,
+    "torbox": torbox_app,
+    "debridlink": debridlink_app,
+    "cdn": cdn_app,
+}
+
+
+async def _serve(settings, conn):
+    catalog = Catalog(**settings['catalog'])
+    stats = Stats()
+    default = settings['default']
+    profiles = settings['profiles']
+    urls = {}
+    apps = {name: factory(catalog, urls) for name, factory in FAKES.items()}
+    apps['qbittorrent'] = FakeQBittorrent(settings['qbit_ready_after']).app()
+
+    runners = []
+    for name, app in apps.items():
+        rng = random.Random(f"{settings['seed']}:{name}")
+        app.middlewares.append(profile_middleware(name, profiles.get(name, default), stats, rng))
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        urls[name] = f"http://127.0.0.1:{port}"
+        runners.append(runner)
+
+    async def get_stats(request):
+        return web.json_response(stats.as_dict())
+
+    async def reset(request):
+        stats.reset()
+        return web.json_response({})
+
+    # Cache partagé Redis (--cache-backend redis)
+    urls['redis'] = await FakeRedis().start()
+
+    control = web.Application()
+    control.router.add_get('/stats', get_stats)
+    control.router.add_post('/reset', reset)
+    runner = web.AppRunner(control, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+
+    conn.send({"urls": urls, "control": f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"})
+    await asyncio.Event().wait()
+
+
+def serve(settings, conn):
+    asyncio.run(_serve(settings, conn))
+
+
+def start(settings):
+    """Démarre les serveurs factices dans un processus fils, retourne (processus, {urls, control})"""
+    context = multiprocessing.get_context('spawn')
+    parent, child = context.Pipe()
+    process = context.Process(target=serve, args=(settings, child), name='frenchio-bench-fakes', daemon=True)
+    process.start()
+    if not parent.poll(30):
+        process.terminate()
+        raise RuntimeError("fake upstream servers did not start")
+    return process, parent.recv()
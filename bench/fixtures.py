@@ -0,0 +1,154 @@
+"""
+Jeux de données des micro-benchmarks
+
+Noms de releases françaises tels qu'on les trouve sur les trackers (séparateurs,
+langues, packs, nommages SxxEyy / 1x02 / Saison N...), page de recherche ABN
+complète (en-tête, menus, tableau de résultats) et arborescences AllDebrid
+profondes. Tout est dérivé d'une graine : deux exécutions mesurent les mêmes
+données.
+"""
+import random
+
+TITLES = (
+    "Le Comte de Monte-Cristo", "Les Misérables", "Astérix et Obélix L'Empire du Milieu", "La Haine",
+    "Intouchables", "Le Fabuleux Destin d'Amélie Poulain", "Bienvenue chez les Ch'tis", "Les Trois Mousquetaires",
+    "Lupin", "Le Bureau des Légendes", "Dix pour cent", "Engrenages", "Kaamelott", "Baron Noir", "Les Revenants",
+    "Plus belle la vie", "Validé", "Marianne", "Braqueurs", "La Casa de Papel", "The Last of Us", "Dune Deuxième Partie",
+    "Oppenheimer", "Spider-Man Across the Spider-Verse", "Le Règne animal", "Anatomie d'une chute", "Les Choristes",
+)
+LANGUAGES = ("MULTi", "MULTI.VFF", "TRUEFRENCH", "FRENCH", "VFF", "VFQ", "VF2", "VOSTFR", "SUBFRENCH", "MULTI.VFi")
+QUALITIES = ("2160p", "4K", "1080p", "1080p", "720p", "480p", "HDLight.1080p", "DVDRip")
+SOURCES = ("WEB-DL", "WEBRip", "BluRay", "BluRay.REMUX", "HDTV", "WEB", "NF.WEB-DL", "AMZN.WEBRip")
+CODECS = ("x264", "x265", "HEVC", "H264", "AV1", "10bit.x265")
+EXTRAS = ("", "", "", "HDR", "HDR10", "DV", "HDR.DV", "DOLBY.VISION")
+AUDIO = ("DDP5.1", "AC3.5.1", "AAC", "DTS-HD.MA", "TrueHD.Atmos", "EAC3")
+GROUPS = ("FRATERNiTY", "QTZ", "Slay3R", "NoTag", "EXTREME", "BONBON", "TyrellCorp", "SUPPLY", "ZEST", "Winks")
+
+
+def release_name(rng):
+    """Nom de release réaliste : film, épisode, pack saison ou intégrale"""
+    title = rng.choice(TITLES)
+    sep = rng.choice(('.', '.', '.', ' '))
+    kind = rng.random()
+    if kind < 0.4:
+        tag = str(rng.randint(1960, 2025))
+    elif kind < 0.75:
+        season, episode = rng.randint(1, 12), rng.randint(1, 24)
+        tag = rng.choice((f"S{season:02d}E{episode:02d}", f"S{season}E{episode}", f"{season}x{episode:02d}",
+                          f"S{season:02d}E{episode:02d}E{episode + 1:02d}", f"S{season:02d}.E{episode:02d}"))
+    elif kind < 0.92:
+        season = rng.randint(1, 12)
+        tag = rng.choice((f"S{season:02d}", f"Saison {season}", f"SAISON.{season}", f"Season {season}",
+                          f"S01-S{season:02d}"))
+    else:
+        tag = rng.choice(("INTEGRALE", "COMPLETE", "Integrale.Saisons.1.a.5"))
+    parts = [title, tag, rng.choice(LANGUAGES), rng.choice(QUALITIES), rng.choice(SOURCES),
+             rng.choice(EXTRAS), rng.choice(AUDIO), rng.choice(CODECS)]
+    name = sep.join(p.replace(' ', sep) for p in parts if p)
+    return f"{name}-{rng.choice(GROUPS)}"
+
+
+def release_names(count, seed=1):
+    rng = random.Random(seed)
+    return [release_name(rng) for _ in range(count)]
+
+
+def sizes(count, seed=1):
+    rng = random.Random(seed)
+    return [rng.choice((rng.randint(0, 1023), rng.randint(1, 1023) * 1024 ** 2, rng.randint(1, 80) * 1024 ** 3 // 7,
+                        str(rng.randint(1, 10 ** 11)), None)) for _ in range(count)]
+
+
+def torrents(count, seed=1):
+    """Résultats fusionnés des trackers (avant filtrage et déduplication), ~20 % de doublons"""
+    rng = random.Random(seed)
+    hashes = [f"{rng.getrandbits(160):040x}" for _ in range(int(count * 0.8) or 1)]
+    results = []
+    for _ in range(count):
+        source = rng.choice(('unit3d', 'sharewood', 'ygg', 'abn'))
+        ih = rng.choice(hashes)
+        results.append({
+            "name": release_name(rng),
+            "size": rng.randint(200, 80000) * 1024 ** 2,
+            "info_hash": ih.upper() if rng.random() < 0.3 else ih,
+            "source": source,
+            "tmdb_id": rng.choice((0, 1396, 1396, 1399)) if source == 'unit3d' else None,
+            "imdb_id": rng.choice(("0", "tt0903747", "0903747", "tt0944947")) if source == 'unit3d' else None,
+        })
+    return results
+
+
+def abn_size_text(size):
+    unit, divisor = next(((u, d) for u, d in (("To", 1024 ** 4), ("Go", 1024 ** 3), ("Mo", 1024 ** 2), ("Ko", 1024))
+                          if size >= d), ("Ko", 1024))
+    return f"{size / divisor:.2f} {unit}".replace('.', ',')
+
+
+def abn_search_page(rows, seed=1):
+    """Page de recherche ABN : gabarit du site (menus, filtres, scripts) et `rows` lignes de résultats"""
+    rng = random.Random(seed)
+    menu = ''.join(f'<li class="nav-item"><a class="nav-link" href="/Section/{i}">Rubrique {i}</a></li>'
+                   for i in range(40))
+    filters = ''.join(f'<label><input type="checkbox" name="SelectedCats" value="{i}" /> Catégorie {i}</label>'
+                      for i in range(60))
+    lines = []
+    for k in range(rows):
+        release_id = 100000 + rng.randint(0, 900000)
+        name = release_name(rng)
+        size = rng.randint(100, 90000) * 1024 ** 2
+        lines.append(
+            f'<tr class="torrent-row">\n'
+            f'  <td class="cat"><img src="/img/cat/{rng.randint(1, 9)}.png" alt="" /></td>\n'
+            f'  <td class="name"><a href="/Torrent/Details?ReleaseId={release_id}" title="{name}">{name}</a>'
+            f' <span class="badge">{rng.choice(("Freeleech", "Nouveau", ""))}</span></td>\n'
+            f'  <td><a href="/Torrent/Download?ReleaseId={release_id}"><i class="fa fa-download"></i></a></td>\n'
+            f'  <td class="date">{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024</td>\n'
+            f'  <td class="size">{abn_size_text(size)}</td>\n'
+            f'  <td>{rng.randint(0, 400)}</td>\n'
+            f'  <td>{rng.randint(0, 50)}</td>\n'
+            f'</tr>'
+        )
+    script = "<script>" + "var x=1;" * 2000 + "</script>"
+    return (
+        f'<!DOCTYPE html><html lang="fr"><head><title>ABNormal</title>{script}</head><body>'
+        f'<nav><ul class="navbar-nav">{menu}</ul></nav>'
+        f'<form id="search" action="/Torrent">{filters}</form>'
+        f'<table class="table table-striped"><thead><tr><th>Cat</th><th>Nom</th><th></th><th>Date</th>'
+        f'<th>Taille</th><th>S</th><th>L</th></tr></thead><tbody>\n' + '\n'.join(lines) +
+        '</tbody></table><footer>ABNormal</footer></body></html>'
+    )
+
+
+def abn_size_strings(count, seed=1):
+    rng = random.Random(seed)
+    return [abn_size_text(rng.randint(1, 90000) * 1024 ** rng.choice((1, 2))) for _ in range(count)]
+
+
+def alldebrid_tree(files, depth, seed=1):
+    """Arborescence /magnet/files d'AllDebrid : dossiers imbriqués (`e`) et fichiers (`n`, `s`, `l`)"""
+    rng = random.Random(seed)
+    counter = iter(range(files))
+
+    def folder(level):
+        entries = []
+        while True:
+            if level < depth and rng.random() < 0.35:
+                sub = folder(level + 1)
+                if sub:
+                    entries.append({"n": f"Saison {level + 1}.{len(entries)}", "e": sub})
+            index = next(counter, None)
+            if index is None:
+                return entries
+            name = release_name(rng)
+            ext = rng.choice(("mkv", "mkv", "mp4", "nfo", "srt", "jpg"))
+            entries.append({"n": f"{name}.{ext}", "s": rng.randint(1, 9000) * 1024 ** 2,
+                            "l": f"https://alldebrid.com/f/{index:08x}"})
+            if rng.random() < 0.15:
+                return entries
+
+    tree = []
+    while True:
+        entries = folder(0)
+        if not entries:
+            return tree
+        tree.append({"n": release_name(rng), "e": entries})
@@ -0,0 +1,257 @@
+"""
+Micro-benchmarks des parties CPU d'une requête
+
+    python -m bench.micro --save          # mesure et enregistre la référence locale
+    python -m bench.micro                 # mesure et compare à la référence locale
+    python -m bench.micro --only abn      # cas dont le nom contient "abn"
+
+Chaque cas traite un jeu de données complet (bench/fixtures.py) : milliers de
+noms de releases, page de recherche ABN de plusieurs centaines de lignes,
+arborescences AllDebrid profondes. Seules les fonctions pures sont importées
+(pas `main`, qui crée ses dossiers et configure le logging).
+
+Temps : médiane de toutes les séries calibrées (GC désactivé, comme timeit),
+mesurées en `--rounds` tours de `--repeat` séries ; la dispersion est l'écart
+relatif entre les médianes extrêmes des tours. Mémoire : pic alloué
+(tracemalloc) et blocs conservés par un appel.
+
+La référence est générée sur la machine qui compare (bench/micro_baseline.local.json,
+ignoré par git) : des temps absolus n'ont pas de sens d'une machine à l'autre.
+Sans référence, sortie en erreur (code 2). Sortie en erreur (code 1) si la médiane d'un cas dépasse celle de la référence
+de plus que le bruit observé (`--noise` fois la plus grande des deux
+dispersions, au moins `--tolerance`), ou si son pic mémoire dépasse `--memory-tolerance`.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+from bench import fixtures
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'micro_baseline.local.json')
+
+
+def build_cases():
+    """[(nom, fonction sans argument)] ; les services sont importés ici pour que --help reste instantané"""
+    from utils import parse_torrent_name, check_season_episode, format_size
+    from services.abn import ABNService
+    from services.alldebrid import AllDebridService
+    from services.torbox import TorBoxService
+    from utils import filter_torrents
+
+    names = fixtures.release_names(5000)
+    sizes = fixtures.sizes(5000)
+    abn = ABNService("bench", "bench")
+    abn_page = fixtures.abn_search_page(500)
+    abn_sizes = fixtures.abn_size_strings(5000)
+    alldebrid = AllDebridService("bench")
+    tree = fixtures.alldebrid_tree(3000, depth=6)
+    links = alldebrid._extract_files_recursive(tree)
+    torbox = TorBoxService("bench")
+    filenames = [name.rsplit('/', 1)[-1] for name in fixtures.release_names(2000, seed=2)]
+    torrents = fixtures.torrents(3000)
+    config = {"max_size": 40}
+
+    return [
+        ("parse_torrent_name x5000", lambda: [parse_torrent_name(n) for n in names]),
+        ("check_season_episode x5000", lambda: [check_season_episode(n, 2, 5) for n in names]),
+        ("format_size x5000", lambda: [format_size(s) for s in sizes]),
+        ("abn._parse_results 500 rows", lambda: abn._parse_results(abn_page)),
+        ("abn._parse_size x5000", lambda: [abn._parse_size(s) for s in abn_sizes]),
+        ("alldebrid._extract_files_recursive 3000 files", lambda: alldebrid._extract_files_recursive(tree)),
+        # Épisode absent : parcours complet puis repli sur le plus gros fichier
+        ("alldebrid._select_link episode 3000 files", lambda: alldebrid._select_link(links, 7, 31, 'series')),
+        ("alldebrid._select_link movie 3000 files", lambda: alldebrid._select_link(links, None, None, 'movie')),
+        ("torbox._matches_episode x2000", lambda: [torbox._matches_episode(f, 3, 4) for f in filenames]),
+        ("filter_torrents series 3000", lambda: filter_torrents(
+            torrents, config, 'series', 'tt0903747', 1396, 2, 5)),
+        ("filter_torrents movie 3000", lambda: filter_torrents(
+            torrents, config, 'movie', 'tt0903747', 1396, None, None)),
+    ]
+
+
+def measure_time(func, repeat, target):
+    """Durées par appel (s) de `repeat` séries d'environ `target` secondes"""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= target / 5 or loops >= 1 << 20:
+            break
+        loops *= 2
+    loops = max(1, int(loops * target / max(elapsed, 1e-9)))
+    samples = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(loops):
+                func()
+            samples.append((time.perf_counter() - start) / loops)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return samples
+
+
+def summarize(samples, rounds):
+    """Médiane des séries et dispersion entre tours (écart relatif entre médianes extrêmes des tours)"""
+    median = statistics.median(samples)
+    spread = (max(rounds) - min(rounds)) / median if median else 0.0
+    return median, spread
+
+
+def measure_memory(func):
+    """Pic alloué pendant un appel et blocs encore alloués après (résultat libéré)"""
+    func()
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    try:
+        result = func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    del result
+    gc.collect()
+    return peak, sys.getallocatedblocks() - blocks
+
+
+def machine():
+    return f"{platform.system()} {platform.machine()} {platform.python_implementation()} " \
+           f"{platform.python_version()} cpu={os.cpu_count()} {platform.processor()}".strip()
+
+
+def run(options, cases, previous=None):
+    """
+    Mesure les cas en `--rounds` tours entrelacés : une perturbation passagère
+    de la machine touche un tour de tous les cas plutôt que tous les tours d'un
+    seul, et se voit dans la dispersion. Les séries et tours de `previous`
+    (nouvelle mesure) sont conservés.
+    """
+    samples = {name: list(previous[name]["samples_us"]) if previous else [] for name, _ in cases}
+    rounds = {name: list(previous[name]["rounds_us"]) if previous else [] for name, _ in cases}
+    for _ in range(options.rounds):
+        for name, func in cases:
+            series = [s * 1e6 for s in measure_time(func, options.repeat, options.target)]
+            samples[name] += series
+            rounds[name].append(statistics.median(series))
+
+    results = {}
+    for name, func in cases:
+        median, spread = summarize(samples[name], rounds[name])
+        peak, retained = measure_memory(func)
+        results[name] = {
+            "median_us": round(median, 1),
+            "spread": round(spread, 4),
+            "rounds_us": [round(r, 1) for r in rounds[name]],
+            "samples_us": [round(s, 1) for s in samples[name]],
+            "peak_kib": round(peak / 1024, 1),
+            "retained_blocks": retained,
+        }
+        print(f"{name:<48} {median / 1e3:>10.3f} ms  (±{spread * 100:.1f} % sur {len(rounds[name])} tours)  "
+              f"pic {peak / 1024:>9.1f} Kio  blocs {retained:+d}", flush=True)
+    return results
+
+
+def compare(results, baseline, options):
+    """Régressions par rapport à la référence : {cas: [message]}"""
+    same_machine = baseline.get("machine") == machine()
+    if not same_machine:
+        print(f"\nRéférence mesurée sur une autre machine ({baseline.get('machine')}) : temps non comparés, "
+              f"relancer avec --save")
+    regressions = {}
+    for name, current in results.items():
+        previous = baseline.get("cases", {}).get(name)
+        if previous is None:
+            continue
+        checks = [("peak_kib", options.memory_tolerance)]
+        if same_machine and "median_us" in previous:
+            # Seuil à la mesure du bruit observé des deux côtés, jamais sous --tolerance
+            noise = options.noise * max(previous.get("spread", 0), current["spread"])
+            checks.append(("median_us", max(options.tolerance, noise)))
+        for metric, tolerance in checks:
+            before, after = previous[metric], current[metric]
+            # Plancher : quelques Kio ou microsecondes d'écart ne sont pas significatifs
+            if after > before * (1 + tolerance) and after - before > 4:
+                regressions.setdefault(name, []).append(
+                    f"{name}: {metric} {before} -> {after} (+{(after / before - 1) * 100:.0f} %, "
+                    f"seuil {tolerance * 100:.0f} %)")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m bench.micro', description="Micro-benchmarks de Frenchio")
+    parser.add_argument('--baseline', default=BASELINE, help="fichier de référence (défaut bench/micro_baseline.local.json)")
+    parser.add_argument('--save', action='store_true', help="enregistre la mesure comme référence locale")
+    parser.add_argument('--only', help="ne mesure que les cas dont le nom contient cette chaîne")
+    parser.add_argument('--rounds', type=int, default=3, help="tours de mesure entrelacés (défaut 3)")
+    parser.add_argument('--repeat', type=int, default=5, help="séries par cas et par tour (défaut 5)")
+    parser.add_argument('--target', type=float, default=0.2, help="durée d'une série (s, défaut 0.2)")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="régression de médiane tolérée au minimum (défaut 0.10)")
+    parser.add_argument('--noise', type=float, default=2.0,
+                        help="seuil de régression en multiples de la dispersion entre tours (défaut 2)")
+    parser.add_argument('--retries', type=int, default=2,
+                        help="nouvelles mesures d'un cas en régression avant de conclure (défaut 2)")
+    parser.add_argument('--memory-tolerance', type=float, default=0.10,
+                        help="régression de pic mémoire tolérée (défaut 0.10)")
+    parser.add_argument('--log-level', default='ERROR',
+                        help="niveau de log pendant la mesure (les f-strings des logs sont toujours évaluées)")
+    return parser.parse_args()
+
+
+def main():
+    options = parse_args()
+    cases = [(name, func) for name, func in build_cases() if not options.only or options.only in name]
+    logging.basicConfig(level=options.log_level)
+    results = run(options, cases)
+
+    if options.save:
+        baseline = {"machine": machine(), "cases": results}
+        if options.only and os.path.exists(options.baseline):
+            with open(options.baseline, encoding='utf-8') as f:
+                previous = json.load(f)
+            baseline["cases"] = {**previous.get("cases", {}), **results}
+        with open(options.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f"\nRéférence enregistrée : {options.baseline}")
+        return 0
+
+    if not os.path.exists(options.baseline):
+        # Sans référence rien n'est vérifié : c'est un échec, pas un succès silencieux (CI)
+        print(f"\nPas de référence ({options.baseline}) : lancer d'abord avec --save sur le code de départ")
+        return 2
+    with open(options.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, options)
+    # Une série perturbée par la machine ne doit pas faire échouer : les cas en régression
+    # sont remesurés, leurs nouvelles séries s'ajoutent aux premières avant de recalculer la médiane
+    for attempt in range(options.retries):
+        if not regressions:
+            break
+        print(f"\nNouvelle mesure de {len(regressions)} cas en régression ({attempt + 1}/{options.retries})")
+        results.update(run(options, [c for c in cases if c[0] in regressions], previous=results))
+        regressions = compare(results, baseline, options)
+    if regressions:
+        print("\nRégressions :")
+        for lines in regressions.values():
+            for line in lines:
+                print(f"  {line}")
+        return 1
+    print("\nAucune régression")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+Disjoncteurs par service externe
+
+Un disjoncteur par service (chaque tracker UNIT3D par hôte, Sharewood, YGG,
+ABN, chaque débrideur) observe les appels sur une fenêtre glissante. Au-delà
+de `failure_ratio` d'échecs (erreur réseau, timeout, HTTP 5xx, ou réponse plus
+lente que `slow_call`) sur au moins `min_calls` appels, il s'ouvre : les
+appels suivants échouent immédiatement (CircuitOpenError) au lieu d'attendre
+leur timeout. Après `open_for` secondes, il passe en demi-ouvert et laisse
+passer un seul appel de sonde : succès, il se referme ; échec, il se rouvre
+pour une durée doublée (jusqu'à `max_open_for`).
+
+Les codes 4xx ne comptent pas : une clé API invalide concerne un utilisateur,
+pas le service.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+import aiohttp
+
+import metrics
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKER_REJECTED = metrics.REGISTRY.counter(
+    'frenchio_breaker_rejected_total', "Appels refusés par un disjoncteur ouvert", ('upstream',))
+BREAKER_TRANSITIONS = metrics.REGISTRY.counter(
+    'frenchio_breaker_transitions_total', "Changements d'état des disjoncteurs", ('upstream', 'state'))
+
+
+class CircuitOpenError(aiohttp.ClientConnectionError):
+    """Appel refusé sans réseau : le service est considéré comme en panne"""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"circuit open for {name} (retry in {retry_in:.0f}s)")
+        self.name = name
+
+
+class CircuitBreaker:
+    def __init__(self, name, window=60, min_calls=5, failure_ratio=0.5, slow_call=10.0,
+                 open_for=30, max_open_for=300, max_samples=200):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_call = slow_call
+        self.open_for = open_for
+        self.max_open_for = max_open_for
+        self.max_samples = max_samples
+        self.state = CLOSED
+        # (instant, échec) des derniers appels
+        self._calls = deque()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._current_open_for = open_for
+        self._probe_started = None
+
+    def _prune(self, now):
+        calls = self._calls
+        while calls and (now - calls[0][0] > self.window or len(calls) > self.max_samples):
+            self._failures -= calls.popleft()[1]
+
+    def _set_state(self, state, now, reason=''):
+        if state == self.state:
+            return
+        self.state = state
+        BREAKER_TRANSITIONS.inc(self.name, state)
+        if state == OPEN:
+            self._opened_at = now
+            logging.warning(f"Circuit breaker: {self.name} open for {self._current_open_for:.0f}s ({reason})")
+        elif state == CLOSED:
+            self._current_open_for = self.open_for
+            self._calls.clear()
+            self._failures = 0
+            logging.info(f"Circuit breaker: {self.name} closed")
+
+    def allow(self):
+        """
+        False si l'appel doit être refusé. En demi-ouvert, seul l'appel de sonde
+        passe : 'probe' est alors retourné, à repasser à record()
+        """
+        now = time.monotonic()
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if now - self._opened_at < self._current_open_for:
+                return False
+            self._set_state(HALF_OPEN, now)
+        # Demi-ouvert : une sonde à la fois (une sonde sans réponse est remplacée après open_for)
+        if self._probe_started is not None and now - self._probe_started < self._current_open_for:
+            return False
+        self._probe_started = now
+        return 'probe'
+
+    def retry_in(self):
+        if self.state != OPEN:
+            return 0.0
+        return max(self._current_open_for - (time.monotonic() - self._opened_at), 0.0)
+
+    def record(self, duration, status=None, exception=None, probe=False):
+        """Résultat d'un appel autorisé par allow()"""
+        now = time.monotonic()
+        if isinstance(exception, (asyncio.CancelledError, CircuitOpenError)):
+            # Appel annulé (client parti, course perdue...) : ce n'est pas un verdict sur le service
+            if probe:
+                self._probe_started = None
+            return
+        failed = exception is not None or (status is not None and status >= 500) or duration >= self.slow_call
+        if probe or self.state == HALF_OPEN:
+            if not probe:
+                # Réponse d'un appel parti avant l'ouverture : la sonde décide
+                return
+            self._probe_started = None
+            if failed:
+                self._current_open_for = min(self._current_open_for * 2, self.max_open_for)
+                self._set_state(OPEN, now, "probe failed")
+            else:
+                self._set_state(CLOSED, now)
+            return
+        if self.state == OPEN:
+            return
+        self._calls.append((now, failed))
+        self._failures += failed
+        self._prune(now)
+        if len(self._calls) >= self.min_calls and self._failures >= self.failure_ratio * len(self._calls):
+            self._set_state(OPEN, now, f"{self._failures}/{len(self._calls)} calls failed in {self.window:.0f}s")
+
+    def report(self):
+        now = time.monotonic()
+        self._prune(now)
+        return {
+            "state": self.state,
+            "calls": len(self._calls),
+            "failures": self._failures,
+            "retry_in": round(self.retry_in(), 1),
+            "open_for": self._current_open_for,
+        }
+
+
+class BreakerRegistry:
+    """Disjoncteurs créés à la demande, un par service (`name`, ou hôte pour les trackers UNIT3D)"""
+
+    def __init__(self, **settings):
+        self.settings = settings
+        self.breakers = {}
+        metrics.REGISTRY.computed(
+            'frenchio_breaker_state', "État des disjoncteurs (0 fermé, 1 demi-ouvert, 2 ouvert)",
+            'gauge', ('upstream',), self._states
+        )
+
+    def _states(self):
+        return [((name,), STATE_VALUES[b.state]) for name, b in self.breakers.items()]
+
+    def get(self, name):
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            breaker = self.breakers[name] = CircuitBreaker(name, **self.settings)
+        return breaker
+
+    def report(self):
+        return {name: breaker.report() for name, breaker in sorted(self.breakers.items())}
@@ -0,0 +1,401 @@
+"""
+Caches de Frenchio (mémoire et disque)
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+from collections import OrderedDict
+
+import aiohttp
+
+import upstream
+
+
+_INFO_HASH_RE = re.compile(r'[0-9a-f]{40}')
+# Propriétaire d'un .torrent en cache : empreinte key_digest
+_OWNER_RE = re.compile(r'[0-9a-f]{16}')
+
+
+def is_info_hash(value):
+    """True pour un info hash v1 (40 caractères hexadécimaux), seule forme utilisable comme nom de fichier"""
+    return bool(value) and _INFO_HASH_RE.fullmatch(value.lower()) is not None
+
+
+def key_digest(secret):
+    """Empreinte courte d'une clé API (on ne garde jamais la clé en clair dans les clés de cache)"""
+    return hashlib.sha256((secret or '').encode('utf-8')).hexdigest()[:16]
+
+
+class ResolvedLink:
+    __slots__ = ('url', 'expires_at', 'checked_at')
+
+    def __init__(self, url, expires_at, checked_at):
+        self.url = url
+        self.expires_at = expires_at
+        self.checked_at = checked_at
+
+
+class ResolveCache:
+    """
+    Cache des liens directs obtenus par handle_resolve.
+
+    Clé : (provider, empreinte de la clé API, info_hash, saison, épisode).
+    Chaque entrée vit le temps de validité du lien chez le provider. Elle est
+    revalidée paresseusement (HEAD vers le CDN) quand elle n'a pas été vérifiée
+    depuis `validate_after` secondes, et supprimée si le CDN répond en 4xx.
+    Avec un espace de noms partagé (`shared`, sharedstore.Namespace), les liens
+    résolus par un worker servent aux autres et une même résolution n'est
+    lancée que par un worker.
+    """
+
+    def __init__(self, ttls, default_ttl=3600, max_entries=2048, validate_after=60, shared=None):
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.validate_after = validate_after
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def make_key(self, provider, api_key, info_hash, season=None, episode=None):
+        return (
+            provider,
+            key_digest(api_key),
+            (info_hash or '').lower(),
+            int(season) if season is not None else None,
+            int(episode) if episode is not None else None,
+        )
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def _ttl(self, key):
+        return self.ttls.get(key[0], self.default_ttl)
+
+    def set(self, key, url, ttl=None):
+        now = time.monotonic()
+        self._entries[key] = ResolvedLink(url, now + (self._ttl(key) if ttl is None else ttl), now)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def is_pending(self, key):
+        return key in self._inflight
+
+    async def resolve(self, key, resolver):
+        """
+        Résout le lien via `resolver()` et le met en cache. Si une résolution
+        est déjà en cours pour cette clé (pré-résolution ou autre clic), on
+        attend son résultat au lieu de relancer la chaîne d'unlock.
+        """
+        pending = self._inflight.get(key)
+        if pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # Si c'est la résolution d'origine qui a été annulée, on la refait
+                if not pending.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        ttl = None
+        try:
+            if self.shared is None:
+                url = await resolver()
+            else:
+                url, ttl = await self.shared.load(key, resolver, self._ttl(key))
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Évite le warning "exception never retrieved" si personne n'attendait
+            future.exception()
+            raise
+        else:
+            if url:
+                self.set(key, url, ttl)
+            future.set_result(url)
+            return url
+        finally:
+            self._inflight.pop(key, None)
+
+    async def is_valid(self, key, entry):
+        """
+        Vérifie (au besoin) qu'un lien en cache est toujours servi par le CDN.
+        Seul un 4xx invalide l'entrée : une erreur réseau ou un 5xx ne prouve
+        pas que le lien est mort, on le garde.
+        """
+        now = time.monotonic()
+        if now - entry.checked_at < self.validate_after:
+            return True
+
+        try:
+            async with upstream.session("cdn") as session:
+                async with session.head(entry.url, allow_redirects=True, timeout=3) as resp:
+                    status = resp.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.debug(f"Resolve cache: validation skipped ({e})")
+            entry.checked_at = now
+            return True
+
+        # Certains CDN refusent HEAD (405) : ce n'est pas un lien expiré
+        if 400 <= status < 500 and status != 405:
+            logging.info(f"Resolve cache: link expired upstream ({status}), invalidating")
+            self.invalidate(key)
+            if self.shared is not None:
+                await self.shared.delete(key)
+            return False
+
+        entry.checked_at = now
+        return True
+
+
+class TTLCache:
+    """
+    Cache LRU borné avec expiration, pour les résultats d'API (TMDB, recherches
+    trackers, disponibilité debrid). Les chargements concurrents d'une même
+    clé sont fusionnés.
+
+    Avec un espace de noms partagé (`shared`, sharedstore.Namespace), un
+    manque local est cherché dans le cache partagé, et la fusion des
+    chargements vaut entre processus. hits/misses comptent le cache local.
+    """
+
+    def __init__(self, name, ttl, max_entries=1024, shared=None):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        item = self._entries.get(key)
+        if item is None or item[0] <= time.monotonic():
+            if item is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_many(self, keys):
+        """{clé: valeur} des clés en cache, localement ou dans le stockage partagé"""
+        missing = object()
+        found = {}
+        absent = []
+        for key in keys:
+            value = self.get(key, missing)
+            if value is missing:
+                absent.append(key)
+            else:
+                found[key] = value
+        if absent and self.shared is not None:
+            for key, (value, ttl) in (await self.shared.get_many(absent)).items():
+                self.set(key, value, ttl=ttl)
+                found[key] = value
+        return found
+
+    async def set_many(self, items):
+        """Met en cache [(clé, valeur)], localement et dans le stockage partagé"""
+        for key, value in items:
+            self.set(key, value)
+        if self.shared is not None:
+            await self.shared.set_many(items, self.ttl)
+
+    async def get_or_load(self, key, loader, cache_if=bool):
+        """
+        Retourne la valeur en cache ou l'obtient via `loader()`.
+        Le résultat n'est mis en cache que si `cache_if(valeur)` est vrai.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is None:
+            task = asyncio.ensure_future(self._load(key, loader, cache_if))
+            task.add_done_callback(self._load_done)
+            # [tâche, nombre d'appelants qui l'attendent]
+            pending = self._inflight[key] = [task, 0]
+
+        task = pending[0]
+        pending[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # Le chargement n'est annulé que si plus personne ne l'attend
+            if pending[1] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            pending[1] -= 1
+
+    async def _load(self, key, loader, cache_if):
+        try:
+            ttl = None
+            if self.shared is None:
+                value = await loader()
+            else:
+                value, ttl = await self.shared.load(key, loader, self.ttl, cache_if)
+            if cache_if(value):
+                self.set(key, value, ttl=ttl)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    @staticmethod
+    def _load_done(task):
+        # Évite le warning "exception never retrieved" si tous les appelants sont partis
+        if not task.cancelled():
+            task.exception()
+
+
+class TorrentFileCache:
+    """
+    Cache disque des fichiers .torrent, adressé par (propriétaire, info hash).
+
+    Le .torrent d'un tracker privé contient la passkey de celui qui l'a
+    téléchargé (URL d'annonce) : un fichier n'est rendu qu'au même
+    propriétaire, empreinte de l'identifiant tracker utilisé (voir
+    main.torrent_owner), jamais à un autre utilisateur.
+    Les écritures sont atomiques (fichier temporaire + rename), la taille totale
+    est bornée par `max_bytes` et les fichiers les moins récemment utilisés
+    (mtime, rafraîchi à chaque lecture) sont supprimés en premier.
+    Le dossier peut être partagé par plusieurs workers : la taille totale est
+    remesurée sur disque toutes les `rescan_interval` secondes, et seuls les
+    fichiers temporaires de plus de `stale_tmp` secondes sont supprimés.
+    Les méthodes font des I/O bloquantes : les appeler via asyncio.to_thread.
+    """
+
+    def __init__(self, directory, max_bytes, rescan_interval=30, stale_tmp=600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.rescan_interval = rescan_interval
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        # Fichiers temporaires laissés par un arrêt brutal (pas ceux d'un put() en cours dans un
+        # autre worker) et fichiers d'avant le cloisonnement par propriétaire (<hash>.torrent)
+        now = time.time()
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if ((entry.name.endswith('.tmp') and now - entry.stat().st_mtime > stale_tmp)
+                            or (entry.name.endswith('.torrent') and '-' not in entry.name)):
+                        os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+        self._rescan()
+
+    def _rescan(self):
+        self._total = sum(size for _, size, _ in self._scan())
+        self._scanned_at = time.monotonic()
+
+    def _path(self, owner, info_hash):
+        # Le hash vient de l'URL : jamais de séparateur de chemin ni de ".." dans le nom de fichier
+        if not is_info_hash(info_hash):
+            raise ValueError(f"invalid info hash {info_hash[:50]!r}")
+        if not _OWNER_RE.fullmatch(owner):
+            raise ValueError(f"invalid owner {owner[:50]!r}")
+        return os.path.join(self.directory, f"{owner}-{info_hash.lower()}.torrent")
+
+    def _scan(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.torrent'):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((entry.path, st.st_size, st.st_mtime))
+        return entries
+
+    def get(self, owner, info_hash):
+        path = self._path(owner, info_hash)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, owner, info_hash, data):
+        path = self._path(owner, info_hash)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            try:
+                previous = os.path.getsize(path)
+            except FileNotFoundError:
+                previous = 0
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        self._total += len(data) - previous
+        # Les autres workers écrivent aussi dans le dossier : total remesuré de temps en temps
+        if time.monotonic() - self._scanned_at >= self.rescan_interval:
+            self._rescan()
+        if self._total > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        entries = sorted(self._scan(), key=lambda e: e[2])
+        self._total = sum(size for _, size, _ in entries)
+        self._scanned_at = time.monotonic()
+        evicted = 0
+        for path, size, _ in entries:
+            if self._total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            self._total -= size
+            evicted += 1
+        logging.info(f"Torrent cache: evicted {evicted} files ({self._total // 1024} Ko kept)")
@@ -0,0 +1,394 @@
+"""
+Backends du cache partagé (sharedstore.py)
+
+Tous exposent la même interface asynchrone sur des clés texte et des valeurs
+binaires : get_many, set_many (avec durée de vie), delete, verrous à durée
+limitée (acquire, release, locked), usage() (entrées, octets) quand il est
+connu, start() / close().
+
+- MemoryBackend : dans le processus, LRU borné en octets. Pour un processus
+  seul, ou comme doublure dans les tests.
+- SqliteBackend : fichier SQLite (WAL, lectures par mmap) commun aux workers
+  d'une même machine, borné en octets.
+- RedisBackend : client minimal du protocole Redis (RESP) pour plusieurs
+  machines, sans dépendance. La taille est bornée côté serveur (maxmemory) ;
+  bench/fakeredis.py le remplace localement.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class RedisError(Exception):
+    """Réponse d'erreur du serveur Redis, ou réponse illisible"""
+
+
+class MemoryBackend:
+    name = 'memory'
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._locks = {}
+
+    def _live(self, key, now):
+        item = self._entries.get(key)
+        if item is not None and item[0] <= now:
+            self._remove(key)
+            return None
+        return item
+
+    def _remove(self, key):
+        _, value = self._entries.pop(key)
+        self.bytes -= len(key) + len(value)
+
+    async def get_many(self, keys):
+        now = time.time()
+        found = {}
+        for key in keys:
+            item = self._live(key, now)
+            if item is not None:
+                self._entries.move_to_end(key)
+                found[key] = item[1]
+        return found
+
+    async def set_many(self, items, ttl):
+        expires = time.time() + ttl
+        for key, value in items:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires, value)
+            self.bytes += len(key) + len(value)
+        while self.bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+
+    async def delete(self, key):
+        if key in self._entries:
+            self._remove(key)
+
+    async def acquire(self, key, owner, lease):
+        now = time.time()
+        holder = self._locks.get(key)
+        if holder is not None and holder[1] > now:
+            return False
+        self._locks[key] = (owner, now + lease)
+        return True
+
+    async def release(self, key, owner):
+        if self._locks.get(key, (None,))[0] == owner:
+            del self._locks[key]
+
+    async def locked(self, key):
+        holder = self._locks.get(key)
+        return holder is not None and holder[1] > time.time()
+
+    def usage(self):
+        return len(self._entries), self.bytes
+
+    def start(self):
+        pass
+
+    async def close(self):
+        self._entries.clear()
+        self._locks.clear()
+        self.bytes = 0
+
+
+class SqliteBackend:
+    """
+    Entrées dans une table SQLite, accès hors de la boucle (asyncio.to_thread).
+    Une tâche de fond (`start()`) supprime les entrées expirées, recompte la
+    taille et, au-delà de `max_bytes`, retire les entrées qui expirent le plus
+    tôt jusqu'à 90 % de la limite.
+    """
+    name = 'sqlite'
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, mmap_bytes=64 * 1024 * 1024, purge_interval=60):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.purge_interval = purge_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(f"PRAGMA mmap_size={int(mmap_bytes)}")
+        self._db.execute("CREATE TABLE IF NOT EXISTS cache_entries "
+                         "(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, expires REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_entries_expires ON cache_entries (expires)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS cache_locks "
+                         "(key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)")
+        self._usage = None
+        self._task = None
+
+    @contextmanager
+    def _transaction(self):
+        """Transaction en écriture, sous le verrou du processus"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _get_many(self, keys):
+        now = time.time()
+        found = {}
+        with self._lock:
+            # Par paquets : limite du nombre de paramètres SQLite
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT key, value FROM cache_entries WHERE expires > ? AND key IN ({','.join('?' * len(chunk))})",
+                    (now, *chunk)).fetchall()
+                found.update(rows)
+        return found
+
+    def _set_many(self, items, ttl):
+        expires = time.time() + ttl
+        rows = [(key, value, len(key) + len(value), expires) for key, value in items]
+        with self._transaction():
+            self._db.executemany("INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?)", rows)
+
+    def _delete(self, key):
+        with self._lock:
+            self._db.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def _acquire(self, key, owner, lease):
+        now = time.time()
+        with self._transaction():
+            self._db.execute("DELETE FROM cache_locks WHERE key = ? AND expires <= ?", (key, now))
+            cursor = self._db.execute("INSERT OR IGNORE INTO cache_locks VALUES (?, ?, ?)", (key, owner, now + lease))
+        return cursor.rowcount == 1
+
+    def _release(self, key, owner):
+        with self._lock:
+            self._db.execute("DELETE FROM cache_locks WHERE key = ? AND owner = ?", (key, owner))
+
+    def _locked(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT expires FROM cache_locks WHERE key = ?", (key,)).fetchone()
+        return row is not None and row[0] > time.time()
+
+    def _purge(self):
+        now = time.time()
+        with self._transaction():
+            removed = self._db.execute("DELETE FROM cache_entries WHERE expires <= ?", (now,)).rowcount
+            self._db.execute("DELETE FROM cache_locks WHERE expires <= ?", (now,))
+            count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries").fetchone()
+            if total > self.max_bytes:
+                # Entrées qui expirent le plus tôt, jusqu'à 90 % de la limite
+                excess = total - int(self.max_bytes * 0.9)
+                victims = []
+                for key, size in self._db.execute("SELECT key, size FROM cache_entries ORDER BY expires"):
+                    if excess <= 0:
+                        break
+                    victims.append((key,))
+                    excess -= size
+                self._db.executemany("DELETE FROM cache_entries WHERE key = ?", victims)
+                removed += len(victims)
+                count, total = self._db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries").fetchone()
+        self._usage = (count, total)
+        return removed
+
+    async def get_many(self, keys):
+        return await asyncio.to_thread(self._get_many, keys)
+
+    async def set_many(self, items, ttl):
+        await asyncio.to_thread(self._set_many, items, ttl)
+
+    async def delete(self, key):
+        await asyncio.to_thread(self._delete, key)
+
+    async def acquire(self, key, owner, lease):
+        return await asyncio.to_thread(self._acquire, key, owner, lease)
+
+    async def release(self, key, owner):
+        await asyncio.to_thread(self._release, key, owner)
+
+    async def locked(self, key):
+        return await asyncio.to_thread(self._locked, key)
+
+    def usage(self):
+        """(entrées, octets) au dernier passage de la tâche de fond"""
+        return self._usage
+
+    async def _purge_loop(self):
+        while True:
+            try:
+                removed = await asyncio.to_thread(self._purge)
+                if removed:
+                    logging.debug(f"Shared cache: purged {removed} entries")
+            except sqlite3.Error as e:
+                logging.warning(f"Shared cache: purge failed: {e}")
+            await asyncio.sleep(self.purge_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._purge_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        with self._lock:
+            self._db.close()
+
+
+class _RedisConnection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @staticmethod
+    def _encode(command):
+        parts = [b'*%d\r\n' % len(command)]
+        for arg in command:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts += [b'$%d\r\n' % len(arg), arg, b'\r\n']
+        return b''.join(parts)
+
+    async def _read(self):
+        line = await self.reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError("connection closed by Redis")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode('utf-8')
+        if kind == b'-':
+            return RedisError(rest.decode('utf-8'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            return (await self.reader.readexactly(length + 2))[:-2]
+        if kind == b'*':
+            length = int(rest)
+            if length < 0:
+                return None
+            return [await self._read() for _ in range(length)]
+        raise RedisError(f"unexpected reply {line[:40]!r}")
+
+    async def execute(self, commands):
+        """Réponses de `commands`, envoyées d'un seul bloc (pipeline)"""
+        self.writer.write(b''.join(self._encode(c) for c in commands))
+        await self.writer.drain()
+        return [await self._read() for _ in commands]
+
+    def close(self):
+        self.writer.close()
+
+
+class RedisBackend:
+    """
+    Client Redis (RESP2) : `redis://[:mot_de_passe@]hôte[:port][/base]`.
+    Jusqu'à `pool_size` connexions, chaque opération bornée par `timeout`.
+    Les clés sont préfixées par `prefix` ; les valeurs expirent côté serveur
+    (SET ... PX). Verrous : SET NX PX, libérés par leur propriétaire.
+    """
+    name = 'redis'
+
+    def __init__(self, url, pool_size=4, timeout=2.0, prefix='frenchio:'):
+        parsed = urllib.parse.urlsplit(url)
+        if parsed.scheme != 'redis':
+            raise ValueError(f"unsupported Redis URL scheme {parsed.scheme!r} (redis:// only)")
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = urllib.parse.unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.strip('/') or 0)
+        self.timeout = timeout
+        self.prefix = prefix
+        self._pool_size = pool_size
+        self._slots = None
+        self._idle = []
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        connection = _RedisConnection(reader, writer)
+        setup = []
+        if self.password:
+            setup.append(('AUTH', self.password))
+        if self.db:
+            setup.append(('SELECT', self.db))
+        if setup:
+            for reply in await connection.execute(setup):
+                if isinstance(reply, RedisError):
+                    connection.close()
+                    raise reply
+        return connection
+
+    async def _execute(self, *commands):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._pool_size)
+        async with self._slots:
+            connection = self._idle.pop() if self._idle else None
+            try:
+                if connection is None:
+                    connection = await asyncio.wait_for(self._connect(), self.timeout)
+                replies = await asyncio.wait_for(connection.execute(commands), self.timeout)
+            except BaseException:
+                # Réponse partielle ou connexion morte : on ne la réutilise pas
+                if connection is not None:
+                    connection.close()
+                raise
+            self._idle.append(connection)
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    async def get_many(self, keys):
+        (values,) = await self._execute(('MGET', *[self.prefix + k for k in keys]))
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    async def set_many(self, items, ttl):
+        ttl_ms = max(int(ttl * 1000), 1)
+        await self._execute(*[('SET', self.prefix + key, value, 'PX', ttl_ms) for key, value in items])
+
+    async def delete(self, key):
+        await self._execute(('DEL', self.prefix + key))
+
+    async def acquire(self, key, owner, lease):
+        (reply,) = await self._execute(('SET', self.prefix + key, owner, 'NX', 'PX', max(int(lease * 1000), 1)))
+        return reply == 'OK'
+
+    async def release(self, key, owner):
+        # Lecture puis suppression (pas de script Lua) : au pire, un verrou repris entre les deux
+        # est libéré trop tôt et une clé est chargée deux fois
+        (holder,) = await self._execute(('GET', self.prefix + key))
+        if holder == owner.encode('utf-8'):
+            await self._execute(('DEL', self.prefix + key))
+
+    async def locked(self, key):
+        (exists,) = await self._execute(('EXISTS', self.prefix + key))
+        return exists == 1
+
+    def usage(self):
+        return None
+
+    def start(self):
+        pass
+
+    async def close(self):
+        for connection in self._idle:
+            connection.close()
+        self._idle.clear()
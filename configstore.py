@@ -0,0 +1,270 @@
+"""
+Configurations utilisateur : décodage, cache et stockage côté serveur
+
+Historiquement, toute la config (trackers, clés API, identifiants qBittorrent)
+voyage en JSON base64 dans chaque URL. Avec un ConfigStore, la page de
+configuration l'enregistre une fois (POST /config) et l'URL ne porte plus
+qu'un jeton court et opaque (`c_` + 22 caractères). Les anciennes URL base64
+restent acceptées.
+
+Le jeton est dérivé de la config (HMAC du secret serveur) : la même config
+donne le même jeton, sans doublon dans le stockage. Chaque config est
+chiffrée avec une clé dérivée de son jeton et du secret serveur, et rangée
+sous une empreinte du jeton : le fichier seul ne permet ni de retrouver les
+jetons ni de lire les configs. Chiffrement sans dépendance : flux HMAC-SHA256
+en mode compteur, puis HMAC d'authentification (chiffrer puis authentifier).
+
+POST /config n'est pas authentifié : seules les configs ayant les champs
+produits par la page de configuration sont acceptées, et le stockage est borné
+(nombre d'entrées, octets). Au-delà, les configs les moins récemment utilisées
+sont supprimées ; la date d'utilisation est rafraîchie à la lecture, et au
+plus une fois par TOUCH_INTERVAL pour une config servie depuis le cache.
+
+Dans les deux cas, la config décodée est gelée (UserConfig, non modifiable)
+et gardée dans un cache LRU : ni base64, ni json.loads, ni lecture SQLite à
+chaque recherche ou resolve.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+
+TOKEN_PREFIX = 'c_'
+TOKEN_LENGTH = 22
+# Une config réelle fait quelques Ko ; au-delà, la requête est refusée
+MAX_CONFIG_BYTES = 64 * 1024
+# Écart minimal entre deux mises à jour de la date d'utilisation d'une config (secondes)
+TOUCH_INTERVAL = 3600
+
+
+class FrozenDict(dict):
+    """dict en lecture seule : une config partagée entre requêtes ne doit pas être modifiée par l'une d'elles"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("user config is read-only")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+    __ior__ = _readonly
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+class UserConfig(FrozenDict):
+    """Config décodée et gelée, avec son empreinte (identifiant d'utilisateur des caches et tâches de fond)"""
+
+    @classmethod
+    def parse(cls, data):
+        """UserConfig depuis le JSON décodé, None si ce n'est pas un objet"""
+        if not isinstance(data, dict):
+            return None
+        config = cls((k, freeze(v)) for k, v in data.items())
+        canonical = json.dumps(config, sort_keys=True)
+        config.canonical = canonical
+        config.digest = hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+        return config
+
+
+# Champs de l'objet envoyé par la page de configuration (templates/configure.html)
+CONFIG_FIELDS = {
+    'tmdb_key': str,
+    'alldebrid_key': str,
+    'torbox_key': str,
+    'debridlink_key': str,
+    'trackers': tuple,
+    'sharewood_passkey': str,
+    'ygg_passkey': str,
+    'abn_username': str,
+    'abn_password': str,
+    'max_size': int,
+    'qbittorrent': (FrozenDict, type(None)),
+}
+QBIT_FIELDS = ('host', 'username', 'password', 'public_url')
+
+
+def check_fields(config):
+    """Raison du refus d'une config envoyée à POST /config, None si elle a la forme attendue"""
+    missing = [k for k in CONFIG_FIELDS if k not in config]
+    if missing:
+        return f"missing fields: {', '.join(missing)}"
+    unknown = [k for k in config if k not in CONFIG_FIELDS]
+    if unknown:
+        return f"unknown fields: {', '.join(sorted(unknown))[:200]}"
+    for key, expected in CONFIG_FIELDS.items():
+        # bool est un int pour isinstance
+        if not isinstance(config[key], expected) or isinstance(config[key], bool):
+            return f"invalid field: {key}"
+    if not config['tmdb_key']:
+        return "missing TMDB key"
+    qbit = config['qbittorrent']
+    if qbit is not None and (set(qbit) != set(QBIT_FIELDS) or not all(isinstance(qbit[k], str) for k in QBIT_FIELDS)):
+        return "invalid field: qbittorrent"
+    for tracker in config['trackers']:
+        if (not isinstance(tracker, FrozenDict) or set(tracker) != {'url', 'token'}
+                or not all(isinstance(v, str) for v in tracker.values())):
+            return "invalid field: trackers"
+    return None
+
+
+def is_token(config_str):
+    return config_str.startswith(TOKEN_PREFIX) and len(config_str) == len(TOKEN_PREFIX) + TOKEN_LENGTH
+
+
+def _keystream_xor(key, nonce, data):
+    out = bytearray(len(data))
+    for offset in range(0, len(data), 32):
+        block = hmac.new(key, nonce + (offset // 32).to_bytes(4, 'big'), hashlib.sha256).digest()
+        chunk = data[offset:offset + 32]
+        out[offset:offset + len(chunk)] = bytes(a ^ b for a, b in zip(chunk, block))
+    return bytes(out)
+
+
+class ConfigStore:
+    """
+    Configs chiffrées dans un fichier SQLite, retrouvées par jeton. Au-delà de
+    `max_entries` entrées ou `max_bytes` octets, les moins récemment utilisées
+    sont supprimées (0 = pas de limite).
+    """
+
+    def __init__(self, path, secret=None, max_entries=0, max_bytes=0):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        # id -> dernière date d'utilisation écrite par ce processus
+        self._touched = {}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS configs "
+                         "(id TEXT PRIMARY KEY, nonce BLOB NOT NULL, data BLOB NOT NULL, created REAL NOT NULL, "
+                         "last_used REAL NOT NULL DEFAULT 0)")
+        # Fichiers d'avant la date d'utilisation : l'entrée compte comme utilisée à sa création
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(configs)")]
+        if 'last_used' not in columns:
+            self._db.execute("ALTER TABLE configs ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+            self._db.execute("UPDATE configs SET last_used = created")
+        self._db.execute("CREATE INDEX IF NOT EXISTS configs_last_used ON configs (last_used)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+        self.secret = secret.encode('utf-8') if secret else self._stored_secret()
+
+    def _stored_secret(self):
+        """Secret généré au premier démarrage et conservé avec les configs (sans CONFIG_STORE_SECRET)"""
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO meta VALUES ('secret', ?)", (secrets.token_bytes(32),))
+            return self._db.execute("SELECT value FROM meta WHERE key = 'secret'").fetchone()[0]
+
+    def _derive(self, label, token):
+        return hmac.new(self.secret, label + token.encode('ascii'), hashlib.sha256).digest()
+
+    def _id(self, token):
+        return self._derive(b'id', token).hex()[:32]
+
+    def token_for(self, config):
+        digest = hmac.new(self.secret, b'token' + config.canonical.encode('utf-8'), hashlib.sha256).digest()
+        return TOKEN_PREFIX + base64.urlsafe_b64encode(digest).decode('ascii')[:TOKEN_LENGTH]
+
+    def put(self, config):
+        """Enregistre `config` (UserConfig) et retourne son jeton"""
+        token = self.token_for(config)
+        key, mac_key = self._derive(b'enc', token), self._derive(b'mac', token)
+        nonce = secrets.token_bytes(16)
+        ciphertext = _keystream_xor(key, nonce, zlib.compress(config.canonical.encode('utf-8')))
+        tag = hmac.new(mac_key, nonce + ciphertext, hashlib.sha256).digest()[:16]
+        entry_id = self._id(token)
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO configs (id, nonce, data, created, last_used) "
+                             "VALUES (?, ?, ?, ?, ?)", (entry_id, nonce, ciphertext + tag, now, now))
+            self._touched[entry_id] = now
+            self._evict(keep=entry_id)
+        return token
+
+    def _evict(self, keep):
+        """Supprime les configs les moins récemment utilisées au-delà des limites (verrou pris)"""
+        if not (self.max_entries or self.max_bytes):
+            return
+        count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM configs").fetchone()
+        if (not self.max_entries or count <= self.max_entries) and (not self.max_bytes or size <= self.max_bytes):
+            return
+        # Marge de 10 % : pas d'éviction à chaque nouvelle config une fois la limite atteinte
+        excess_count = count - int(self.max_entries * 0.9) if self.max_entries else 0
+        excess_bytes = size - int(self.max_bytes * 0.9) if self.max_bytes else 0
+        evicted = []
+        for entry_id, length in self._db.execute(
+                "SELECT id, LENGTH(data) FROM configs WHERE id != ? ORDER BY last_used", (keep,)):
+            if excess_count <= 0 and excess_bytes <= 0:
+                break
+            evicted.append((entry_id,))
+            excess_count -= 1
+            excess_bytes -= length
+        self._db.executemany("DELETE FROM configs WHERE id = ?", evicted)
+        for (entry_id,) in evicted:
+            self._touched.pop(entry_id, None)
+        self.evictions += len(evicted)
+        logging.info(f"Config store: evicted {len(evicted)} least recently used configs")
+
+    def get(self, token):
+        """UserConfig du jeton, None s'il est inconnu ou si l'entrée a été altérée"""
+        entry_id = self._id(token)
+        with self._lock:
+            row = self._db.execute("SELECT nonce, data FROM configs WHERE id = ?", (entry_id,)).fetchone()
+            if row is not None:
+                self._touch(entry_id, time.time())
+        if row is None:
+            return None
+        nonce, data = row
+        ciphertext, tag = data[:-16], data[-16:]
+        expected = hmac.new(self._derive(b'mac', token), nonce + ciphertext, hashlib.sha256).digest()[:16]
+        if not hmac.compare_digest(tag, expected):
+            logging.warning("Config store: entry failed authentication")
+            return None
+        plaintext = zlib.decompress(_keystream_xor(self._derive(b'enc', token), nonce, ciphertext))
+        return UserConfig.parse(json.loads(plaintext))
+
+    def _touch(self, entry_id, now):
+        self._db.execute("UPDATE configs SET last_used = ? WHERE id = ?", (now, entry_id))
+        self._touched[entry_id] = now
+        if len(self._touched) > max(self.max_entries, 100000):
+            self._touched.clear()
+
+    def touch_due(self, token):
+        """True si la date d'utilisation de la config n'a pas été écrite depuis TOUCH_INTERVAL"""
+        return time.time() - self._touched.get(self._id(token), 0) >= TOUCH_INTERVAL
+
+    def touch(self, token):
+        """Note l'utilisation d'une config servie depuis le cache (elle n'est pas relue)"""
+        with self._lock:
+            self._touch(self._id(token), time.time())
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM configs").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def decode(config_str):
+    """UserConfig d'une config JSON base64 (format historique des URL), None si invalide"""
+    try:
+        return UserConfig.parse(json.loads(base64.b64decode(config_str).decode('utf-8')))
+    except Exception as e:
+        logging.error(f"Config Decode Error: {e}")
+        return None
@@ -0,0 +1,158 @@
+"""
+Instances de services réutilisées d'une requête à l'autre
+
+Chaque recherche ou resolve construisait ses services (TMDB, trackers,
+débrideurs, ABN, qBittorrent) : connexion ABN refaite à chaque recherche,
+login et test de connexion qBittorrent synchrones à chaque stream. Le
+registre garde les instances, indexées par service et par empreinte de la
+partie de la config qui les définit (clé API, identifiants...), tant
+qu'elles servent : une instance inutilisée `ttl` secondes, ou la plus
+ancienne au-delà de `max_entries`, est retirée.
+
+Les services qui détiennent une session (`close()`, ABN) s'empruntent avec
+`lease()` : une instance retirée pendant qu'une requête l'utilise n'est
+fermée qu'une fois rendue. Les autres se récupèrent avec `get()`.
+"""
+import asyncio
+import inspect
+import json
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from cache import key_digest
+
+
+class _Entry:
+    __slots__ = ('instance', 'expires_at', 'leases', 'evicted')
+
+    def __init__(self, instance, expires_at):
+        self.instance = instance
+        self.expires_at = expires_at
+        self.leases = 0
+        self.evicted = False
+
+
+class ServiceRegistry:
+    def __init__(self, ttl=600, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._closing = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def make_key(kind, credentials):
+        """Clé d'une instance : jamais d'identifiant en clair"""
+        return kind, key_digest(json.dumps(credentials, sort_keys=True))
+
+    async def _entry(self, kind, credentials, factory):
+        key = self.make_key(kind, credentials)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= now:
+            self._evict(key)
+            entry = None
+        if entry is not None:
+            self.hits += 1
+            entry.expires_at = now + self.ttl
+            self._entries.move_to_end(key)
+            return entry
+
+        # Création unique même si plusieurs requêtes arrivent ensemble (login qBittorrent, ABN...)
+        pending = self._inflight.get(key)
+        if pending is None:
+            self.misses += 1
+            pending = self._inflight[key] = asyncio.ensure_future(self._create(key, factory))
+            pending.add_done_callback(self._created)
+        return await asyncio.shield(pending)
+
+    async def _create(self, key, factory):
+        try:
+            instance = factory()
+            if inspect.isawaitable(instance):
+                instance = await instance
+            entry = _Entry(instance, time.monotonic() + self.ttl)
+            if self.max_entries > 0:
+                self._entries[key] = entry
+                self._prune()
+            else:
+                entry.evicted = True
+            return entry
+        finally:
+            self._inflight.pop(key, None)
+
+    @staticmethod
+    def _created(task):
+        # Évite le warning "exception never retrieved" si tous les appelants sont partis
+        if not task.cancelled():
+            task.exception()
+
+    def _prune(self):
+        now = time.monotonic()
+        for key in [k for k, e in self._entries.items() if e.expires_at <= now]:
+            self._evict(key)
+        while len(self._entries) > self.max_entries:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, key):
+        entry = self._entries.pop(key)
+        entry.evicted = True
+        if entry.leases == 0:
+            self._close(entry)
+
+    def _close(self, entry):
+        close = getattr(entry.instance, 'close', None)
+        if close is None:
+            return
+        task = asyncio.ensure_future(close())
+        self._closing.add(task)
+        task.add_done_callback(self._closed)
+
+    def _closed(self, task):
+        self._closing.discard(task)
+        if not task.cancelled() and task.exception():
+            logging.warning(f"Service registry: close failed: {task.exception()}")
+
+    async def get(self, kind, credentials, factory):
+        """
+        Instance de `kind` pour `credentials` (partie de la config), créée par
+        `factory()` (fonction ou coroutine) si absente. Réservé aux services
+        sans session à fermer : voir lease()
+        """
+        return (await self._entry(kind, credentials, factory)).instance
+
+    def find(self, kind, digest):
+        """Instance déjà créée de `kind` dont les identifiants ont l'empreinte `digest` (make_key), sinon None"""
+        key = (kind, digest)
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at <= time.monotonic():
+            return None
+        entry.expires_at = time.monotonic() + self.ttl
+        self._entries.move_to_end(key)
+        return entry.instance
+
+    @asynccontextmanager
+    async def lease(self, kind, credentials, factory):
+        """Comme get(), mais l'instance n'est pas fermée tant qu'elle est empruntée"""
+        entry = await self._entry(kind, credentials, factory)
+        entry.leases += 1
+        try:
+            yield entry.instance
+        finally:
+            entry.leases -= 1
+            if entry.evicted and entry.leases == 0:
+                self._close(entry)
+
+    async def close(self):
+        """Arrêt : ferme toutes les instances"""
+        for key in list(self._entries):
+            self._evict(key)
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
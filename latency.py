@@ -0,0 +1,147 @@
+"""
+Timeouts adaptatifs et requêtes doublées (hedging)
+
+Les durées des appels de chaque service externe (fenêtre glissante) donnent
+ses percentiles. Le timeout d'un appel vaut `factor` × p99 observé, borné par
+`floor` et par le timeout fixe du service (qui sert aussi tant que les
+mesures sont trop peu nombreuses). Un appel coupé par son timeout compte pour
+la durée du timeout : si le service ralentit, son p99 monte avec lui et le
+timeout remonte jusqu'au plafond au lieu de s'effondrer.
+
+Hedging (GET idempotents seulement) : si la première tentative dépasse le p95
+du service, une seconde part et la première réponse l'emporte, l'autre est
+annulée. Un budget (jetons crédités à chaque appel, `ratio` par appel) limite
+la charge ajoutée : au plus ~`ratio` des appels sont doublés.
+"""
+import asyncio
+from collections import deque
+
+import metrics
+
+HEDGED_REQUESTS = metrics.REGISTRY.counter(
+    'frenchio_upstream_hedged_total', "Secondes tentatives envoyées, et lesquelles ont répondu en premier",
+    ('upstream', 'winner'))
+HEDGE_DENIED = metrics.REGISTRY.counter(
+    'frenchio_upstream_hedge_denied_total', "Secondes tentatives refusées faute de budget", ('upstream',))
+
+
+class LatencyWindow:
+    """Dernières durées d'un service ; percentiles recalculés au plus toutes les `refresh` mesures"""
+
+    def __init__(self, size=200, refresh=10):
+        self.samples = deque(maxlen=size)
+        self.refresh = refresh
+        self._sorted = []
+        self._stale = 0
+
+    def add(self, duration):
+        self.samples.append(duration)
+        self._stale += 1
+
+    def quantile(self, q):
+        if self._stale >= self.refresh or (self._stale and not self._sorted):
+            self._sorted = sorted(self.samples)
+            self._stale = 0
+        ordered = self._sorted
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)] if ordered else None
+
+
+class LatencyTracker:
+    def __init__(self, factor=3.0, floor=1.0, min_samples=20, window=200,
+                 hedge=True, hedge_ratio=0.05, hedge_burst=10, hedge_min_delay=0.05):
+        self.factor = factor
+        self.floor = floor
+        self.min_samples = min_samples
+        self.window = window
+        self.hedge = hedge
+        self.hedge_ratio = hedge_ratio
+        self.hedge_burst = hedge_burst
+        self.hedge_min_delay = hedge_min_delay
+        self.windows = {}
+        self._tokens = {}
+        metrics.REGISTRY.computed(
+            'frenchio_upstream_timeout_seconds', "Timeout adaptatif courant de chaque service externe",
+            'gauge', ('upstream',), self._timeouts
+        )
+        metrics.REGISTRY.computed(
+            'frenchio_upstream_latency_quantile_seconds', "Percentiles observés des appels externes (fenêtre glissante)",
+            'gauge', ('upstream', 'quantile'), self._quantiles
+        )
+
+    def _window(self, name):
+        window = self.windows.get(name)
+        if window is None:
+            window = self.windows[name] = LatencyWindow(self.window)
+        return window
+
+    def observe(self, name, duration):
+        self._window(name).add(duration)
+
+    def quantile(self, name, q):
+        """Percentile observé, None tant qu'il y a moins de `min_samples` mesures"""
+        window = self.windows.get(name)
+        if window is None or len(window.samples) < self.min_samples:
+            return None
+        return window.quantile(q)
+
+    def timeout(self, name, default):
+        """Timeout (s) d'un appel à `name` : `factor` × p99, entre `floor` et `default`"""
+        p99 = self.quantile(name, 0.99)
+        if p99 is None:
+            return default
+        return min(max(p99 * self.factor, self.floor), default)
+
+    def _timeouts(self):
+        return [((name,), self.timeout(name, float('inf'))) for name in self.windows
+                if self.quantile(name, 0.99) is not None]
+
+    def _quantiles(self):
+        return [((name, str(q)), value) for name in self.windows for q in (0.5, 0.95, 0.99)
+                if (value := self.quantile(name, q)) is not None]
+
+    def _credit(self, name):
+        self._tokens[name] = min(self._tokens.get(name, self.hedge_burst) + self.hedge_ratio, self.hedge_burst)
+
+    def _spend(self, name):
+        if self._tokens.get(name, self.hedge_burst) < 1:
+            return False
+        self._tokens[name] = self._tokens.get(name, self.hedge_burst) - 1
+        return True
+
+    async def hedged(self, name, attempt, second=None):
+        """
+        Résultat de `attempt()` (fabrique de coroutine). Si la première tentative
+        dépasse le p95 et que le budget le permet, une seconde est lancée
+        (`second()`, par défaut `attempt()` ; un autre miroir par exemple) : la
+        première réussie l'emporte. Si les deux échouent, l'erreur de la première
+        est levée.
+        """
+        self._credit(name)
+        delay = self.quantile(name, 0.95) if self.hedge else None
+        if delay is None:
+            return await attempt()
+        first = asyncio.ensure_future(attempt())
+        done, _ = await asyncio.wait({first}, timeout=max(delay, self.hedge_min_delay))
+        if done:
+            return first.result()
+        if not self._spend(name):
+            HEDGE_DENIED.inc(name)
+            return await first
+        backup = asyncio.ensure_future((second or attempt)())
+        pending = {first, backup}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in (first, backup):
+                    if task in done and not task.cancelled() and task.exception() is None:
+                        HEDGED_REQUESTS.inc(name, 'hedge' if task is backup else 'primary')
+                        return task.result()
+            HEDGED_REQUESTS.inc(name, 'none')
+            return first.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            # La tentative perdante ne doit pas laisser d'exception « jamais lue »
+            for task in (first, backup):
+                if task.done() and not task.cancelled():
+                    task.exception()
@@ -0,0 +1,217 @@
+"""
+Cycle de vie des torrents ajoutés par Frenchio dans qBittorrent
+
+Frenchio tient un registre des torrents qu'il a ajoutés (et de leur dernière
+lecture), arrête ceux qui ont assez partagé et supprime, données comprises,
+les moins récemment lus quand un budget (espace disque, espace libre, nombre
+de torrents) est dépassé. Les torrents ajoutés à la main ne sont jamais touchés.
+"""
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+
+# États d'un torrent déjà arrêté (qBittorrent 4 : paused, 5 : stopped)
+STOPPED_STATES = ('pausedUP', 'stoppedUP', 'pausedDL', 'stoppedDL')
+
+
+class TorrentLifecycle:
+    """
+    Budgets (0 = pas de limite) :
+    - `max_bytes` : données sur disque des torrents Frenchio
+    - `min_free_bytes` : espace libre minimum signalé par qBittorrent
+    - `max_torrents` : nombre de torrents Frenchio
+    Politique de partage : un torrent terminé est arrêté dès que son ratio
+    atteint `seed_ratio` ou qu'il a partagé `seed_seconds`.
+    Un torrent lu il y a moins de `protect_seconds` n'est jamais supprimé.
+    """
+
+    def __init__(self, state_path, max_bytes=0, min_free_bytes=0, max_torrents=0,
+                 seed_ratio=0, seed_seconds=0, protect_seconds=1800, interval=300, min_spacing=10):
+        self.state_path = state_path
+        self.max_bytes = max_bytes
+        self.min_free_bytes = min_free_bytes
+        self.max_torrents = max_torrents
+        self.seed_ratio = seed_ratio
+        self.seed_seconds = seed_seconds
+        self.protect_seconds = protect_seconds
+        self.interval = interval
+        self.min_spacing = min_spacing
+        # instance -> {hash: {'added': ts, 'played': ts}}
+        self.ledger = {}
+        # instance -> empreinte calculée au dernier passage
+        self.footprint = {}
+        self._services = {}
+        self._dirty = False
+        self._wakeup = None
+        self._task = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                self.ledger = json.load(f)
+            logging.info(f"Lifecycle: {sum(len(e) for e in self.ledger.values())} torrents tracked")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.warning(f"Lifecycle: could not read {self.state_path}: {e}")
+
+    def _write(self, payload):
+        directory = os.path.dirname(self.state_path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(payload)
+            os.replace(tmp_path, self.state_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def record_added(self, qbit_service, info_hash):
+        """Torrent ajouté (ou relancé) par un resolve : déclenche un passage"""
+        self.touch(qbit_service, info_hash)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def touch(self, qbit_service, info_hash):
+        """Met à jour la date de dernière lecture"""
+        instance = qbit_service.instance_name
+        self._services[instance] = qbit_service
+        now = time.time()
+        entry = self.ledger.setdefault(instance, {}).setdefault(info_hash.lower(), {'added': now})
+        entry['played'] = now
+        self._dirty = True
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._dirty:
+            await asyncio.to_thread(self._write, json.dumps(self.ledger))
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            # Les identifiants ne sont connus qu'en mémoire : seules les instances
+            # vues depuis le démarrage sont entretenues
+            for instance, service in list(self._services.items()):
+                try:
+                    await self.sweep(instance, service)
+                except Exception as e:
+                    logging.warning(f"Lifecycle: sweep failed for {instance}: {e}")
+
+            if self._dirty:
+                self._dirty = False
+                try:
+                    await asyncio.to_thread(self._write, json.dumps(self.ledger))
+                except OSError as e:
+                    logging.warning(f"Lifecycle: could not save {self.state_path}: {e}")
+            await asyncio.sleep(self.min_spacing)
+
+    def _seeded_enough(self, torrent):
+        if torrent.get('amount_left', 1) != 0 or torrent.get('state') in STOPPED_STATES:
+            return False
+        if self.seed_ratio and torrent.get('ratio', 0) >= self.seed_ratio:
+            return True
+        return bool(self.seed_seconds) and torrent.get('seeding_time', 0) >= self.seed_seconds
+
+    def _select_evictions(self, entries, ours, free):
+        now = time.time()
+        used = sum(t.get('completed', 0) for t in ours.values())
+        count = len(ours)
+        evict = []
+        # Du moins récemment lu au plus récent
+        for h in sorted(ours, key=lambda h: entries[h].get('played', entries[h].get('added', 0))):
+            over = (
+                (self.max_bytes and used > self.max_bytes)
+                or (self.max_torrents and count > self.max_torrents)
+                or (self.min_free_bytes and free is not None and free < self.min_free_bytes)
+            )
+            if not over:
+                break
+            if now - entries[h].get('played', 0) < self.protect_seconds:
+                # Les suivants ont été lus encore plus récemment
+                break
+            size = ours[h].get('completed', 0)
+            evict.append(h)
+            used -= size
+            count -= 1
+            if free is not None:
+                free += size
+        return evict, used, count, free
+
+    async def sweep(self, instance, service):
+        """Applique la politique de partage et les budgets à une instance qBittorrent"""
+        snapshot = await asyncio.to_thread(service.watcher.snapshot, 10)
+        if snapshot is None:
+            return
+        torrents, server_state = snapshot
+        entries = self.ledger.setdefault(instance, {})
+
+        # Torrents supprimés en dehors de Frenchio
+        for h in [h for h in entries if h not in torrents]:
+            del entries[h]
+            self._dirty = True
+
+        ours = {h: torrents[h] for h in entries}
+        free = server_state.get('free_space_on_disk')
+        evict, used, count, free = self._select_evictions(entries, ours, free)
+        stop = [h for h, t in ours.items() if h not in evict and self._seeded_enough(t)]
+
+        client = service.client
+        if stop:
+            await asyncio.to_thread(client.torrents_stop, torrent_hashes=stop)
+            logging.info(f"Lifecycle: stopped {len(stop)} seeded torrents on {instance}")
+        if evict:
+            await asyncio.to_thread(client.torrents_delete, delete_files=True, torrent_hashes=evict)
+            for h in evict:
+                entries.pop(h, None)
+            self._dirty = True
+            logging.info(f"Lifecycle: evicted {len(evict)} torrents on {instance} ({used // 2**20} Mo kept)")
+
+        self.footprint[instance] = {
+            'torrents': count,
+            'bytes': used,
+            'free_space_on_disk': free,
+            'stopped': len(stop),
+            'evicted': len(evict),
+            'updated_at': int(time.time()),
+        }
+
+    def report(self):
+        """Empreinte actuelle, pour l'endpoint d'administration"""
+        return {
+            'budgets': {
+                'max_bytes': self.max_bytes,
+                'min_free_bytes': self.min_free_bytes,
+                'max_torrents': self.max_torrents,
+                'seed_ratio': self.seed_ratio,
+                'seed_seconds': self.seed_seconds,
+            },
+            'instances': {
+                instance: {
+                    'tracked': len(entries),
+                    'footprint': self.footprint.get(instance),
+                    'active': instance in self._services,
+                }
+                for instance, entries in self.ledger.items()
+            },
+        }
@@ -0,0 +1,105 @@
+"""
+Surveillance du retard de la boucle asyncio
+
+Une tâche met à jour un battement toutes les `interval` secondes et mesure
+son propre retard de réveil (histogramme et percentiles dans /metrics). Un
+thread de garde vérifie ce battement : si la boucle est bloquée depuis plus
+de `threshold` secondes, il capture la pile du thread de la boucle pendant le
+blocage, c'est-à-dire l'appel fautif, et la journalise (une fois par blocage,
+et au plus une fois par `log_every` secondes pour un même emplacement).
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+import metrics
+
+LOOP_STALLS = metrics.REGISTRY.counter(
+    'frenchio_event_loop_stalls_total', "Blocages de la boucle asyncio au-delà du seuil")
+
+
+class LoopMonitor:
+    def __init__(self, interval=0.1, threshold=0.1, log_every=60, window=3000):
+        self.interval = interval
+        self.threshold = threshold
+        self.log_every = log_every
+        # Derniers retards mesurés, pour les percentiles
+        self.samples = deque(maxlen=window)
+        self._beat = time.monotonic()
+        self._loop_thread = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._last_logged = {}
+        metrics.REGISTRY.computed(
+            'frenchio_event_loop_lag_quantile_seconds',
+            "Percentiles du retard de la boucle asyncio (fenêtre glissante)",
+            'gauge', ('quantile',), self._quantiles
+        )
+
+    def _quantiles(self):
+        samples = sorted(self.samples)
+        if not samples:
+            return []
+        return [((str(q),), samples[min(int(q * len(samples)), len(samples) - 1)]) for q in (0.5, 0.95, 0.99)]
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    async def _heartbeat(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(time.perf_counter() - start - self.interval, 0.0)
+            self._beat = time.monotonic()
+            self.samples.append(lag)
+            metrics.LOOP_LAG.observe(lag)
+            if lag >= self.threshold:
+                LOOP_STALLS.inc()
+
+    def _watch(self):
+        reported = False
+        while not self._stop.wait(self.interval):
+            stalled = time.monotonic() - self._beat - self.interval
+            if stalled < self.threshold:
+                reported = False
+                continue
+            if reported:
+                continue
+            # Un seul relevé par blocage, pris pendant que la boucle est encore bloquée
+            reported = True
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                self._report(stalled, traceback.extract_stack(frame))
+
+    def _report(self, stalled, stack):
+        # Emplacement = les trois frames les plus profondes
+        location = tuple((f.filename, f.lineno) for f in stack[-3:])
+        now = time.monotonic()
+        if now - self._last_logged.get(location, -self.log_every) < self.log_every:
+            return
+        if len(self._last_logged) > 256:
+            self._last_logged.clear()
+        self._last_logged[location] = now
+        logging.warning(
+            f"Event loop blocked for {stalled * 1000:.0f}+ ms, running:\n"
+            + ''.join(traceback.format_list(stack[-15:]))
+        )
+
+    async def close(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
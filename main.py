@@ -19,13 +19,20 @@ License: MIT
 Repository: https://github.com/aymene69/frenchio
 """
 
-import base64
+import hmac
 import json
 import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import urllib.parse
 import logging
-import aiohttp
+import timing
+import upstream
+import replay
 from aiohttp import web
-import aiofiles
 import asyncio
 from services.tmdb import TMDBService
 from services.unit3d import Unit3DService
@@ -33,10 +40,28 @@ from services.alldebrid import AllDebridService
 from services.torbox import TorBoxService
 from services.debridlink import DebridLinkService
 from services.sharewood import SharewoodService
-from services.ygg import YggService
-from services.abn import ABNService
+from services.ygg import YggService, MirrorPool, use_mirrors
+from services.abn import ABNService, ABN_URL
 from services.qbittorrent import QBittorrentService
-from utils import format_size, parse_torrent_name, check_season_episode
+from utils import format_size, parse_torrent_name, filter_torrents
+from cache import ResolveCache, TTLCache, TorrentFileCache, key_digest, is_info_hash
+from prefetch import BackgroundRunner, PrefetchQueue
+from playback import PlayRegistry, resolve_path, serve_partial
+from lifecycle import TorrentLifecycle
+from timing import stage
+import metrics
+from loopmon import LoopMonitor
+from profiling import RequestProfiler, render_text, render_pstats
+from torrent import parse_torrent, TorrentParseError
+from breaker import BreakerRegistry
+from configstore import ConfigStore
+from instances import ServiceRegistry
+from prerendered import PrerenderedResponse, conditional_response
+import configstore
+from latency import LatencyTracker
+from sharedstore import SharedStore
+from cachebackends import MemoryBackend, SqliteBackend, RedisBackend
+import workers
 
 # Configuration du logging
 logging.basicConfig(
@@ -55,6 +80,49 @@ if HTTP_PROXY or HTTPS_PROXY:
     if HTTPS_PROXY:
         logging.info(f"  HTTPS_PROXY: {HTTPS_PROXY}")
 
+# Enregistrement / rejeu des échanges avec les services externes (record | replay)
+UPSTREAM_MODE = os.getenv('UPSTREAM_MODE', '').lower()
+if UPSTREAM_MODE:
+    upstream.use_corpus(
+        UPSTREAM_MODE,
+        os.getenv('UPSTREAM_CORPUS', 'upstream-corpus'),
+        speed=float(os.getenv('UPSTREAM_REPLAY_SPEED', '1'))
+    )
+
+# Disjoncteurs par service externe : un service en panne est coupé au lieu de faire attendre chaque recherche
+BREAKERS = None
+if os.getenv('BREAKER_ENABLE', 'true').lower() == 'true':
+    BREAKERS = BreakerRegistry(
+        window=float(os.getenv('BREAKER_WINDOW', '60')),
+        min_calls=int(os.getenv('BREAKER_MIN_CALLS', '5')),
+        failure_ratio=float(os.getenv('BREAKER_FAILURE_RATIO', '0.5')),
+        slow_call=float(os.getenv('BREAKER_SLOW_CALL', '10')),
+        open_for=float(os.getenv('BREAKER_OPEN_SECONDS', '30')),
+        max_open_for=float(os.getenv('BREAKER_MAX_OPEN_SECONDS', '300'))
+    )
+    upstream.use_breakers(BREAKERS)
+
+# Timeouts adaptatifs (p99 observé par service) et hedging des GET idempotents (TMDB, détails YGG, UNIT3D)
+if os.getenv('ADAPTIVE_TIMEOUT', 'true').lower() == 'true':
+    upstream.use_latency(LatencyTracker(
+        factor=float(os.getenv('TIMEOUT_P99_FACTOR', '3')),
+        floor=float(os.getenv('TIMEOUT_MIN', '1')),
+        min_samples=int(os.getenv('TIMEOUT_MIN_SAMPLES', '20')),
+        hedge=os.getenv('HEDGE_ENABLE', 'true').lower() == 'true',
+        hedge_ratio=float(os.getenv('HEDGE_RATIO', '0.05')),
+        hedge_burst=float(os.getenv('HEDGE_BURST', '10'))
+    ))
+
+# Miroirs de l'API YGG (séparés par des virgules) : le plus rapide en bonne santé reçoit les recherches
+YGG_MIRRORS = None
+if os.getenv('YGG_URLS'):
+    YGG_MIRRORS = MirrorPool(
+        [url.strip() for url in os.getenv('YGG_URLS').split(',') if url.strip()],
+        probe_interval=float(os.getenv('YGG_PROBE_INTERVAL', '30')),
+        hedge=os.getenv('YGG_HEDGE', 'true').lower() == 'true'
+    )
+    use_mirrors(YGG_MIRRORS)
+
 # Version de l'application
 APP_VERSION = "1.2.0"
 
@@ -68,6 +136,12 @@ STREMIO_ADDONS_CONFIG = {
 QBITTORRENT_ENABLE = os.getenv('QBITTORRENT_ENABLE', 'true').lower() in ('true', '1', 'yes')
 MANIFEST_TITLE_SUFFIX = os.getenv('MANIFEST_TITLE_SUFFIX', '')
 MANIFEST_BLURB = os.getenv('MANIFEST_BLURB', '')
+# Durée de cache (s) du manifest et de la page de configuration, revalidés ensuite par ETag
+STATIC_MAX_AGE = int(os.getenv('STATIC_MAX_AGE', '300'))
+# Cache HTTP des réponses /stream : la durée croît avec la part de résultats cachés chez le débrideur
+STREAM_MAX_AGE = int(os.getenv('STREAM_MAX_AGE', '600'))
+STREAM_EMPTY_MAX_AGE = int(os.getenv('STREAM_EMPTY_MAX_AGE', '60'))
+STREAM_STALE_WHILE_REVALIDATE = int(os.getenv('STREAM_STALE_WHILE_REVALIDATE', '900'))
 
 logging.info(f"qBittorrent enabled: {QBITTORRENT_ENABLE}")
 if MANIFEST_TITLE_SUFFIX:
@@ -75,10 +149,322 @@ if MANIFEST_TITLE_SUFFIX:
 if MANIFEST_BLURB:
     logging.info(f"Manifest blurb configured")
 
+# Cache partagé, second niveau des caches TMDB, recherches, disponibilité et liens résolus :
+# sqlite (workers d'une même machine, SHARED_STORE_PATH), redis (plusieurs machines, REDIS_URL),
+# memory (processus seul). Sans CACHE_BACKEND : sqlite si SHARED_STORE_PATH est défini (le superviseur
+# multi-workers le fixe pour ses workers), sinon pas de cache partagé.
+WORKERS = int(os.getenv('WORKERS', '1'))
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', '').lower() or ('sqlite' if os.getenv('SHARED_STORE_PATH') else '')
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_MB', '256')) * 1024 * 1024
+SHARED_STORE = None
+if CACHE_BACKEND and workers.worker_id() != workers.SUPERVISOR:
+    try:
+        if CACHE_BACKEND == 'sqlite':
+            backend = SqliteBackend(os.getenv('SHARED_STORE_PATH') or 'data/cache.db', max_bytes=CACHE_MAX_BYTES)
+            logging.info(f"Shared cache: SQLite {backend.path}")
+        elif CACHE_BACKEND == 'redis':
+            backend = RedisBackend(os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+                                   timeout=float(os.getenv('REDIS_TIMEOUT', '2')))
+            logging.info(f"Shared cache: Redis {backend.host}:{backend.port}/{backend.db}")
+        elif CACHE_BACKEND == 'memory':
+            backend = MemoryBackend(max_bytes=CACHE_MAX_BYTES)
+            logging.info("Shared cache: in-process memory")
+        else:
+            raise ValueError(f"unknown CACHE_BACKEND {CACHE_BACKEND!r}")
+        SHARED_STORE = SharedStore(backend)
+    except (OSError, sqlite3.Error, ValueError) as e:
+        logging.error(f"Shared cache disabled: {e}")
+
+def shared_namespace(name, value_type):
+    """Espace de noms typé du cache partagé, None sans cache partagé"""
+    return SHARED_STORE.namespace(name, value_type) if SHARED_STORE else None
+
+# Cache des liens résolus (0 pour désactiver)
+RESOLVE_CACHE_SIZE = int(os.getenv('RESOLVE_CACHE_SIZE', '2048'))
+RESOLVE_CACHE_VALIDATE_AFTER = int(os.getenv('RESOLVE_CACHE_VALIDATE_AFTER', '60'))
+
+# Durée de vie des liens directs chez chaque provider (secondes)
+RESOLVE_LINK_TTLS = {
+    "alldebrid": int(os.getenv('RESOLVE_TTL_ALLDEBRID', '21600')),
+    "torbox": int(os.getenv('RESOLVE_TTL_TORBOX', '10800')),
+    "debridlink": int(os.getenv('RESOLVE_TTL_DEBRIDLINK', '21600')),
+}
+
+RESOLVE_CACHE = None
+if RESOLVE_CACHE_SIZE > 0:
+    RESOLVE_CACHE = ResolveCache(
+        RESOLVE_LINK_TTLS,
+        max_entries=RESOLVE_CACHE_SIZE,
+        validate_after=RESOLVE_CACHE_VALIDATE_AFTER,
+        shared=shared_namespace("resolve", str)
+    )
+    logging.info(f"Resolve cache enabled ({RESOLVE_CACHE_SIZE} entries)")
+
+# Pré-résolution spéculative des meilleurs streams cachés (0 = désactivé)
+PRERESOLVE_TOP = int(os.getenv('PRERESOLVE_TOP', '0'))
+PRERESOLVE_PER_USER = int(os.getenv('PRERESOLVE_PER_USER', '1'))
+
+if PRERESOLVE_TOP > 0 and not RESOLVE_CACHE:
+    logging.warning("PRERESOLVE_TOP ignored: resolve cache is disabled")
+    PRERESOLVE_TOP = 0
+elif PRERESOLVE_TOP > 0:
+    logging.info(f"Speculative pre-resolution enabled (top {PRERESOLVE_TOP})")
+
+BACKGROUND = BackgroundRunner(per_user=PRERESOLVE_PER_USER, max_pending=max(PRERESOLVE_TOP, 1) * 2)
+
+# Caches des appels amont (secondes)
+# (tmdb : (tmdb_id, media_info) ; search : torrents avec leurs info hashes ; availability : un booléen par hash)
+TMDB_CACHE = TTLCache("tmdb", int(os.getenv('TMDB_CACHE_TTL', '86400')), max_entries=4096,
+                      shared=shared_namespace("tmdb", tuple))
+SEARCH_CACHE = TTLCache("search", int(os.getenv('SEARCH_CACHE_TTL', '900')), max_entries=2048,
+                        shared=shared_namespace("search", list))
+AVAILABILITY_CACHE = TTLCache("availability", int(os.getenv('AVAILABILITY_CACHE_TTL', '600')), max_entries=65536,
+                              shared=shared_namespace("availability", bool))
+# Configs décodées (par jeton ou chaîne base64 de l'URL)
+CONFIG_CACHE = TTLCache("config", int(os.getenv('CONFIG_CACHE_TTL', '3600')),
+                        max_entries=int(os.getenv('CONFIG_CACHE_SIZE', '1024')))
+
+# Instances de services (sessions ABN, logins qBittorrent...) réutilisées entre requêtes ; 0 = une par requête
+SERVICES = ServiceRegistry(
+    ttl=float(os.getenv('SERVICE_CACHE_TTL', '600')),
+    max_entries=int(os.getenv('SERVICE_CACHE_SIZE', '256'))
+)
+
+# Stockage des configs côté serveur : URL d'installation courtes (/c_<jeton>/manifest.json), vide = désactivé
+CONFIG_STORE = None
+if os.getenv('CONFIG_STORE_PATH'):
+    try:
+        CONFIG_STORE = ConfigStore(
+            os.getenv('CONFIG_STORE_PATH'),
+            secret=os.getenv('CONFIG_STORE_SECRET') or None,
+            max_entries=int(os.getenv('CONFIG_STORE_MAX_ENTRIES', '50000')),
+            max_bytes=int(os.getenv('CONFIG_STORE_MAX_MB', '64')) * 1024 * 1024
+        )
+        logging.info(f"Config store: {CONFIG_STORE.path}")
+    except (OSError, sqlite3.Error) as e:
+        logging.error(f"Config store disabled: {e}")
+
+# Préchargement de l'épisode suivant (opt-in)
+PREFETCH_NEXT_EPISODE = os.getenv('PREFETCH_NEXT_EPISODE', 'false').lower() in ('true', '1', 'yes')
+PREFETCH_MAX_INFLIGHT = int(os.getenv('PREFETCH_MAX_INFLIGHT', '8'))
+
+# Recherches et resolves en cours (sert à suspendre le préchargement sous charge) ; ni les
+# lectures /play, qui durent des heures, ni /metrics et l'administration (voir LOAD_HANDLERS)
+INFLIGHT_REQUESTS = 0
+
+PREFETCH = PrefetchQueue(
+    workers=int(os.getenv('PREFETCH_WORKERS', '2')),
+    user_budget=int(os.getenv('PREFETCH_USER_BUDGET', '20')),
+    global_budget=int(os.getenv('PREFETCH_GLOBAL_BUDGET', '200')),
+    is_busy=lambda: INFLIGHT_REQUESTS > PREFETCH_MAX_INFLIGHT
+)
+if PREFETCH_NEXT_EPISODE:
+    logging.info("Next-episode prefetch enabled")
+
+# Attente des premières pièces avant de rediriger vers un stream qBittorrent (0 = pas d'attente)
+QBIT_READY_TIMEOUT = float(os.getenv('QBIT_READY_TIMEOUT', '20'))
+QBIT_READY_BUFFER_MB = int(os.getenv('QBIT_READY_BUFFER_MB', '16'))
+QBIT_READY_TAIL_MB = int(os.getenv('QBIT_READY_TAIL_MB', '1'))
+
+# Lecture directe des téléchargements qBittorrent via /play (vide = redirection vers public_url)
+PLAY_DOWNLOAD_DIR = os.getenv('PLAY_DOWNLOAD_DIR', '')
+PLAY_READ_TIMEOUT = float(os.getenv('PLAY_READ_TIMEOUT', '60'))
+PLAY_REGISTRY = PlayRegistry(shared=shared_namespace("play", tuple)) if PLAY_DOWNLOAD_DIR else None
+if PLAY_REGISTRY:
+    logging.info(f"Built-in playback enabled: {PLAY_DOWNLOAD_DIR}")
+
+# Cycle de vie des torrents ajoutés par Frenchio (0 = pas de limite)
+QBIT_MAX_DISK_GB = float(os.getenv('QBIT_MAX_DISK_GB', '0'))
+QBIT_MIN_FREE_GB = float(os.getenv('QBIT_MIN_FREE_GB', '0'))
+QBIT_MAX_TORRENTS = int(os.getenv('QBIT_MAX_TORRENTS', '0'))
+QBIT_SEED_RATIO = float(os.getenv('QBIT_SEED_RATIO', '0'))
+QBIT_SEED_MINUTES = float(os.getenv('QBIT_SEED_MINUTES', '0'))
+
+LIFECYCLE = None
+QBIT_LIFECYCLE_LIMITS = QBIT_MAX_DISK_GB or QBIT_MIN_FREE_GB or QBIT_MAX_TORRENTS or QBIT_SEED_RATIO or QBIT_SEED_MINUTES
+if QBIT_LIFECYCLE_LIMITS and WORKERS > 1:
+    # Registre, budgets et dates de lecture sont propres au processus : N gestionnaires
+    # écraseraient le même fichier et pourraient supprimer un torrent lu par un autre worker
+    logging.error("qBittorrent lifecycle manager disabled: QBIT_MAX_DISK_GB / QBIT_MIN_FREE_GB / "
+                  "QBIT_MAX_TORRENTS / QBIT_SEED_* are not supported with WORKERS > 1")
+elif QBIT_LIFECYCLE_LIMITS:
+    LIFECYCLE = TorrentLifecycle(
+        state_path=os.getenv('QBIT_LIFECYCLE_STATE', os.path.join(tempfile.gettempdir(), 'frenchio-lifecycle.json')),
+        max_bytes=int(QBIT_MAX_DISK_GB * 1024 ** 3),
+        min_free_bytes=int(QBIT_MIN_FREE_GB * 1024 ** 3),
+        max_torrents=QBIT_MAX_TORRENTS,
+        seed_ratio=QBIT_SEED_RATIO,
+        seed_seconds=QBIT_SEED_MINUTES * 60,
+        protect_seconds=float(os.getenv('QBIT_PROTECT_MINUTES', '30')) * 60,
+        interval=float(os.getenv('QBIT_LIFECYCLE_INTERVAL', '300'))
+    )
+    logging.info("qBittorrent lifecycle manager enabled")
+
+# Jeton des endpoints d'administration (/admin/...), désactivés si vide
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+# Cache disque des fichiers .torrent (0 Mo pour désactiver)
+TORRENT_CACHE_DIR = os.getenv('TORRENT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'frenchio-torrents'))
+TORRENT_CACHE_MAX_MB = int(os.getenv('TORRENT_CACHE_MAX_MB', '256'))
+# Nombre de .torrent téléchargés à l'avance quand des résultats qBittorrent sont affichés
+TORRENT_CACHE_PREFETCH = int(os.getenv('TORRENT_CACHE_PREFETCH', '0'))
+
+TORRENT_CACHE = None
+if TORRENT_CACHE_MAX_MB > 0:
+    try:
+        TORRENT_CACHE = TorrentFileCache(TORRENT_CACHE_DIR, TORRENT_CACHE_MAX_MB * 1024 * 1024)
+        logging.info(f"Torrent file cache: {TORRENT_CACHE_DIR} ({TORRENT_CACHE_MAX_MB} Mo)")
+    except OSError as e:
+        logging.error(f"Torrent file cache disabled: {e}")
+
+# Chronométrage des requêtes (en-tête Server-Timing + une ligne de log par requête)
+TIMING_ENABLE = os.getenv('TIMING_ENABLE', 'true').lower() == 'true'
+# Proportion de requêtes dont la trace complète (chaque appel) est journalisée
+TIMING_TRACE_SAMPLE = float(os.getenv('TIMING_TRACE_SAMPLE', '0'))
+
+# Endpoint /metrics (format Prometheus), protégé par ADMIN_TOKEN si défini
+METRICS_ENABLE = os.getenv('METRICS_ENABLE', 'false').lower() == 'true'
+
+metrics.register_caches(lambda: [
+    (name, cache) for name, cache in (
+        ("resolve", RESOLVE_CACHE),
+        ("tmdb", TMDB_CACHE),
+        ("search", SEARCH_CACHE),
+        ("availability", AVAILABILITY_CACHE),
+        ("config", CONFIG_CACHE),
+        ("services", SERVICES),
+        ("configure_page", CONFIGURE_PAGES),
+        ("torrent_file", TORRENT_CACHE),
+    ) if cache is not None
+])
+
+# Surveillance de la boucle asyncio : la pile de tout appel qui la bloque plus que le seuil est journalisée
+LOOP_MONITOR = None
+if os.getenv('LOOP_MONITOR', 'true').lower() == 'true':
+    LOOP_MONITOR = LoopMonitor(
+        threshold=float(os.getenv('LOOP_LAG_THRESHOLD_MS', '100')) / 1000,
+        log_every=float(os.getenv('LOOP_LAG_LOG_INTERVAL', '60'))
+    )
+
+# Profilage des recherches de streams : à la demande (en-tête X-Frenchio-Profile: <ADMIN_TOKEN>)
+# ou sur une proportion des requêtes ; profils consultables sur /admin/profiles
+PROFILE_SAMPLE = float(os.getenv('PROFILE_SAMPLE', '0'))
+PROFILER = RequestProfiler(keep=int(os.getenv('PROFILE_KEEP', '100')))
+
+# Clé API de chaque service de débridage dans la config utilisateur
+DEBRID_KEYS = {
+    "alldebrid": "alldebrid_key",
+    "torbox": "torbox_key",
+    "debridlink": "debridlink_key",
+}
+
 # ============================================================================
 # Middleware
 # ============================================================================
 
+@web.middleware
+async def inflight_middleware(request, handler):
+    """Compte les recherches et resolves en cours pour mesurer la charge"""
+    global INFLIGHT_REQUESTS
+    if request.match_info.handler not in LOAD_HANDLERS:
+        return await handler(request)
+    INFLIGHT_REQUESTS += 1
+    try:
+        return await handler(request)
+    finally:
+        INFLIGHT_REQUESTS -= 1
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    """Durée des requêtes par route et statut"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        route = request.match_info.route.resource
+        metrics.HTTP_REQUESTS.observe(
+            time.perf_counter() - start, route.canonical if route else "unmatched", str(status)
+        )
+
+@web.middleware
+async def timing_middleware(request, handler):
+    """Chronomètre la requête : en-tête Server-Timing et log structuré"""
+    if not TIMING_ENABLE:
+        return await handler(request)
+
+    request_timing, token = timing.begin(trace=TIMING_TRACE_SAMPLE > 0 and random.random() < TIMING_TRACE_SAMPLE)
+    response = None
+    try:
+        response = await handler(request)
+        return response
+    except web.HTTPException as e:
+        # Les redirections de handle_resolve passent par ici
+        response = e
+        raise
+    finally:
+        timing.end(request_timing, token)
+        total = request_timing.total()
+        if response is not None and not response.prepared:
+            response.headers['Server-Timing'] = request_timing.header(total)
+        # Route et non chemin : l'URL contient la config encodée (clés API)
+        route = request.match_info.route.resource
+        record = {
+            "route": route.canonical if route else request.path,
+            "status": response.status if response is not None else 500,
+            "total_ms": round(total * 1000, 1),
+            "stages": request_timing.summary(),
+        }
+        if request_timing.trace is not None:
+            record["trace"] = request_timing.trace
+        logging.info(f"timing {json.dumps(record)}")
+
+@web.middleware
+async def profile_middleware(request, handler):
+    """Profile les recherches de streams demandées par l'administrateur ou échantillonnées"""
+    route = request.match_info.route.resource
+    if route is None or not route.canonical.endswith('/stream/{type}/{id}.json'):
+        return await handler(request)
+
+    requested = request.headers.get('X-Frenchio-Profile')
+    if requested is not None:
+        if not admin_token_ok(requested):
+            raise web.HTTPUnauthorized()
+    elif not (PROFILE_SAMPLE > 0 and random.random() < PROFILE_SAMPLE):
+        return await handler(request)
+
+    if PROFILER.busy:
+        return await handler(request)
+
+    # Libellé sans la config encodée (clés API)
+    label = f"stream {request.match_info.get('type')} {request.match_info.get('id')}"
+    response, profile_id = await PROFILER.run(label, handler, request)
+    response.headers['X-Frenchio-Profile-Id'] = str(profile_id)
+    return response
+
+@web.middleware
+async def corpus_middleware(request, handler):
+    """
+    UPSTREAM_MODE=record|replay : les secrets de la config sont masqués dans tous les
+    échanges amont de la requête ; en enregistrement, chaque recherche ou resolve reçu est journalisé
+    """
+    config_str = request.match_info.get('config')
+    config = await load_config(config_str)
+    if not config:
+        return await handler(request)
+    if upstream.recording() and (request.match_info.get('type') or request.match_info.get('service')):
+        await upstream.record_inbound(request.path_qs[len(config_str) + 1:], config)
+    token = replay.use_config(config)
+    try:
+        return await handler(request)
+    finally:
+        replay.reset_config(token)
+
 @web.middleware
 async def cors_middleware(request, handler):
     """
@@ -97,6 +483,29 @@ async def cors_middleware(request, handler):
 # Configuration Handlers
 # ============================================================================
 
+def render_configure(prefill_data="{}"):
+    """Page de configuration avec les valeurs du serveur (et une config pré-remplie)"""
+    content = CONFIGURE_TEMPLATE
+
+    # Injection de la config pré-remplie dans le JS
+    # On cherche une balise script ou on l'ajoute
+    # Le plus simple : remplacer une variable placeholder
+    content = content.replace('const prefillConfig = {};', f'const prefillConfig = {prefill_data};')
+
+    # Injection de la variable QBITTORRENT_ENABLE
+    qbit_enabled_js = 'true' if QBITTORRENT_ENABLE else 'false'
+    content = content.replace('const qbittorrentEnabled = true;', f'const qbittorrentEnabled = {qbit_enabled_js};')
+    content = content.replace('const configStoreEnabled = false;',
+                              f'const configStoreEnabled = {"true" if CONFIG_STORE else "false"};')
+
+    # Injection du blurb personnalisé (échappé pour JavaScript)
+    blurb_escaped = json.dumps(MANIFEST_BLURB) if MANIFEST_BLURB else '""'
+    content = content.replace('const manifestBlurb = "";', f'const manifestBlurb = {blurb_escaped};')
+
+    # Injection de la version de l'application
+    content = content.replace('const appVersion = "1.1.0";', f'const appVersion = "{APP_VERSION}";')
+    return content
+
 async def handle_configure(request):
     """
     Serve the configuration page with optional pre-filled values.
@@ -104,6 +513,9 @@ async def handle_configure(request):
     The configuration page allows users to input their API keys and tracker
     credentials. If a config string is provided in the URL, it will be decoded
     and used to pre-fill the form fields.
+
+    The page is rendered once at startup (and once per pre-filled config) and
+    served with ETag / Last-Modified, compressed variants and 304 responses.
     
     Args:
         request: aiohttp request object containing optional config parameter
@@ -111,65 +523,80 @@ async def handle_configure(request):
     Returns:
         web.Response: HTML configuration page
     """
+    if CONFIGURE_PAGE is None:
+        return web.Response(text=CONFIGURE_ERROR, status=500)
+
     config_str = request.match_info.get('config', '')
-    prefill_data = "{}"
-    
+    decoded = None
     if config_str:
         try:
             # On tente de décoder si une config est passée dans l'URL
-            decoded = decode_config(config_str)
-            if decoded:
-                prefill_data = json.dumps(decoded)
-        except:
+            decoded = await load_config(config_str)
+        except Exception:
             pass
+    if not decoded:
+        return CONFIGURE_PAGE.respond(request)
 
-    try:
-        async with aiofiles.open('templates/configure.html', mode='r') as f:
-            content = await f.read()
-        
-        # Injection de la config pré-remplie dans le JS
-        # On cherche une balise script ou on l'ajoute
-        # Le plus simple : remplacer une variable placeholder
-        content = content.replace('const prefillConfig = {};', f'const prefillConfig = {prefill_data};')
-        
-        # Injection de la variable QBITTORRENT_ENABLE
-        qbit_enabled_js = 'true' if QBITTORRENT_ENABLE else 'false'
-        content = content.replace('const qbittorrentEnabled = true;', f'const qbittorrentEnabled = {qbit_enabled_js};')
-        
-        # Injection du blurb personnalisé (échappé pour JavaScript)
-        blurb_escaped = json.dumps(MANIFEST_BLURB) if MANIFEST_BLURB else '""'
-        content = content.replace('const manifestBlurb = "";', f'const manifestBlurb = {blurb_escaped};')
-        
-        # Injection de la version de l'application
-        content = content.replace('const appVersion = "1.1.0";', f'const appVersion = "{APP_VERSION}";')
-        
-        return web.Response(text=content, content_type='text/html')
-    except Exception as e:
-        return web.Response(text=str(e), status=500)
+    # La page pré-remplie contient les clés : jamais en cache partagé, revalidée à chaque affichage
+    page = CONFIGURE_PAGES.get(decoded.digest)
+    if page is None:
+        page = PrerenderedResponse(render_configure(decoded.canonical), 'text/html', 'private, no-cache')
+        CONFIGURE_PAGES.set(decoded.digest, page)
+    return page.respond(request)
 
-def decode_config(config_str):
-    try:
-        decoded = base64.b64decode(config_str).decode('utf-8')
-        return json.loads(decoded)
-    except Exception as e:
-        logging.error(f"Config Decode Error: {e}")
+async def load_config(config_str):
+    """
+    Config de l'URL (jeton du ConfigStore ou JSON base64), décodée et gelée une
+    seule fois puis servie depuis le cache ; None si invalide ou inconnue
+    """
+    if not config_str:
         return None
+    if configstore.is_token(config_str):
+        if CONFIG_STORE is None:
+            return None
+        loader = lambda: asyncio.to_thread(CONFIG_STORE.get, config_str)
+        config = await CONFIG_CACHE.get_or_load(config_str, loader)
+        # Servie depuis le cache : la date d'utilisation (éviction) est écrite de temps en temps
+        if config and CONFIG_STORE.touch_due(config_str):
+            await asyncio.to_thread(CONFIG_STORE.touch, config_str)
+        return config
 
-async def handle_manifest(request):
-    """Retourne le manifest de l'addon"""
-    config_str = request.match_info.get('config', '')
-    config = decode_config(config_str)
-    
+    async def loader():
+        return configstore.decode(config_str)
+    return await CONFIG_CACHE.get_or_load(config_str, loader)
+
+async def handle_config_save(request):
+    """Enregistre la config envoyée par la page de configuration et retourne son jeton"""
+    if CONFIG_STORE is None:
+        raise web.HTTPNotFound()
+    if request.content_length and request.content_length > configstore.MAX_CONFIG_BYTES:
+        raise web.HTTPRequestEntityTooLarge(configstore.MAX_CONFIG_BYTES, request.content_length)
+    try:
+        config = configstore.UserConfig.parse(json.loads(await request.read()))
+    except ValueError:
+        config = None
     if not config:
-        return web.Response(status=400, text="Invalid Config")
+        return web.json_response({'error': 'invalid config'}, status=400)
+    # Non authentifié : seules les configs produites par la page de configuration sont stockées
+    error = configstore.check_fields(config)
+    if error:
+        return web.json_response({'error': error}, status=400)
+    token = await asyncio.to_thread(CONFIG_STORE.put, config)
+    CONFIG_CACHE.set(token, config)
+    return web.json_response({'token': token})
 
+def build_manifest(configured):
+    """Manifest de l'addon : il ne dépend que de l'environnement, pas de la config de l'URL"""
     # Construction du nom de l'addon avec suffixe optionnel
     addon_name = "Frenchio"
     if MANIFEST_TITLE_SUFFIX:
         addon_name += f" {MANIFEST_TITLE_SUFFIX}"
-    
-    # Description de base (le blurb s'affiche dans la page de config)
-    description = "Stream from French Trackers (UNIT3D, Sharewood, YGG, ABN) via AllDebrid, TorBox, DebridLink ou qBittorrent"
+
+    if configured:
+        # Description de base (le blurb s'affiche dans la page de config)
+        description = "Stream from French Trackers (UNIT3D, Sharewood, YGG, ABN) via AllDebrid, TorBox, DebridLink ou qBittorrent"
+    else:
+        description = "Addon non configuré : allez sur /configure pour générer votre lien d'installation."
 
     manifest = {
         "id": "community.aymene69.frenchio",
@@ -180,42 +607,46 @@ async def handle_manifest(request):
         "stremioAddonsConfig": STREMIO_ADDONS_CONFIG,
         "types": ["movie", "series"],
         "catalogs": [],
+        # Sans config, on garde stream pour que Stremio le reconnaisse, mais ça ne renverra rien.
         "resources": ["stream"],
         # "idPrefixes": ["tt"], # Supprimé car inutile si catalogs vide
         "behaviorHints": {
             "configurable": True,
         }
     }
-    return web.json_response(manifest)
+    if not configured:
+        manifest["behaviorHints"]["configurationRequired"] = True
+    return manifest
+
+async def handle_manifest(request):
+    """Retourne le manifest de l'addon"""
+    config_str = request.match_info.get('config', '')
+    config = await load_config(config_str)
+    
+    if not config:
+        return web.Response(status=400, text="Invalid Config")
+    return MANIFEST.respond(request)
 
 async def handle_manifest_no_config(request):
     """
     Manifest sans configuration (route /manifest.json).
     Utile quand quelqu'un tente d'installer l'addon sans passer par /configure.
+    C'est aussi la route du healthcheck Docker : réponse entièrement précalculée.
     """
-    addon_name = "Frenchio"
-    if MANIFEST_TITLE_SUFFIX:
-        addon_name += f" {MANIFEST_TITLE_SUFFIX}"
+    return MANIFEST_NO_CONFIG.respond(request)
 
-    description = "Addon non configuré : allez sur /configure pour générer votre lien d'installation."
-
-    manifest = {
-        "id": "community.aymene69.frenchio",
-        "version": APP_VERSION,
-        "name": addon_name,
-        "description": description,
-        "icon": "https://i.imgur.com/MgdGxnR.png",
-        "stremioAddonsConfig": STREMIO_ADDONS_CONFIG,
-        "types": ["movie", "series"],
-        "catalogs": [],
-        # On garde stream pour que Stremio le reconnaisse, mais sans config ça ne renverra rien.
-        "resources": ["stream"],
-        "behaviorHints": {
-            "configurable": True,
-            "configurationRequired": True
-        }
-    }
-    return web.json_response(manifest)
+# Réponses précalculées au démarrage (l'URL d'une config contient des clés : pas de cache partagé)
+MANIFEST = PrerenderedResponse.json(build_manifest(True), f'private, max-age={STATIC_MAX_AGE}')
+MANIFEST_NO_CONFIG = PrerenderedResponse.json(build_manifest(False), f'public, max-age={STATIC_MAX_AGE}')
+try:
+    with open('templates/configure.html', encoding='utf-8') as f:
+        CONFIGURE_TEMPLATE = f.read()
+    CONFIGURE_PAGE = PrerenderedResponse(render_configure(), 'text/html', f'public, max-age={STATIC_MAX_AGE}')
+except OSError as e:
+    logging.error(f"Configure page unavailable: {e}")
+    CONFIGURE_PAGE, CONFIGURE_ERROR = None, str(e)
+# Pages pré-remplies, par empreinte de config
+CONFIGURE_PAGES = TTLCache("configure_page", 3600, max_entries=256)
 
 async def handle_stream_no_config(request):
     """
@@ -234,270 +665,323 @@ async def handle_stream_no_config(request):
         }]
     })
 
-async def handle_stream(request):
-    """Gère la recherche de streams"""
-    config_str = request.match_info.get('config', '')
-    config = decode_config(config_str)
-    if not config:
-        return web.json_response({"streams": []})
+DEBRID_SERVICES = {
+    "alldebrid": AllDebridService,
+    "torbox": TorBoxService,
+    "debridlink": DebridLinkService,
+}
 
-    stream_type = request.match_info.get('type')
-    stream_id = request.match_info.get('id')
+def debrid_service_for(provider, api_key):
+    """Instance partagée du service de débridage `provider` pour cette clé"""
+    return SERVICES.get(provider, api_key, lambda: DEBRID_SERVICES[provider](api_key))
 
-    # Parsing ID (tt1234567 ou tt1234567:1:2)
-    imdb_id = stream_id
-    season = None
-    episode = None
-    
-    if ":" in stream_id:
-        parts = stream_id.split(":")
-        imdb_id = parts[0]
-        season = int(parts[1])
-        episode = int(parts[2])
+def tmdb_service_for(config):
+    return SERVICES.get("tmdb", config['tmdb_key'], lambda: TMDBService(config['tmdb_key']))
 
-    logging.info(f"Searching for {stream_type} {imdb_id} S{season}E{episode}")
+async def qbittorrent_service_for(qbit_config):
+    """
+    Instance partagée du qBittorrent de la config : client créé, connecté et
+    testé une fois (librairie synchrone : hors de la boucle), puis réutilisé
+    """
+    async def create():
+        service = QBittorrentService(
+            host=qbit_config['host'],
+            username=qbit_config.get('username', ''),
+            password=qbit_config.get('password', ''),
+            public_url_base=qbit_config['public_url']
+        )
+        logging.info("qBittorrent service initialized")
+        try:
+            await asyncio.to_thread(service.test_connection)
+        except Exception as e:
+            logging.error(f"qBittorrent test failed: {e}")
+        return service
 
-    # Initialisation des services
-    tmdb_service = TMDBService(config['tmdb_key'])
-    
-    # Services de débridage (optionnels)
-    alldebrid_service = None
-    torbox_service = None
-    debridlink_service = None
-    
-    if config.get('alldebrid_key') and config['alldebrid_key'].strip():
-        alldebrid_service = AllDebridService(config['alldebrid_key'])
-        logging.info("AllDebrid service initialized")
-    
-    if config.get('torbox_key') and config['torbox_key'].strip():
-        torbox_service = TorBoxService(config['torbox_key'])
-        logging.info("TorBox service initialized")
-    
-    if config.get('debridlink_key') and config['debridlink_key'].strip():
-        debridlink_service = DebridLinkService(config['debridlink_key'])
-        logging.info("DebridLink service initialized")
-    
-    if not alldebrid_service and not torbox_service and not debridlink_service:
-        logging.info("No debrid service configured, using qBittorrent fallback")
-    
-    # qBittorrent optionnel
-    qbit_service = None
-    if QBITTORRENT_ENABLE and config.get('qbittorrent'):
-        qbit_config = config['qbittorrent']
-        if qbit_config.get('host') and qbit_config.get('public_url'):
-            qbit_service = QBittorrentService(
-                host=qbit_config['host'],
-                username=qbit_config.get('username', ''),
-                password=qbit_config.get('password', ''),
-                public_url_base=qbit_config['public_url']
-            )
-            logging.info("qBittorrent service initialized")
-            
-            # Test de connexion (synchrone avec la nouvelle librairie)
-            try:
-                qbit_service.test_connection()
-            except Exception as e:
-                logging.error(f"qBittorrent test failed: {e}")
-        else:
-            logging.warning("qBittorrent config incomplete, skipping")
-    elif not QBITTORRENT_ENABLE:
-        logging.info("qBittorrent disabled by QBITTORRENT_ENABLE environment variable")
-    
-    # Vérifier qu'au moins un service est configuré
-    if not alldebrid_service and not torbox_service and not debridlink_service and not qbit_service:
-        logging.error("No debrid or torrent client configured!")
-        return web.json_response({"streams": []})
-    
-    unit3d_results = []
-    sharewood_results = []
+    return await SERVICES.get("qbittorrent", qbit_config, create)
 
-    # 1. Info Média (pour Sharewood) et Conversion ID (pour UNIT3D)
-    # On a besoin des infos textuelles pour Sharewood
-    # On a besoin du TMDB ID pour UNIT3D
-    
-    # Étape 1 : Find by IMDB ID
-    tmdb_id = await tmdb_service.get_tmdb_id(imdb_id, stream_type)
-    
-    # Étape 1.5 : Récupérer Titre/Année pour les trackers qui en ont besoin
-    # YGG est maintenant toujours actif (avec ou sans passkey), donc on a toujours besoin de media_info
-    media_info = None
-    needs_media_info = True  # Toujours true car YGG est toujours actif
-    
-    if needs_media_info:
-        # On a besoin des détails pour le titre
+def abn_service_lease(config):
+    """Session ABN partagée (connexion faite une fois), à emprunter avec `async with`"""
+    return SERVICES.lease(
+        "abn", [config.get('abn_username'), config.get('abn_password')],
+        lambda: ABNService(username=config.get('abn_username'), password=config.get('abn_password'))
+    )
+
+async def build_debrid_service(config):
+    """Retourne (provider, service) pour le premier service de débridage configuré"""
+    for provider, label in (("alldebrid", "AllDebrid"), ("torbox", "TorBox"), ("debridlink", "DebridLink")):
+        api_key = config.get(f'{provider}_key')
+        if api_key and api_key.strip():
+            logging.info(f"{label} service initialized")
+            return provider, await debrid_service_for(provider, api_key)
+
+    return None, None
+
+def clean_info_hash(debrid_service, info_hash):
+    """Normalise un hash comme le fait le service de débridage"""
+    if isinstance(debrid_service, AllDebridService):
+        return debrid_service._clean_hash(info_hash)
+    return info_hash.lower().strip()
+
+async def fetch_media_info(tmdb_service, imdb_id, stream_type):
+    """
+    Convertit l'IMDB ID en TMDB ID et récupère le titre/année (en français,
+    les trackers étant FR). Retourne (tmdb_id, media_info).
+    """
+    async def load():
+        tmdb_id = await tmdb_service.get_tmdb_id(imdb_id, stream_type)
+        media_info = None
         if tmdb_id:
-             async with aiohttp.ClientSession(trust_env=True) as session:
-                url = f"https://api.themoviedb.org/3/{'movie' if stream_type == 'movie' else 'tv'}/{tmdb_id}"
-                params = {"api_key": config['tmdb_key'], "language": "fr-FR"} 
-                # Trackers FR, donc on force le titre FR
-                async with session.get(url, params=params) as resp:
-                    if resp.status == 200:
-                        media_info = await resp.json()
-
-    # 2. Recherche Parallèle (UNIT3D + Sharewood)
+            media_info = await tmdb_service.get_details(tmdb_id, stream_type)
+        return tmdb_id, media_info
+
+    return await TMDB_CACHE.get_or_load((imdb_id, stream_type), load, cache_if=lambda v: v[1] is not None)
+
+def _media_title_year(media_info):
+    if not media_info:
+        return "", "", ""
+    title = media_info.get('title') or media_info.get('name')
+    original_title = media_info.get('original_title') or media_info.get('original_name')
+    date = media_info.get('release_date') or media_info.get('first_air_date')
+    year = date.split('-')[0] if date else ""
+    return title, original_title, year
+
+async def _cached_search(source, credentials, stream_type, imdb_id, season, episode, loader):
+    """Recherche d'une source, mise en cache par identifiants (les liens contiennent passkeys/tokens)"""
+    key = (source, key_digest(json.dumps(credentials, sort_keys=True)), stream_type, imdb_id, season, episode)
+    async with stage(f"search_{source}"):
+        return await SEARCH_CACHE.get_or_load(key, loader)
+
+async def search_torrents(config, stream_type, imdb_id, tmdb_id, media_info, season, episode):
+    """Interroge tous les trackers configurés en parallèle et retourne les torrents filtrés et dédupliqués"""
     tasks = []
+    title, original_title, year = _media_title_year(media_info)
+
+    async def empty(): return []
 
     # Tâche UNIT3D
     if config.get('trackers'):
         logging.info(f"Starting UNIT3D search on {len(config['trackers'])} trackers")
-        unit3d_service = Unit3DService(config['trackers'])
-        tasks.append(unit3d_service.search_all(
-            tmdb_id=tmdb_id,
-            imdb_id=imdb_id,
-            type=stream_type,
-            season=season,
-            episode=episode
+        unit3d_service = await SERVICES.get("unit3d", config['trackers'], lambda: Unit3DService(config['trackers']))
+        tasks.append(_cached_search(
+            "unit3d", config['trackers'], stream_type, imdb_id, season, episode,
+            lambda: unit3d_service.search_all(
+                tmdb_id=tmdb_id,
+                imdb_id=imdb_id,
+                type=stream_type,
+                season=season,
+                episode=episode
+            )
         ))
     else:
         logging.info("UNIT3D search skipped (no trackers configured)")
-        async def empty(): return []
         tasks.append(empty())
 
     # Tâche Sharewood
     if config.get('sharewood_passkey') and media_info:
         logging.info("Starting Sharewood search")
-        sharewood_service = SharewoodService(config.get('sharewood_passkey'))
-        
-        title = media_info.get('title') or media_info.get('name')
-        
-        # Année
-        date = media_info.get('release_date') or media_info.get('first_air_date')
-        year = date.split('-')[0] if date else ""
+        sharewood_service = await SERVICES.get(
+            "sharewood", config.get('sharewood_passkey'), lambda: SharewoodService(config.get('sharewood_passkey'))
+        )
         
         if stream_type == 'movie':
-            tasks.append(sharewood_service.search_movie(title, year))
-        elif stream_type == 'series':
-            tasks.append(sharewood_service.search_series(title, season, episode))
+            loader = lambda: sharewood_service.search_movie(title, year)
+        else:
+            loader = lambda: sharewood_service.search_series(title, season, episode)
+        tasks.append(_cached_search(
+            "sharewood", config.get('sharewood_passkey'), stream_type, imdb_id, season, episode, loader
+        ))
     else:
         if not config.get('sharewood_passkey'):
             logging.info("Sharewood search skipped (no passkey configured)")
         elif not media_info:
             logging.info("Sharewood search skipped (media info not found for title)")
-            
-        async def empty(): return []
         tasks.append(empty())
 
     # Tâche YGG (toujours active, passkey optionnelle)
     logging.info("Starting YGG search (passkey: {})".format("yes" if config.get('ygg_passkey') else "no - cache only"))
     # Passkey optionnelle : nécessaire seulement pour télécharger les .torrent (qBittorrent)
     # Les torrents cachés sur debrid sont accessibles sans passkey
-    ygg_service = YggService(config.get('ygg_passkey'))
-    
-    title = media_info.get('title') if media_info else ""
-    year = ""
-    if media_info:
-        date = media_info.get('release_date') or media_info.get('first_air_date')
-        year = date.split('-')[0] if date else ""
+    ygg_service = await SERVICES.get("ygg", config.get('ygg_passkey'), lambda: YggService(config.get('ygg_passkey')))
 
     if stream_type == 'movie':
-        tasks.append(ygg_service.search_movie(title, year, tmdb_id=tmdb_id))
-    elif stream_type == 'series':
-        tasks.append(ygg_service.search_series(title, season, episode, tmdb_id=tmdb_id))
+        loader = lambda: ygg_service.search_movie(title, year, tmdb_id=tmdb_id)
+    else:
+        loader = lambda: ygg_service.search_series(title, season, episode, tmdb_id=tmdb_id)
+    tasks.append(_cached_search(
+        "ygg", config.get('ygg_passkey'), stream_type, imdb_id, season, episode, loader
+    ))
 
     # Tâche ABN
-    abn_service = None
     if config.get('abn_username') and config.get('abn_password'):
         logging.info("Starting ABN search")
-        abn_service = ABNService(
-            username=config.get('abn_username'),
-            password=config.get('abn_password')
-        )
-        
-        title = media_info.get('title') or media_info.get('name') if media_info else ""
-        original_title = media_info.get('original_title') or media_info.get('original_name') if media_info else ""
-        year = ""
-        if media_info:
-            date = media_info.get('release_date') or media_info.get('first_air_date')
-            year = date.split('-')[0] if date else ""
 
-        if stream_type == 'movie':
-            tasks.append(abn_service.search_movie(title, year, original_title=original_title))
-        elif stream_type == 'series':
-            tasks.append(abn_service.search_series(title, season, episode, original_title=original_title))
+        async def abn_search():
+            async with abn_service_lease(config) as abn_service:
+                if stream_type == 'movie':
+                    return await abn_service.search_movie(title, year, original_title=original_title)
+                return await abn_service.search_series(title, season, episode, original_title=original_title)
+
+        tasks.append(_cached_search(
+            "abn", [config.get('abn_username'), config.get('abn_password')],
+            stream_type, imdb_id, season, episode, abn_search
+        ))
     else:
-        async def empty(): return []
         tasks.append(empty())
 
     # Exécution
-    try:
-        results_list = await asyncio.gather(*tasks)
-        unit3d_results = results_list[0]
-        sharewood_results = results_list[1] if len(results_list) > 1 else []
-        ygg_results = results_list[2] if len(results_list) > 2 else []
-        abn_results = results_list[3] if len(results_list) > 3 else []
-    finally:
-        # Fermer la session ABN proprement
-        if abn_service:
-            await abn_service.close()
+    unit3d_results, sharewood_results, ygg_results, abn_results = await asyncio.gather(*tasks)
+    for source, results in (("unit3d", unit3d_results), ("sharewood", sharewood_results),
+                            ("ygg", ygg_results), ("abn", abn_results)):
+        metrics.SOURCE_RESULTS.inc(source, amount=len(results))
     
     logging.info(f"Results breakdown: UNIT3D={len(unit3d_results)}, Sharewood={len(sharewood_results)}, YGG={len(ygg_results)}, ABN={len(abn_results)}")
     
     # Fusion et Déduplication
     all_torrents = unit3d_results + sharewood_results + ygg_results + abn_results
+    return filter_torrents(all_torrents, config, stream_type, imdb_id, tmdb_id, season, episode)
+
+async def check_debrid_availability(debrid_provider, debrid_service, config, torrents):
+    """
+    Retourne {hash: bool} pour les torrents, en ne demandant au provider
+    que les hashs absents du cache de disponibilité.
+    """
+    user = key_digest(config.get(DEBRID_KEYS[debrid_provider]))
+    hashes = list(dict.fromkeys(
+        clean_info_hash(debrid_service, t['info_hash']) for t in torrents if t.get('info_hash')
+    ))
+
+    cached = await AVAILABILITY_CACHE.get_many([(debrid_provider, user, h) for h in hashes])
+    availability = {h: cached[(debrid_provider, user, h)] for h in hashes if (debrid_provider, user, h) in cached}
+    missing = [h for h in hashes if h not in availability]
+
+    if missing:
+        if debrid_provider == "torbox":
+            # TorBox check (en parallèle pour la vitesse)
+            results = await asyncio.gather(
+                *[debrid_service.check_availability(h) for h in missing],
+                return_exceptions=True
+            )
+            fresh = {h: bool(r) for h, r in zip(missing, results) if not isinstance(r, Exception)}
+        else:
+            fresh = await debrid_service.check_availability(missing)
+
+        # Les hashs sans réponse (erreur) ne sont pas mis en cache
+        checked = [h for h in missing if h in fresh]
+        for h in checked:
+            availability[h] = bool(fresh[h])
+        await AVAILABILITY_CACHE.set_many([((debrid_provider, user, h), availability[h]) for h in checked])
+
+    logging.info(f"{debrid_provider}: {len([v for v in availability.values() if v])} cached torrents ({len(missing)} checked upstream)")
+    return availability
+
+def next_episode(season, episode, media_info):
+    """Épisode suivant (passe à la saison suivante si TMDB indique la fin de saison)"""
+    seasons = {s.get('season_number'): s.get('episode_count') for s in (media_info or {}).get('seasons', [])}
+    count = seasons.get(season)
+    if count and episode >= count:
+        if seasons.get(season + 1):
+            return season + 1, 1
+        return None
+    return season, episode + 1
+
+def schedule_next_episode(config, imdb_id, season, episode, media_info):
+    """Précharge recherches, TMDB et disponibilité debrid de l'épisode suivant (et de son pack saison)"""
+    if not PREFETCH_NEXT_EPISODE:
+        return
+    target = next_episode(season, episode, media_info)
+    if not target:
+        return
+    next_season, next_ep = target
+    user = config.digest
+
+    async def prefetch():
+        tmdb_service = await tmdb_service_for(config)
+        tmdb_id, info = await fetch_media_info(tmdb_service, imdb_id, 'series')
+        # Les recherches d'épisode incluent celles du pack saison
+        torrents = await search_torrents(config, 'series', imdb_id, tmdb_id, info, next_season, next_ep)
+        debrid_provider, debrid_service = await build_debrid_service(config)
+        if debrid_service and torrents:
+            await check_debrid_availability(debrid_provider, debrid_service, config, torrents)
+        logging.info(f"Prefetch: {imdb_id} S{next_season}E{next_ep} warmed ({len(torrents)} torrents)")
+
+    PREFETCH.submit((user, imdb_id, next_season, next_ep), user, f"{imdb_id} S{next_season}E{next_ep}", prefetch)
+
+def stream_response(request, streams, cached=0):
+    """
+    Réponse /stream avec Cache-Control, ETag et 304.
+    Sans résultat, la réponse n'est gardée que STREAM_EMPTY_MAX_AGE secondes
+    (un tracker en panne ne doit pas masquer les résultats longtemps) ; plus
+    la part de streams cachés chez le débrideur est grande, plus elle est
+    gardée longtemps, jusqu'à STREAM_MAX_AGE. L'URL contient la config :
+    seul celui qui la connaît peut réutiliser la réponse d'un cache partagé.
+    """
+    if streams:
+        ratio = cached / len(streams)
+        max_age = int(STREAM_EMPTY_MAX_AGE + (STREAM_MAX_AGE - STREAM_EMPTY_MAX_AGE) * ratio)
+        stale = STREAM_STALE_WHILE_REVALIDATE
+    else:
+        max_age = stale = STREAM_EMPTY_MAX_AGE
+    cache_control = f"public, max-age={max_age}, stale-while-revalidate={stale}"
+    return conditional_response(request, json.dumps({"streams": streams}), 'application/json', cache_control)
+
+async def handle_stream(request):
+    """Gère la recherche de streams"""
+    config_str = request.match_info.get('config', '')
+    config = await load_config(config_str)
+    if not config:
+        return stream_response(request, [])
+
+    stream_type = request.match_info.get('type')
+    stream_id = request.match_info.get('id')
+
+    # Parsing ID (tt1234567 ou tt1234567:1:2)
+    imdb_id = stream_id
+    season = None
+    episode = None
     
-    # Filtrage par taille si configuré
-    max_size_gb = config.get('max_size', 0)
-    if max_size_gb > 0:
-        max_size_bytes = max_size_gb * 1024 * 1024 * 1024  # Conversion Go -> bytes
-        before_filter = len(all_torrents)
-        all_torrents = [t for t in all_torrents if t.get('size', 0) <= max_size_bytes]
-        filtered_count = before_filter - len(all_torrents)
-        if filtered_count > 0:
-            logging.info(f"Filtered {filtered_count} torrents exceeding {max_size_gb} Go")
+    if ":" in stream_id:
+        parts = stream_id.split(":")
+        imdb_id = parts[0]
+        season = int(parts[1])
+        episode = int(parts[2])
+
+    logging.info(f"Searching for {stream_type} {imdb_id} S{season}E{episode}")
+
+    # Initialisation des services
+    tmdb_service = await tmdb_service_for(config)
     
-    unique_torrents = {}
+    # Services de débridage (optionnels) : le premier configuré est utilisé
+    debrid_provider, debrid_service = await build_debrid_service(config)
     
-    for t in all_torrents:
-        # Filtrage Strict pour UNIT3D (Anti-bruit ID)
-        if t.get('source') == 'unit3d': # ou le nom interne utilisé dans le service
-            # UNIT3D est cherché par ID, donc le résultat DOIT avoir l'ID correspondant
-            # ou au moins ne pas avoir un ID contradictoire (0 ou différent)
-            
-            res_tmdb = t.get('tmdb_id') or t.get('tmdb')
-            res_imdb = t.get('imdb_id') or t.get('imdb')
-            
-            # Si TMDB ID présent et non nul, il doit matcher
-            if res_tmdb and str(res_tmdb) != "0" and tmdb_id and str(res_tmdb) != str(tmdb_id):
-                # logging.info(f"Filtered UNIT3D (Wrong TMDB): {t.get('name')} {res_tmdb}!={tmdb_id}")
-                continue
-                
-            # Si IMDB ID présent et non nul, il doit matcher (en ignorant 'tt')
-            if res_imdb and str(res_imdb) != "0" and imdb_id:
-                clean_res = str(res_imdb).replace('tt', '')
-                clean_req = str(imdb_id).replace('tt', '')
-                if clean_res != clean_req:
-                    # logging.info(f"Filtered UNIT3D (Wrong IMDB): {t.get('name')} {res_imdb}!={imdb_id}")
-                    continue
-                
-            # Si UNIT3D renvoie un résultat sans ID, on l'accepte quand même
-            # (la vérification par titre pourrait être ajoutée ici si nécessaire)
-            # if (not res_tmdb or str(res_tmdb) == "0") and (not res_imdb or str(res_imdb) == "0"):
-            #      # Filtrage par titre si nécessaire
-            #      pass
-
-        # Filtrage Série (SxxExx)
-        # Si c'est une série, on vérifie que le titre correspond à la saison/épisode demandé
-        # pour éviter d'afficher E03 quand on veut E07 (souvent le cas avec recherche floue)
-        if stream_type == 'series' and season is not None:
-            if not check_season_episode(t.get('name', ''), season, episode):
-                # logging.info(f"Filtered out: {t.get('name')} (Wrong Season/Episode)")
-                continue
+    if not debrid_service:
+        logging.info("No debrid service configured, using qBittorrent fallback")
+    
+    # qBittorrent optionnel
+    qbit_service = None
+    if QBITTORRENT_ENABLE and config.get('qbittorrent'):
+        qbit_config = config['qbittorrent']
+        if qbit_config.get('host') and qbit_config.get('public_url'):
+            qbit_service = await qbittorrent_service_for(qbit_config)
+        else:
+            logging.warning("qBittorrent config incomplete, skipping")
+    elif not QBITTORRENT_ENABLE:
+        logging.info("qBittorrent disabled by QBITTORRENT_ENABLE environment variable")
+    
+    # Vérifier qu'au moins un service est configuré
+    if not debrid_service and not qbit_service:
+        logging.error("No debrid or torrent client configured!")
+        return stream_response(request, [])
 
-        # Info Hash est la clé unique (minuscule pour éviter les doublons de casse)
-        ih = t.get('info_hash')
-        if ih:
-            ih = ih.lower()
-            if ih not in unique_torrents:
-                unique_torrents[ih] = t
-            # Optionnel : Si on voulait fusionner les sources, on pourrait le faire ici
-            # else:
-            #     unique_torrents[ih]['tracker_name'] += f" / {t.get('tracker_name')}"
-            
-    # Liste finale des torrents uniques
-    torrents = list(unique_torrents.values())
+    # 1. Info Média (titre/année pour les recherches textuelles, TMDB ID pour UNIT3D)
+    async with stage("tmdb"):
+        tmdb_id, media_info = await fetch_media_info(tmdb_service, imdb_id, stream_type)
+
+    # 2. Recherche Parallèle (UNIT3D + Sharewood + YGG + ABN)
+    async with stage("search"):
+        torrents = await search_torrents(config, stream_type, imdb_id, tmdb_id, media_info, season, episode)
     
     if not torrents:
-        return web.json_response({"streams": []})
+        return stream_response(request, [])
 
     logging.info(f"Total unique torrents (UNIT3D + Sharewood + YGG + ABN): {len(torrents)}")
 
@@ -506,35 +990,9 @@ async def handle_stream(request):
     
     # 3. Check disponibilité sur les services de débridage
     availability = {}
-    debrid_provider = None
-    
-    if alldebrid_service:
-        hashes = [t['info_hash'] for t in torrents if t.get('info_hash')]
-        availability = await alldebrid_service.check_availability(hashes)
-        debrid_provider = "alldebrid"
-        logging.info(f"AllDebrid: {len([v for v in availability.values() if v])} cached torrents")
-    
-    elif torbox_service:
-        # TorBox check (en parallèle pour la vitesse)
-        hashes = [t['info_hash'] for t in torrents if t.get('info_hash')]
-        # Effectuer toutes les vérifications en parallèle
-        results = await asyncio.gather(
-            *[torbox_service.check_availability(h) for h in hashes],
-            return_exceptions=True
-        )
-        # Construire le dictionnaire de disponibilité
-        for h, result in zip(hashes, results):
-            if not isinstance(result, Exception) and result:
-                availability[h] = result
-        debrid_provider = "torbox"
-        logging.info(f"TorBox: {len([v for v in availability.values() if v])} cached torrents")
-    
-    elif debridlink_service:
-        # DebridLink check (en parallèle)
-        hashes = [t['info_hash'] for t in torrents if t.get('info_hash')]
-        availability = await debridlink_service.check_availability(hashes)
-        debrid_provider = "debridlink"
-        logging.info(f"DebridLink: {len([v for v in availability.values() if v])} cached torrents")
+    if debrid_service:
+        async with stage(f"debrid_{debrid_provider}"):
+            availability = await check_debrid_availability(debrid_provider, debrid_service, config, torrents)
 
     # 4. Générer les streams
     cached_torrents = []
@@ -545,19 +1003,8 @@ async def handle_stream(request):
         if not info_hash:
             continue
             
-        # Nettoyer le hash
-        if alldebrid_service:
-            clean_hash = alldebrid_service._clean_hash(info_hash)
-            is_cached = availability.get(clean_hash, False)
-        elif torbox_service:
-            clean_hash = info_hash.lower().strip()
-            is_cached = availability.get(clean_hash, False)
-        elif debridlink_service:
-            clean_hash = info_hash.lower().strip()
-            is_cached = availability.get(clean_hash, False)
-        else:
-            clean_hash = info_hash.lower().strip()
-            is_cached = False
+        clean_hash = clean_info_hash(debrid_service, info_hash)
+        is_cached = availability.get(clean_hash, False)
         
         if is_cached:
             cached_torrents.append((torrent, clean_hash))
@@ -565,6 +1012,9 @@ async def handle_stream(request):
             uncached_torrents.append((torrent, clean_hash))
     
     logging.info(f"Cached: {len(cached_torrents)}, Uncached: {len(uncached_torrents)}")
+    if debrid_service:
+        metrics.STREAM_RESULTS.inc("cached", amount=len(cached_torrents))
+        metrics.STREAM_RESULTS.inc("uncached", amount=len(uncached_torrents))
     
     # 4a. Streams débridés (cachés)
     for torrent, clean_hash in cached_torrents:
@@ -592,6 +1042,15 @@ async def handle_stream(request):
             "title": title,
             "url": resolve_url
         })
+
+    # 4a bis. Pré-résolution des premiers streams cachés pendant que l'utilisateur choisit
+    if PRERESOLVE_TOP > 0 and cached_torrents:
+        api_key = config.get(DEBRID_KEYS[debrid_provider])
+        for torrent, clean_hash in cached_torrents[:PRERESOLVE_TOP]:
+            schedule_preresolve(
+                debrid_provider, api_key, clean_hash, season, episode,
+                "movie" if stream_type == 'movie' else None
+            )
     
     # 4b. Streams qBittorrent (non cachés, si configuré)
     # Si on a des torrents cachés, on n'affiche pas les non-cachés
@@ -608,7 +1067,7 @@ async def handle_stream(request):
         if cached_torrents:
             logging.info(f"qBittorrent: Skipping {len(uncached_torrents)} uncached torrents (cached results available)")
         else:
-            limit = 10 if (alldebrid_service or torbox_service or debridlink_service) else 25  # Plus de résultats si pas de debrid
+            limit = 10 if debrid_service else 25  # Plus de résultats si pas de debrid
             logging.info(f"qBittorrent: Processing {min(len(uncached_torrents), limit)} torrents (out of {len(uncached_torrents)} available)")
             
             qbit_added = 0
@@ -629,7 +1088,6 @@ async def handle_stream(request):
                 # Indicateur qBittorrent
                 title = f"📥 {extra_info}\n{torrent.get('name')}\n💾 {size_str} - {source_prefix} [qBittorrent]"
                 
-                import urllib.parse
                 encoded_link = urllib.parse.quote(download_link, safe='')
                 
                 # On passe la config encodée pour avoir accès aux credentials qBittorrent
@@ -649,14 +1107,27 @@ async def handle_stream(request):
             
             logging.info(f"qBittorrent: Added {qbit_added} streams")
 
+            if TORRENT_CACHE and TORRENT_CACHE_PREFETCH > 0:
+                prefill_items = [
+                    (h, t.get('link') or t.get('download_link'))
+                    for t, h in uncached_torrents[:TORRENT_CACHE_PREFETCH]
+                    if t.get('link') or t.get('download_link')
+                ]
+                if prefill_items:
+                    schedule_torrent_prefill(config, prefill_items)
+
+    # L'épisode suivant sera très probablement demandé : on le prépare en arrière-plan
+    if stream_type == 'series' and season is not None and episode is not None:
+        schedule_next_episode(config, imdb_id, season, episode, media_info)
+
     logging.info(f"Returning {len(streams)} streams to Stremio")
-    return web.json_response({"streams": streams})
+    return stream_response(request, streams, cached=len(cached_torrents))
 
 async def handle_resolve(request):
     """Résout le lien Debrid ou qBittorrent au moment de la lecture"""
     # Récupérer la config depuis l'URL (/{config}/resolve/...)
     config_str = request.match_info.get('config', '')
-    config = decode_config(config_str)
+    config = await load_config(config_str)
     
     if not config:
         return web.Response(status=400, text="Invalid config")
@@ -671,12 +1142,14 @@ async def handle_resolve(request):
     
     # === MODE qBittorrent ===
     if service_name == 'qbit':
+        # Le hash sert de nom de fichier au cache .torrent : rien d'autre qu'un info hash
+        if not is_info_hash(info_hash):
+            return web.Response(status=400, text="Invalid info hash")
         download_link = request.query.get('link')
         if not download_link:
             return web.Response(status=400, text="Missing download link")
         
         # Décoder le lien
-        import urllib.parse
         download_link = urllib.parse.unquote(download_link)
         
         # Récupérer la config qBittorrent
@@ -684,145 +1157,431 @@ async def handle_resolve(request):
         if not qbit_config:
             return web.Response(status=400, text="qBittorrent not configured")
         
-        qbit_service = QBittorrentService(
-            host=qbit_config['host'],
-            username=qbit_config.get('username', ''),
-            password=qbit_config.get('password', ''),
-            public_url_base=qbit_config['public_url']
-        )
-        
-        # Télécharger le .torrent
-        logging.info(f"Downloading torrent from: {download_link[:100]}...")
+        qbit_service = await qbittorrent_service_for(qbit_config)
         
-        # Vérifier si c'est un lien ABN qui nécessite une authentification
-        if 'abn.lol' in download_link or 'abnormal.ws' in download_link:
-            if config.get('abn_username') and config.get('abn_password'):
-                abn_service = ABNService(
-                    username=config.get('abn_username'),
-                    password=config.get('abn_password')
-                )
-                try:
-                    torrent_data = await abn_service.download_torrent(download_link)
-                    if not torrent_data:
-                        logging.error("Failed to download .torrent from ABN")
-                        return web.Response(status=502, text="Failed to download torrent file from ABN")
-                finally:
-                    await abn_service.close()
-            else:
-                logging.error("ABN credentials not configured")
-                return web.Response(status=400, text="ABN credentials required")
-        else:
-            # Téléchargement standard
-            async with aiohttp.ClientSession(trust_env=True) as session:
-                async with session.get(download_link) as resp:
-                    if resp.status != 200:
-                        logging.error(f"Failed to download .torrent: {resp.status}")
-                        return web.Response(status=502, text="Failed to download torrent file")
-                    torrent_data = await resp.read()
+        # Télécharger le .torrent (ou le reprendre du cache disque)
+        async with stage("torrent_file"):
+            torrent_data = await fetch_torrent_file(config, info_hash, download_link)
         
-        logging.info(f"Downloaded {len(torrent_data)} bytes, adding to qBittorrent...")
+        logging.info(f"Got {len(torrent_data)} bytes, adding to qBittorrent...")
         
-        # Ajouter et configurer dans qBittorrent (synchrone avec la librairie officielle)
-        stream_url = qbit_service.manage_stream(
-            torrent_data, 
-            info_hash, 
-            is_file=True,
-            season=int(season) if season else None,
-            episode=int(episode) if episode else None
-        )
+        # Ajouter et configurer dans qBittorrent (librairie synchrone : hors de la boucle)
+        async with stage("qbit_prepare"):
+            target = await asyncio.to_thread(
+                qbit_service.prepare_stream,
+                torrent_data, 
+                info_hash, 
+                is_file=True,
+                season=int(season) if season else None,
+                episode=int(episode) if episode else None
+            )
         
-        if stream_url:
-            logging.info(f"qBittorrent stream ready: {stream_url}")
-            raise web.HTTPFound(stream_url)
-        else:
+        if not target:
             return web.Response(status=404, text="Could not start qBittorrent stream")
+
+        if LIFECYCLE:
+            LIFECYCLE.record_added(qbit_service, target.info_hash)
+
+        # Attendre que le lecteur ait de quoi démarrer (en-tête, fin du fichier, buffer)
+        if QBIT_READY_TIMEOUT > 0:
+            async with stage("qbit_ready"):
+                ready, elapsed = await qbit_service.wait_until_ready(
+                    target,
+                    buffer_bytes=QBIT_READY_BUFFER_MB * 1024 * 1024,
+                    tail_bytes=QBIT_READY_TAIL_MB * 1024 * 1024,
+                    timeout=QBIT_READY_TIMEOUT
+                )
+            logging.info(f"qbit_time_to_ready={elapsed:.3f}s ready={ready} hash={target.info_hash[:8]}")
+            metrics.QBIT_TIME_TO_READY.observe(elapsed, "true" if ready else "false")
+
+        # Lecture servie par Frenchio lui-même plutôt que par le serveur web de public_url
+        if PLAY_REGISTRY:
+            await PLAY_REGISTRY.register(qbit_service, target, play_owner(config_str, qbit_config))
+            target.url = f"{request.scheme}://{request.host}/play/{target.info_hash}/{urllib.parse.quote(target.file_name)}"
+
+        logging.info(f"qBittorrent stream ready: {target.url}")
+        raise web.HTTPFound(target.url)
     
-    # === MODE AllDebrid ===
-    elif service_name == 'alldebrid':
-        alldebrid_key = config.get('alldebrid_key')
-        if not alldebrid_key:
-            return web.Response(status=400, text="AllDebrid not configured")
-        
-        debrid_service = AllDebridService(alldebrid_key)
-        
-        stream_url = await debrid_service.unlock_magnet(
-            info_hash, 
-            season=int(season) if season else None, 
-            episode=int(episode) if episode else None,
-            media_type=media_type
-        )
-        
+    # === MODES Debrid (AllDebrid, TorBox, DebridLink) ===
+    elif service_name in DEBRID_KEYS:
+        api_key = config.get(DEBRID_KEYS[service_name])
+        if not api_key:
+            return web.Response(status=400, text=f"{service_name} not configured")
+
+        season = int(season) if season else None
+        episode = int(episode) if episode else None
+
+        if RESOLVE_CACHE:
+            cache_key = RESOLVE_CACHE.make_key(service_name, api_key, info_hash, season, episode)
+            entry = RESOLVE_CACHE.get(cache_key)
+            if entry and await RESOLVE_CACHE.is_valid(cache_key, entry):
+                logging.info(f"{service_name} resolve: cache hit for {info_hash}")
+                raise web.HTTPFound(entry.url)
+
+            # Rejoint une pré-résolution en cours le cas échéant
+            async with stage(f"unlock_{service_name}"):
+                stream_url = await RESOLVE_CACHE.resolve(
+                    cache_key,
+                    lambda: resolve_debrid_link(service_name, api_key, info_hash, season, episode, media_type)
+                )
+        else:
+            async with stage(f"unlock_{service_name}"):
+                stream_url = await resolve_debrid_link(service_name, api_key, info_hash, season, episode, media_type)
+
         if stream_url:
+            logging.info(f"{service_name} resolve: Redirecting to: {stream_url}")
             raise web.HTTPFound(stream_url)
         else:
+            logging.error(f"{service_name} resolve: Failed to get stream URL for hash {info_hash}")
             return web.Response(status=404, text="Could not resolve stream or file not found in torrent")
+
+    else:
+        return web.Response(status=400, text=f"Unknown service: {service_name}")
+
+def is_abn_link(download_link):
+    return ('abn.lol' in download_link or 'abnormal.ws' in download_link
+            or download_link.startswith(upstream.base_url("abn", ABN_URL)))
+
+async def download_torrent_file(config, download_link):
+    """
+    Télécharge le .torrent depuis le tracker.
+    Lève une HTTPException aiohttp (400/502) en cas d'échec.
+    """
+    logging.info(f"Downloading torrent from: {download_link[:100]}...")
     
+    # Vérifier si c'est un lien ABN qui nécessite une authentification
+    if is_abn_link(download_link):
+        if not (config.get('abn_username') and config.get('abn_password')):
+            logging.error("ABN credentials not configured")
+            raise web.HTTPBadRequest(text="ABN credentials required")
+
+        async with abn_service_lease(config) as abn_service:
+            torrent_data = await abn_service.download_torrent(download_link)
+        if not torrent_data:
+            logging.error("Failed to download .torrent from ABN")
+            raise web.HTTPBadGateway(text="Failed to download torrent file from ABN")
+        return torrent_data
+
+    # Téléchargement standard
+    async with upstream.session() as session:
+        async with session.get(download_link) as resp:
+            if resp.status != 200:
+                logging.error(f"Failed to download .torrent: {resp.status}")
+                raise web.HTTPBadGateway(text="Failed to download torrent file")
+            return await resp.read()
+
+def torrent_owner(config, download_link):
+    """
+    Propriétaire d'un .torrent en cache : empreinte de l'identifiant tracker qui
+    a servi à le télécharger. Le fichier d'un tracker privé embarque la passkey
+    de cet utilisateur ; elle est dans le lien (passkey, rsskey, api_token), sauf
+    pour ABN où le téléchargement passe par la session du compte.
+    """
+    if is_abn_link(download_link):
+        return key_digest("abn:" + (config.get('abn_username') or '').lower())
+    return key_digest(download_link)
+
+async def store_torrent_file(owner, info_hash, torrent_data):
+    """Range le .torrent dans le cache disque sous son vrai info hash"""
+    try:
+        actual_hash = parse_torrent(torrent_data).info_hash
+    except TorrentParseError as e:
+        logging.warning(f"Torrent cache: not caching invalid .torrent for {info_hash[:8]} ({e})")
+        return
+    if actual_hash != info_hash.lower():
+        logging.info(f"Torrent cache: {info_hash[:8]} is actually {actual_hash[:8]}")
+    try:
+        await asyncio.to_thread(TORRENT_CACHE.put, owner, actual_hash, torrent_data)
+    except OSError as e:
+        # Cache facultatif : le .torrent est déjà en main, la lecture continue
+        logging.warning(f"Torrent cache: could not store {actual_hash[:8]} ({type(e).__name__} {e})")
+
+async def fetch_torrent_file(config, info_hash, download_link):
+    """Retourne le .torrent depuis le cache disque, sinon le télécharge et le met en cache"""
+    owner = torrent_owner(config, download_link)
+    if TORRENT_CACHE:
+        torrent_data = await asyncio.to_thread(TORRENT_CACHE.get, owner, info_hash)
+        if torrent_data:
+            logging.info(f"Torrent cache hit for {info_hash[:8]}, no tracker download")
+            return torrent_data
+
+    torrent_data = await download_torrent_file(config, download_link)
+    if TORRENT_CACHE:
+        await store_torrent_file(owner, info_hash, torrent_data)
+    return torrent_data
+
+def schedule_torrent_prefill(config, items):
+    """
+    Télécharge en arrière-plan les .torrent des premiers résultats qBittorrent
+    affichés, pour que le clic n'ait plus besoin du tracker.
+    """
+    user = config.digest
+    hashes = tuple(h for h, _ in items)
+
+    async def prefill():
+        # La session ABN partagée sert à tout le lot
+        for info_hash, download_link in items:
+            if not is_info_hash(info_hash):
+                continue
+            owner = torrent_owner(config, download_link)
+            if await asyncio.to_thread(TORRENT_CACHE.get, owner, info_hash):
+                continue
+            try:
+                torrent_data = await download_torrent_file(config, download_link)
+            except web.HTTPException as e:
+                logging.info(f"Torrent prefill: {info_hash[:8]} skipped ({e.text})")
+                continue
+            await store_torrent_file(owner, info_hash, torrent_data)
+
+    PREFETCH.submit(("torrents", user, hashes), user, f"torrent prefill ({len(items)})", prefill)
+
+async def resolve_debrid_link(service_name, api_key, info_hash, season=None, episode=None, media_type=None):
+    """
+    Exécute la chaîne complète upload → fichiers → unlock chez le provider
+    et retourne le lien direct (ou None).
+    """
+    # === MODE AllDebrid ===
+    if service_name == 'alldebrid':
+        debrid_service = await debrid_service_for('alldebrid', api_key)
+        return await debrid_service.unlock_magnet(
+            info_hash,
+            season=season,
+            episode=episode,
+            media_type=media_type
+        )
+
     # === MODE TorBox ===
     elif service_name == 'torbox':
         logging.info(f"TorBox resolve: Starting with hash={info_hash}, season={season}, episode={episode}")
-        
-        torbox_key = config.get('torbox_key')
-        if not torbox_key:
-            return web.Response(status=400, text="TorBox not configured")
-        
-        debrid_service = TorBoxService(torbox_key)
-        
+        debrid_service = await debrid_service_for('torbox', api_key)
+
         # Construire le magnet à partir du hash
         magnet_link = f"magnet:?xt=urn:btih:{info_hash}"
-        
+
         # Déterminer le type de stream
         if season and episode:
             stream_type = "series"
         else:
             stream_type = "movie"
-        
-        stream_url = await debrid_service.get_stream_link(
+
+        return await debrid_service.get_stream_link(
             magnet_link,
             stream_type,
-            season=int(season) if season else None,
-            episode=int(episode) if episode else None
+            season=season,
+            episode=episode
         )
-        
-        if stream_url:
-            logging.info(f"TorBox resolve: Redirecting to: {stream_url}")
-            raise web.HTTPFound(stream_url)
-        else:
-            logging.error(f"TorBox resolve: Failed to get stream URL for hash {info_hash}")
-            return web.Response(status=404, text="Could not resolve TorBox stream")
-    
+
     # === MODE DebridLink ===
     elif service_name == 'debridlink':
         logging.info(f"DebridLink resolve: Starting with hash={info_hash}, season={season}, episode={episode}")
-        
-        debridlink_key = config.get('debridlink_key')
-        if not debridlink_key:
-            return web.Response(status=400, text="DebridLink not configured")
-        
-        debrid_service = DebridLinkService(debridlink_key)
-        
-        stream_url = await debrid_service.unlock_magnet(
+        debrid_service = await debrid_service_for('debridlink', api_key)
+        return await debrid_service.unlock_magnet(
             info_hash,
-            season=int(season) if season else None,
-            episode=int(episode) if episode else None,
+            season=season,
+            episode=episode,
             media_type=media_type
         )
-        
-        if stream_url:
-            logging.info(f"DebridLink resolve: Redirecting to: {stream_url}")
-            raise web.HTTPFound(stream_url)
-        else:
-            logging.error(f"DebridLink resolve: Failed to get stream URL for hash {info_hash}")
-            return web.Response(status=404, text="Could not resolve DebridLink stream")
-    
-    else:
-        return web.Response(status=400, text=f"Unknown service: {service_name}")
+
+    return None
+
+def schedule_preresolve(service_name, api_key, info_hash, season, episode, media_type):
+    """Résout un stream caché en arrière-plan pour que le premier clic redirige immédiatement"""
+    cache_key = RESOLVE_CACHE.make_key(service_name, api_key, info_hash, season, episode)
+    if RESOLVE_CACHE.get(cache_key) or RESOLVE_CACHE.is_pending(cache_key):
+        return
+
+    async def preresolve():
+        # Un clic ou une autre pré-résolution a pu passer entre-temps
+        if RESOLVE_CACHE.get(cache_key):
+            return
+        url = await RESOLVE_CACHE.resolve(
+            cache_key,
+            lambda: resolve_debrid_link(service_name, api_key, info_hash, season, episode, media_type)
+        )
+        logging.info(f"Pre-resolve {service_name} {info_hash[:8]}...: {'ready' if url else 'failed'}")
+
+    BACKGROUND.submit(key_digest(api_key), f"preresolve {info_hash[:8]}", preresolve)
+
+# Handlers comptés dans INFLIGHT_REQUESTS : ceux qui interrogent trackers, TMDB et débrideurs
+LOAD_HANDLERS = frozenset((handle_stream, handle_stream_no_config, handle_resolve))
+
+def play_owner(config_str, qbit_config):
+    """
+    Référence sans secret au qBittorrent d'une session de lecture partagée :
+    le jeton du ConfigStore (config chiffrée, relisible par tout worker), sinon
+    l'empreinte des identifiants (instance déjà connue du worker seulement)
+    """
+    if configstore.is_token(config_str):
+        return config_str
+    return SERVICES.make_key("qbittorrent", qbit_config)[1]
+
+async def play_service_for(owner):
+    """qBittorrent d'une session de lecture enregistrée par un autre worker, None s'il est inconnu ici"""
+    if configstore.is_token(owner):
+        config = await load_config(owner)
+        qbit_config = config.get('qbittorrent') if config else None
+        return await qbittorrent_service_for(qbit_config) if qbit_config else None
+    return SERVICES.find("qbittorrent", owner)
+
+async def handle_play(request):
+    """Sert un fichier du dossier de téléchargement qBittorrent (Range, sendfile)"""
+    if not PLAY_REGISTRY:
+        raise web.HTTPNotFound()
+
+    info_hash = request.match_info['hash']
+    file_name = request.match_info['file']
+    path = resolve_path(PLAY_DOWNLOAD_DIR, file_name)
+    if not path:
+        raise web.HTTPForbidden()
+
+    # Fichier annoncé par un resolve (ici ou dans un autre worker) : il peut être encore en téléchargement
+    session = await PLAY_REGISTRY.get(info_hash, file_name, play_service_for)
+    if session is None:
+        # Sans session on ne sait pas quelles pièces manquent : un fichier incomplet
+        # (creux ou préalloué) serait servi avec des zéros. Le lecteur repasse par /resolve.
+        logging.info(f"Play: no session for {info_hash[:8]}/{file_name}, refusing to serve it blind")
+        raise web.HTTPNotFound()
+    if LIFECYCLE:
+        LIFECYCLE.touch(session.qbit_service, session.target.info_hash)
+    if not session.complete:
+        target = session.target
+        if target.first_piece is None or not target.piece_length or not target.file_size:
+            try:
+                await asyncio.to_thread(session.qbit_service._load_piece_layout, target)
+            except Exception as e:
+                logging.warning(f"Play: piece layout unavailable for {file_name}: {e}")
+        if target.first_piece is not None and target.piece_length and target.file_size:
+            return await serve_partial(request, session, path, PLAY_READ_TIMEOUT)
+        # Pièces impossibles à suivre : le lecteur réessaiera
+        raise web.HTTPServiceUnavailable(headers={'Retry-After': '5'})
+
+    # Fichier terminé : servi tel quel
+    if not os.path.isfile(path):
+        raise web.HTTPNotFound()
+    return web.FileResponse(path)
+
+def check_admin(request):
+    """Vérifie le jeton d'administration (en-tête Authorization: Bearer ou ?token=)"""
+    if not ADMIN_TOKEN:
+        raise web.HTTPNotFound()
+    auth = request.headers.get('Authorization', '')
+    token = auth[7:] if auth.startswith('Bearer ') else request.query.get('token', '')
+    if not admin_token_ok(token):
+        raise web.HTTPUnauthorized()
+
+def admin_token_ok(token):
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+async def handle_admin_torrents(request):
+    """Empreinte des torrents ajoutés par Frenchio dans qBittorrent"""
+    check_admin(request)
+    if not LIFECYCLE:
+        return web.json_response({'enabled': False})
+    return web.json_response({'enabled': True, **LIFECYCLE.report()})
+
+def profile_response(request, stats, filename):
+    """Profil en texte (?sort=, ?limit=) ou au format binaire pstats (?format=pstats)"""
+    if request.query.get('format') == 'pstats':
+        return web.Response(
+            body=render_pstats(stats), content_type='application/octet-stream',
+            headers={'Content-Disposition': f'attachment; filename="{filename}.pstats"'}
+        )
+    try:
+        limit = int(request.query.get('limit', '60'))
+        text = render_text(stats, request.query.get('sort', 'cumulative'), limit)
+    except (ValueError, KeyError) as e:
+        raise web.HTTPBadRequest(text=f"Invalid sort/limit: {e}")
+    return web.Response(text=text)
+
+async def handle_admin_profiles(request):
+    """Liste des profils enregistrés"""
+    check_admin(request)
+    return web.json_response({"profiles": [r.summary() for r in PROFILER.profiles]})
+
+async def handle_admin_profile(request):
+    """Un profil, par id"""
+    check_admin(request)
+    try:
+        record = PROFILER.get(int(request.match_info['id']))
+    except ValueError:
+        record = None
+    if record is None:
+        raise web.HTTPNotFound()
+    return profile_response(request, record.stats, f"profile-{record.id}")
+
+async def handle_admin_profile_aggregate(request):
+    """Profils des `window` dernières secondes (défaut : 1 h) fusionnés"""
+    check_admin(request)
+    try:
+        window = float(request.query.get('window', '3600'))
+    except ValueError:
+        raise web.HTTPBadRequest(text="Invalid window")
+    stats, count = PROFILER.aggregate(window)
+    if stats is None:
+        raise web.HTTPNotFound(text="No profile in this window")
+    response = profile_response(request, stats, f"profiles-{int(window)}s")
+    response.headers['X-Frenchio-Profile-Count'] = str(count)
+    return response
+
+async def handle_admin_breakers(request):
+    """État des disjoncteurs de chaque service externe"""
+    check_admin(request)
+    if not BREAKERS:
+        return web.json_response({'enabled': False})
+    return web.json_response({'enabled': True, 'breakers': BREAKERS.report()})
+
+async def handle_metrics(request):
+    """Métriques au format texte Prometheus"""
+    if not METRICS_ENABLE:
+        raise web.HTTPNotFound()
+    if ADMIN_TOKEN:
+        check_admin(request)
+    return web.Response(text=metrics.REGISTRY.render(), content_type='text/plain', charset='utf-8')
+
+async def on_startup(app):
+    if LIFECYCLE:
+        LIFECYCLE.start()
+    if LOOP_MONITOR:
+        LOOP_MONITOR.start()
+    if YGG_MIRRORS:
+        YGG_MIRRORS.start()
+    if SHARED_STORE:
+        SHARED_STORE.start()
+
+async def on_cleanup(app):
+    await BACKGROUND.close()
+    await PREFETCH.close()
+    if LIFECYCLE:
+        await LIFECYCLE.close()
+    if LOOP_MONITOR:
+        await LOOP_MONITOR.close()
+    if YGG_MIRRORS:
+        await YGG_MIRRORS.close()
+    await SERVICES.close()
+    if CONFIG_STORE:
+        CONFIG_STORE.close()
+    if SHARED_STORE:
+        await SHARED_STORE.close()
 
 async def get_app():
-    app = web.Application(middlewares=[cors_middleware])
+    middlewares = [inflight_middleware, metrics_middleware, timing_middleware, cors_middleware, profile_middleware]
+    if upstream.recording() or upstream.replaying():
+        middlewares.append(corpus_middleware)
+    app = web.Application(middlewares=middlewares)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
     app.router.add_get('/', handle_configure)
     app.router.add_get('/configure', handle_configure)
     app.router.add_get('/manifest.json', handle_manifest_no_config)
+    app.router.add_post('/config', handle_config_save)
     app.router.add_get('/stream/{type}/{id}.json', handle_stream_no_config)
+    app.router.add_get('/play/{hash}/{file:.+}', handle_play)
+    app.router.add_get('/admin/torrents', handle_admin_torrents)
+    app.router.add_get('/admin/breakers', handle_admin_breakers)
+    app.router.add_get('/metrics', handle_metrics)
+    app.router.add_get('/admin/profiles', handle_admin_profiles)
+    app.router.add_get('/admin/profiles/aggregate', handle_admin_profile_aggregate)
+    app.router.add_get('/admin/profiles/{id}', handle_admin_profile)
     app.router.add_get('/{config}/', handle_configure) # Nouvelle route pour config pré-remplie
     app.router.add_get('/{config}/configure', handle_configure) # Nouvelle route pour config pré-remplie
     app.router.add_get('/{config}/manifest.json', handle_manifest)
@@ -838,8 +1597,23 @@ async def get_app():
     return app
 
 if __name__ == '__main__':
-    web.run_app(
-        get_app(),
-        host='0.0.0.0',
-        port=7777
-    )
\ No newline at end of file
+    HOST = os.getenv('HOST', '0.0.0.0')
+    PORT = int(os.getenv('PORT', '7777'))
+    SHUTDOWN_TIMEOUT = float(os.getenv('WORKER_SHUTDOWN_TIMEOUT', '30'))
+    if workers.worker_id() == workers.SUPERVISOR:
+        # Superviseur : ne sert rien lui-même, lance et surveille WORKERS processus
+        workers.Supervisor(
+            [sys.executable, os.path.abspath(__file__)], WORKERS, HOST, PORT,
+            reuse_port=os.getenv('WORKER_REUSE_PORT', 'true').lower() == 'true',
+            shutdown_timeout=SHUTDOWN_TIMEOUT
+        ).run()
+    elif workers.worker_id() is not None:
+        web.run_app(get_app(), sock=workers.worker_socket(HOST, PORT),
+                    shutdown_timeout=SHUTDOWN_TIMEOUT, print=None)
+    else:
+        web.run_app(
+            get_app(),
+            host=HOST,
+            port=PORT,
+            shutdown_timeout=SHUTDOWN_TIMEOUT
+        )
\ No newline at end of file
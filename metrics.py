@@ -0,0 +1,186 @@
+"""
+Métriques au format texte Prometheus (/metrics)
+
+Implémentation minimale sans dépendance : compteurs et histogrammes indexés
+par tuple de labels, plus des métriques calculées à la lecture (caches).
+L'enregistrement ne fait qu'un bisect et deux additions : rien n'est alloué
+sur le chemin chaud une fois la série de labels créée.
+"""
+import asyncio
+import logging
+from bisect import bisect_left
+
+# Bornes (secondes) adaptées aux appels HTTP externes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Bornes pour le retard de la boucle asyncio
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        try:
+            self.values[labels] += amount
+        except KeyError:
+            self.values[labels] = amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self.values.items():
+            yield f"{self.name}{_labels(self.label_names, labels)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self.buckets = tuple(buckets)
+        # labels -> [compte par bucket (+Inf en dernier), somme, total]
+        self.series = {}
+
+    def observe(self, value, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = f'le="{_number(float(bound))}"'
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {count}"
+
+
+class Computed:
+    """Métrique lue au moment du scrape : `collect()` retourne [(labels, valeur)]"""
+
+    def __init__(self, name, help_text, kind, labels, collect):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.label_names = labels
+        self.collect = collect
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for labels, value in self.collect():
+            yield f"{self.name}{_labels(self.label_names, labels)} {_number(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(name, help_text, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def computed(self, name, help_text, kind='gauge', labels=(), collect=None):
+        metric = Computed(name, help_text, kind, labels, collect)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logging.warning(f"Metrics: {metric.name} failed: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.histogram(
+    'frenchio_http_request_duration_seconds', "Durée des requêtes servies, par route", ('route', 'status'))
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    'frenchio_upstream_request_duration_seconds', "Durée des appels aux services externes", ('upstream',))
+UPSTREAM_ERRORS = REGISTRY.counter(
+    'frenchio_upstream_errors_total', "Appels externes en erreur (HTTP >= 400 ou exception)", ('upstream', 'kind'))
+SOURCE_RESULTS = REGISTRY.counter(
+    'frenchio_source_results_total', "Torrents retournés par chaque source de recherche", ('source',))
+STREAM_RESULTS = REGISTRY.counter(
+    'frenchio_stream_torrents_total', "Torrents proposés, cachés sur le débrideur ou non", ('kind',))
+QBIT_TIME_TO_READY = REGISTRY.histogram(
+    'frenchio_qbit_time_to_ready_seconds', "Attente avant redirection vers un stream qBittorrent", ('ready',))
+LOOP_LAG = REGISTRY.histogram(
+    'frenchio_event_loop_lag_seconds', "Retard de la boucle asyncio mesuré par échantillonnage", buckets=LAG_BUCKETS)
+
+
+def error_kind(status=None, exception=None):
+    if exception is not None:
+        return 'timeout' if isinstance(exception, asyncio.TimeoutError) else 'exception'
+    return '5xx' if status >= 500 else '4xx'
+
+
+def observe_upstream(upstream, duration, status=None, exception=None):
+    UPSTREAM_LATENCY.observe(duration, upstream)
+    if exception is not None or status >= 400:
+        UPSTREAM_ERRORS.inc(upstream, error_kind(status, exception))
+
+
+def register_caches(caches):
+    """
+    Expose les compteurs des caches. `caches()` retourne [(nom, cache)] pour
+    des objets ayant `hits`, `misses` et éventuellement `__len__`.
+    """
+    def hits():
+        return [((name,), cache.hits) for name, cache in caches()]
+
+    def misses():
+        return [((name,), cache.misses) for name, cache in caches()]
+
+    def ratio():
+        return [((name,), cache.hits / (cache.hits + cache.misses))
+                for name, cache in caches() if cache.hits + cache.misses]
+
+    def entries():
+        return [((name,), len(cache)) for name, cache in caches() if hasattr(cache, '__len__')]
+
+    REGISTRY.computed('frenchio_cache_hits_total', "Lectures servies par le cache", 'counter', ('cache',), hits)
+    REGISTRY.computed('frenchio_cache_misses_total', "Lectures absentes du cache", 'counter', ('cache',), misses)
+    REGISTRY.computed('frenchio_cache_hit_ratio', "Proportion de lectures servies par le cache", 'gauge', ('cache',), ratio)
+    REGISTRY.computed('frenchio_cache_entries', "Entrées en cache", 'gauge', ('cache',), entries)
+
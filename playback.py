@@ -0,0 +1,243 @@
+"""
+Lecture directe des téléchargements qBittorrent (/play/{hash}/{file})
+
+Sert les fichiers du dossier de téléchargement avec support des Range HTTP.
+Tant qu'un fichier est incomplet, chaque lecture attend que les pièces
+couvrant la plage demandée soient téléchargées avant de les envoyer.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from aiohttp import web
+
+from services.qbittorrent import PIECE_DOWNLOADED, PRIORITY_MAX, StreamTarget
+
+# Taille max d'une fenêtre d'envoi (une attente de pièces par fenêtre)
+WINDOW_SIZE = 4 * 1024 * 1024
+
+
+class PieceWatcher:
+    """
+    Suit l'état des pièces d'un torrent. Un seul polling par torrent, quel
+    que soit le nombre de lecteurs, et seulement tant que quelqu'un attend.
+    """
+
+    def __init__(self, qbit_service, info_hash, interval=0.5):
+        self.qbit_service = qbit_service
+        self.info_hash = info_hash
+        self.interval = interval
+        self.states = []
+        self._changed = asyncio.Condition()
+        self._waiters = 0
+        self._task = None
+
+    def has(self, pieces):
+        states = self.states
+        return all(i < len(states) and states[i] == PIECE_DOWNLOADED for i in pieces)
+
+    async def wait_for(self, pieces, timeout):
+        if self.has(pieces):
+            return True
+        self._waiters += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._poll())
+        try:
+            async with self._changed:
+                await asyncio.wait_for(self._changed.wait_for(lambda: self.has(pieces)), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._waiters -= 1
+
+    async def _poll(self):
+        client = self.qbit_service.client
+        while self._waiters:
+            try:
+                states = await asyncio.to_thread(client.torrents_piece_states, torrent_hash=self.info_hash)
+            except Exception as e:
+                logging.warning(f"Play: piece states failed for {self.info_hash[:8]}: {e}")
+            else:
+                self.states = list(states)
+                async with self._changed:
+                    self._changed.notify_all()
+            await asyncio.sleep(self.interval)
+
+
+class PlaySession:
+    """Fichier annoncé par handle_resolve, avec ce qu'il faut pour suivre son téléchargement"""
+
+    def __init__(self, qbit_service, target):
+        self.qbit_service = qbit_service
+        self.target = target
+        self.watcher = PieceWatcher(qbit_service, target.info_hash)
+        self.complete = False
+        self.prioritized = False
+        self.last_access = time.monotonic()
+
+    def pieces_for(self, start, end):
+        """Pièces couvrant les octets [start, end) du fichier"""
+        t = self.target
+        plen = t.piece_length
+        if t.file_offset is not None:
+            first = (t.file_offset + start) // plen
+            last = (t.file_offset + end - 1) // plen
+        else:
+            # Offset exact inconnu : on prend une pièce de marge
+            first = t.first_piece + start // plen
+            last = t.first_piece + (end - 1) // plen + 1
+        return range(max(first, t.first_piece), min(last, t.last_piece) + 1)
+
+    async def prioritize(self):
+        """
+        L'API WebUI ne permet pas de prioriser des pièces isolées : on passe
+        le fichier lu en priorité maximale (le séquentiel fait le reste).
+        """
+        if self.prioritized:
+            return
+        self.prioritized = True
+        try:
+            await asyncio.to_thread(
+                self.qbit_service.client.torrents_file_priority,
+                torrent_hash=self.target.info_hash,
+                file_ids=self.target.file_index,
+                priority=PRIORITY_MAX
+            )
+        except Exception as e:
+            logging.debug(f"Play: could not raise file priority: {e}")
+
+
+class PlayRegistry:
+    """
+    Sessions de lecture connues, bornées (les plus anciennes sont oubliées).
+
+    Avec plusieurs workers, le /play peut arriver sur un autre processus que
+    le resolve : la session (fichier, position dans les pièces) est aussi
+    rangée dans le cache partagé (`shared`), avec une référence sans secret à
+    son qBittorrent (`owner` : jeton du ConfigStore ou empreinte des
+    identifiants), et reconstruite à la demande.
+    """
+
+    def __init__(self, max_sessions=256, shared=None, shared_ttl=86400):
+        self.max_sessions = max_sessions
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+        self._sessions = OrderedDict()
+
+    def _add(self, qbit_service, target):
+        key = (target.info_hash, target.file_name)
+        session = self._sessions.get(key)
+        if session is None or session.qbit_service is not qbit_service:
+            session = PlaySession(qbit_service, target)
+            self._sessions[key] = session
+        self._sessions.move_to_end(key)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return session
+
+    async def register(self, qbit_service, target, owner):
+        session = self._add(qbit_service, target)
+        if self.shared:
+            t = target
+            await self.shared.set((t.info_hash, t.file_name), (
+                owner, t.url, t.file_size, t.first_piece, t.last_piece,
+                t.piece_length, t.file_index, t.file_offset), self.shared_ttl)
+        return session
+
+    async def get(self, info_hash, file_name, service_for):
+        """
+        Session du fichier, reconstruite depuis le cache partagé si un autre
+        worker l'a enregistrée (`service_for(owner)` redonne son qBittorrent,
+        ou None) ; None si aucun resolve ne l'a annoncée.
+        """
+        info_hash = info_hash.lower()
+        session = self._sessions.get((info_hash, file_name))
+        if session is None and self.shared:
+            hit = await self.shared.get((info_hash, file_name))
+            if hit is not None:
+                owner, url, *layout = hit[0]
+                qbit_service = await service_for(owner)
+                if qbit_service is not None:
+                    session = self._add(qbit_service, StreamTarget(info_hash, file_name, url, *layout))
+        if session:
+            session.last_access = time.monotonic()
+        return session
+
+def resolve_path(download_dir, file_name):
+    """Chemin absolu du fichier, ou None s'il sort du dossier de téléchargement"""
+    root = os.path.realpath(download_dir)
+    path = os.path.realpath(os.path.join(root, file_name))
+    if not path.startswith(root + os.sep):
+        return None
+    return path
+
+
+async def serve_partial(request, session, path, read_timeout):
+    """
+    Sert un fichier en cours de téléchargement. La plage demandée est envoyée
+    par fenêtres ; chaque fenêtre attend ses pièces puis part en sendfile
+    (copie en mémoire si le transport ne le permet pas, ex. TLS).
+    """
+    target = session.target
+    size = target.file_size
+    try:
+        rng = request.http_range
+        start = rng.start or 0
+        if start < 0:
+            # bytes=-N : aiohttp donne slice(-N, None), les N derniers octets
+            start = max(size + start, 0)
+            end = size
+        else:
+            end = min(rng.stop if rng.stop is not None else size, size)
+    except ValueError:
+        raise web.HTTPRequestRangeNotSatisfiable(headers={'Content-Range': f"bytes */{size}"})
+    if start >= size or start >= end:
+        raise web.HTTPRequestRangeNotSatisfiable(headers={'Content-Range': f"bytes */{size}"})
+
+    partial = 'Range' in request.headers
+    response = web.StreamResponse(status=206 if partial else 200)
+    response.content_type = 'application/octet-stream'
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.content_length = end - start
+    if partial:
+        response.headers['Content-Range'] = f"bytes {start}-{end - 1}/{size}"
+    await response.prepare(request)
+    if request.method == 'HEAD':
+        return response
+
+    await session.prioritize()
+    loop = asyncio.get_running_loop()
+    transport = request.transport
+
+    # Le fichier n'existe pas forcément avant l'arrivée de sa première pièce
+    fobj = None
+    try:
+        pos = start
+        while pos < end:
+            window_end = min(pos + WINDOW_SIZE, end)
+            if not await session.watcher.wait_for(session.pieces_for(pos, window_end), read_timeout):
+                logging.warning(f"Play: pieces for bytes {pos}-{window_end} not available after {read_timeout}s")
+                # Connexion coupée : le lecteur relancera une requête Range
+                raise ConnectionResetError("pieces not available")
+            if transport is None or transport.is_closing():
+                raise ConnectionResetError("client disconnected")
+            if fobj is None:
+                fobj = await asyncio.to_thread(open, path, 'rb')
+            count = window_end - pos
+            try:
+                await loop.sendfile(transport, fobj, pos, count)
+            except NotImplementedError:
+                data = await loop.run_in_executor(None, os.pread, fobj.fileno(), count, pos)
+                await response.write(data)
+            pos = window_end
+    finally:
+        if fobj is not None:
+            fobj.close()
+
+    if session.watcher.has(range(target.first_piece, target.last_piece + 1)):
+        session.complete = True
+    await response.write_eof()
+    return response
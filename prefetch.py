@@ -0,0 +1,178 @@
+"""
+Travail spéculatif en arrière-plan (pré-résolution des streams, préchargement
+de l'épisode suivant)
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+
+class BackgroundRunner:
+    """
+    Lance des tâches en arrière-plan sans jamais bloquer la requête appelante.
+
+    - `per_user` tâches au plus s'exécutent en même temps pour un utilisateur
+      (les suivantes attendent leur tour)
+    - `max_pending` tâches au plus sont en file par utilisateur, le reste est ignoré
+    - `max_tasks` borne le nombre total de tâches vivantes
+    """
+
+    def __init__(self, per_user=1, max_pending=4, max_tasks=64):
+        self.per_user = per_user
+        self.max_pending = max_pending
+        self.max_tasks = max_tasks
+        self._semaphores = {}
+        self._pending = {}
+        self._tasks = set()
+
+    def submit(self, user, name, coro_factory):
+        """
+        Planifie `coro_factory()` pour `user`. Retourne False si la tâche a été
+        refusée (file pleine), True sinon.
+        """
+        if len(self._tasks) >= self.max_tasks:
+            logging.debug(f"Background: global limit reached, dropping {name}")
+            return False
+        if self._pending.get(user, 0) >= self.max_pending:
+            logging.debug(f"Background: user queue full, dropping {name}")
+            return False
+
+        self._pending[user] = self._pending.get(user, 0) + 1
+        task = asyncio.create_task(self._run(user, name, coro_factory))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _run(self, user, name, coro_factory):
+        semaphore = self._semaphores.get(user)
+        if semaphore is None:
+            semaphore = self._semaphores[user] = asyncio.Semaphore(self.per_user)
+        try:
+            async with semaphore:
+                await coro_factory()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"Background: {name} failed: {e}")
+        finally:
+            self._pending[user] -= 1
+            if not self._pending[user]:
+                del self._pending[user]
+                self._semaphores.pop(user, None)
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+class PrefetchQueue:
+    """
+    File basse priorité pour le préchargement (recherches, TMDB, disponibilité).
+
+    - `workers` tâches au plus s'exécutent en même temps (budget global de concurrence)
+    - chaque utilisateur dispose de `user_budget` préchargements par fenêtre
+      de `window` secondes, l'instance entière de `global_budget`
+    - dès que `is_busy()` est vrai, la file est vidée et les tâches en cours
+      sont annulées : le trafic des utilisateurs passe toujours en premier
+    """
+
+    def __init__(self, workers=2, max_queue=64, user_budget=20, global_budget=200, window=3600, is_busy=None):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.user_budget = user_budget
+        self.global_budget = global_budget
+        self.window = window
+        self.is_busy = is_busy or (lambda: False)
+        self._queue = deque()
+        self._keys = set()
+        self._user_spent = {}
+        self._global_spent = deque()
+        self._wakeup = None
+        self._workers = []
+        self._running = set()
+
+    def _spend(self, spent, limit, now):
+        while spent and spent[0] <= now - self.window:
+            spent.popleft()
+        return len(spent) < limit
+
+    def submit(self, key, user, name, coro_factory):
+        """
+        Met un préchargement en file. `key` sert à dédupliquer les demandes
+        identiques. Retourne False si la demande est ignorée.
+        """
+        if key in self._keys or len(self._queue) >= self.max_queue or self.is_busy():
+            return False
+
+        now = time.monotonic()
+        if len(self._user_spent) > 4096:
+            self._user_spent = {u: d for u, d in self._user_spent.items() if d and d[-1] > now - self.window}
+        user_spent = self._user_spent.setdefault(user, deque())
+        if not self._spend(user_spent, self.user_budget, now):
+            logging.debug(f"Prefetch: user budget exhausted, dropping {name}")
+            return False
+        if not self._spend(self._global_spent, self.global_budget, now):
+            logging.debug(f"Prefetch: global budget exhausted, dropping {name}")
+            return False
+        user_spent.append(now)
+        self._global_spent.append(now)
+
+        self._keys.add(key)
+        self._queue.append((key, name, coro_factory))
+        self._start()
+        self._wakeup.set()
+        return True
+
+    def _start(self):
+        if self._workers:
+            return
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self):
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            key, name, coro_factory = self._queue.popleft()
+            try:
+                if self.is_busy():
+                    self._drop(f"system busy, dropping {name}")
+                    continue
+                await self._run(name, coro_factory)
+            finally:
+                self._keys.discard(key)
+
+    async def _run(self, name, coro_factory):
+        task = asyncio.create_task(coro_factory())
+        self._running.add(task)
+        try:
+            # Surveille la charge pendant l'exécution
+            while not task.done():
+                await asyncio.wait([task], timeout=0.5)
+                if not task.done() and self.is_busy():
+                    task.cancel()
+                    logging.info(f"Prefetch: system busy, cancelled {name}")
+            if not task.cancelled() and task.exception():
+                logging.warning(f"Prefetch: {name} failed: {task.exception()}")
+        finally:
+            self._running.discard(task)
+
+    def _drop(self, reason):
+        logging.info(f"Prefetch: {reason} (+{len(self._queue)} queued)")
+        while self._queue:
+            key, _, _ = self._queue.popleft()
+            self._keys.discard(key)
+
+    async def close(self):
+        tasks = self._workers + list(self._running)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
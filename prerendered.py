@@ -0,0 +1,138 @@
+"""
+Réponses rendues une fois puis servies telles quelles
+
+Manifest et page de configuration ne dépendent que de l'environnement (et,
+pour la page pré-remplie, de la config de l'URL) : leur corps est calculé une
+seule fois avec son ETag, sa date de rendu et ses variantes compressées
+(gzip, et brotli si le module `brotli` est installé). Une requête ne coûte
+alors qu'un choix de variante, ou une réponse 304 si le client a déjà la
+bonne version (If-None-Match, ou à défaut If-Modified-Since).
+
+Les réponses calculées à chaque requête (streams) passent par
+conditional_response() : même ETag fort tiré du corps, même 304, et
+compression gzip rapide des seuls corps assez gros.
+"""
+import gzip
+import hashlib
+import json
+import time
+from email.utils import formatdate, parsedate_to_datetime
+
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Une variante compressée n'est servie que si elle fait gagner au moins ce nombre d'octets
+MIN_SAVING = 256
+# Réponses dynamiques : compressées au-delà de cette taille, avec un niveau rapide
+DYNAMIC_MIN_SIZE = 1024
+DYNAMIC_GZIP_LEVEL = 5
+
+
+def _accepted_encodings(header):
+    """Encodages acceptés par le client (q=0 exclus)"""
+    accepted = set()
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q=') and q[2:].strip() in ('0', '0.0', '0.00', '0.000'):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def _etag(body):
+    return hashlib.sha256(body).hexdigest()[:20]
+
+
+def _matches(request, etags):
+    """True si If-None-Match désigne l'une des versions `etags` (None sans en-tête)"""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is None:
+        return None
+    tags = {t.strip().removeprefix('W/') for t in if_none_match.split(',')}
+    return '*' in tags or bool(tags & etags)
+
+
+def conditional_response(request, body, content_type, cache_control, charset='utf-8'):
+    """
+    Réponse calculée pour cette requête, avec ETag fort, 304 si le client a
+    déjà ce corps, et gzip pour les corps de plus de DYNAMIC_MIN_SIZE octets
+    """
+    if isinstance(body, str):
+        body = body.encode(charset)
+    tag = _etag(body)
+    compress = len(body) >= DYNAMIC_MIN_SIZE
+    gzip_ok = compress and 'gzip' in _accepted_encodings(request.headers.get('Accept-Encoding', ''))
+    etag = f'"{tag}-gzip"' if gzip_ok else f'"{tag}"'
+    headers = {'ETag': etag, 'Cache-Control': cache_control}
+    if compress:
+        headers['Vary'] = 'Accept-Encoding'
+    if _matches(request, {f'"{tag}"', f'"{tag}-gzip"'}):
+        return web.Response(status=304, headers=headers)
+    if gzip_ok:
+        body = gzip.compress(body, compresslevel=DYNAMIC_GZIP_LEVEL, mtime=0)
+        headers['Content-Encoding'] = 'gzip'
+    return web.Response(body=body, headers=headers, content_type=content_type, charset=charset)
+
+
+class PrerenderedResponse:
+    def __init__(self, body, content_type, cache_control, charset='utf-8'):
+        if isinstance(body, str):
+            body = body.encode(charset)
+        self.content_type = content_type
+        self.charset = charset
+        self.cache_control = cache_control
+        self.rendered_at = int(time.time())
+        self.last_modified = formatdate(self.rendered_at, usegmt=True)
+        tag = _etag(body)
+        # Un ETag fort par encodage : les octets envoyés diffèrent
+        self.variants = {'identity': (body, f'"{tag}"')}
+        compressed = {'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            compressed['br'] = brotli.compress(body, quality=11)
+        for encoding, data in compressed.items():
+            if len(data) + MIN_SAVING <= len(body):
+                self.variants[encoding] = (data, f'"{tag}-{encoding}"')
+        self.etags = {etag for _, etag in self.variants.values()}
+
+    @classmethod
+    def json(cls, value, cache_control):
+        return cls(json.dumps(value), 'application/json', cache_control)
+
+    def _not_modified(self, request):
+        matched = _matches(request, self.etags)
+        if matched is not None:
+            return matched
+        if_modified_since = request.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                return parsedate_to_datetime(if_modified_since).timestamp() >= self.rendered_at
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _variant(self, request):
+        accepted = _accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and encoding in accepted:
+                return encoding, self.variants[encoding]
+        return 'identity', self.variants['identity']
+
+    def respond(self, request):
+        encoding, (body, etag) = self._variant(request)
+        headers = {
+            'ETag': etag,
+            'Last-Modified': self.last_modified,
+            'Cache-Control': self.cache_control,
+        }
+        if len(self.variants) > 1:
+            headers['Vary'] = 'Accept-Encoding'
+        if self._not_modified(request):
+            return web.Response(status=304, headers=headers)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return web.Response(body=body, headers=headers, content_type=self.content_type, charset=self.charset)
@@ -0,0 +1,95 @@
+"""
+Profilage à la demande des requêtes (cProfile)
+
+Une requête est profilée quand l'administrateur le demande (en-tête avec
+ADMIN_TOKEN) ou par échantillonnage. Les profils sont gardés en mémoire sous
+un libellé sans la config (donc sans clés API) et se téléchargent depuis les
+routes /admin/profiles, un par un ou agrégés sur une fenêtre de temps.
+
+cProfile mesure le thread de la boucle : pendant les attentes réseau de la
+requête profilée, le travail des autres requêtes est aussi compté. Un seul
+profil tourne à la fois.
+"""
+import cProfile
+import io
+import itertools
+import logging
+import marshal
+import pstats
+import time
+from collections import deque
+
+
+class ProfileRecord:
+    __slots__ = ('id', 'created_at', 'label', 'duration', 'stats')
+
+    def __init__(self, id, created_at, label, duration, stats):
+        self.id = id
+        self.created_at = created_at
+        self.label = label
+        self.duration = duration
+        self.stats = stats
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "created_at": int(self.created_at),
+            "label": self.label,
+            "duration_ms": round(self.duration * 1000, 1),
+        }
+
+
+class RequestProfiler:
+    def __init__(self, keep=100):
+        self.profiles = deque(maxlen=keep)
+        self._ids = itertools.count(1)
+        self._active = False
+
+    @property
+    def busy(self):
+        return self._active
+
+    async def run(self, label, handler, request):
+        """Exécute `handler(request)` sous cProfile, retourne (réponse, id du profil)"""
+        self._active = True
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            response = await handler(request)
+        finally:
+            profile.disable()
+            self._active = False
+            record = ProfileRecord(next(self._ids), time.time(), label, time.perf_counter() - start,
+                                   pstats.Stats(profile))
+            self.profiles.append(record)
+            logging.info(f"Profile #{record.id} recorded: {label} ({record.duration * 1000:.0f} ms)")
+        return response, record.id
+
+    def get(self, profile_id):
+        for record in self.profiles:
+            if record.id == profile_id:
+                return record
+        return None
+
+    def aggregate(self, window):
+        """Fusionne les profils des `window` dernières secondes, retourne (stats, nombre de profils)"""
+        since = time.time() - window
+        records = [r for r in self.profiles if r.created_at >= since]
+        if not records:
+            return None, 0
+        stats = pstats.Stats()
+        stats.add(*[r.stats for r in records])
+        return stats, len(records)
+
+
+def render_text(stats, sort='cumulative', limit=60):
+    out = io.StringIO()
+    stats.stream = out
+    stats.sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+def render_pstats(stats):
+    """Format binaire de pstats (snakeviz, `python -m pstats fichier`)"""
+    return marshal.dumps(stats.stats)
@@ -0,0 +1,447 @@
+"""
+Enregistrement et rejeu des échanges HTTP avec les services externes
+
+En enregistrement, chaque réponse amont (ou erreur) est capturée avec sa
+durée dans un corpus sur disque. En rejeu, les mêmes requêtes reçoivent ces
+réponses, sans réseau et après la même durée : une régression observée en
+production se reproduit à l'identique, et le banc tourne sur de vraies pages
+ABN, réponses UNIT3D ou débrideurs.
+
+Corpus : un index `<service>.jsonl` par service (une ligne par échange) et
+les corps compressés dans `bodies/`, adressés par leur SHA-1 (une page servie
+cent fois n'est stockée qu'une fois). Les secrets (clés API, passkeys, mots
+de passe, jetons, cookies) sont masqués avant écriture. La clé de rejeu est
+calculée sur la requête masquée : le corpus se rejoue avec n'importe quelle
+config utilisateur.
+
+Une même requête enregistrée plusieurs fois (statut d'un magnet interrogé en
+boucle...) est rejouée dans l'ordre, la dernière réponse servant ensuite.
+"""
+import asyncio
+import contextvars
+import hashlib
+import http
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from urllib.parse import urlencode
+
+import aiohttp
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+MASK = '***'
+# Requêtes reçues par l'addon pendant l'enregistrement (hors index : pas d'extension .jsonl)
+INBOUND_LOG = 'inbound.log'
+
+# Champs (query, formulaire, JSON, config utilisateur) dont la valeur est un secret
+_SECRET_FIELD_RE = re.compile(
+    r'(?:\w*_)?(?:api_?key|api_?token|key|token|passkey|rsskey|password|username|secret)|__RequestVerificationToken',
+    re.IGNORECASE
+)
+_SECRET_HEADERS = ('authorization', 'proxy-authorization', 'cookie')
+# En-têtes de réponse non conservés
+_DROPPED_HEADERS = ('set-cookie', 'date', 'content-length', 'content-encoding', 'transfer-encoding')
+# Secrets hors des champs nommés : passkey Sharewood dans le chemin, rsskey des liens de
+# téléchargement UNIT3D, paramètres de liens présents dans les corps de réponse
+_SECRET_PATTERNS = [re.compile(p) for p in (
+    rb'(/api/)[A-Za-z0-9]{16,}(?=/)',
+    rb'(/torrents?/download/\d+\.)[A-Za-z0-9]+',
+    rb'(?i)([?&;](?:amp;)?(?:api_?key|api_?token|passkey|rsskey|token)=)[^&"\'\s<>\\]+',
+)]
+# En dessous, une valeur de champ secret ("true", "1"...) n'est pas recherchée ailleurs
+_MIN_SECRET_LENGTH = 6
+
+# Secrets de la config utilisateur de la requête en cours (passkey dans un chemin, clé dans un corps...)
+_CONFIG_SECRETS = contextvars.ContextVar('replay_config_secrets', default=frozenset())
+
+
+def _config_secrets(value, secret=False):
+    if isinstance(value, dict):
+        return set().union(*(_config_secrets(v, bool(_SECRET_FIELD_RE.fullmatch(k))) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return set().union(*(_config_secrets(v, secret) for v in value))
+    if secret and isinstance(value, str) and len(value) >= _MIN_SECRET_LENGTH:
+        return {value.encode()}
+    return set()
+
+
+def use_config(config):
+    """Secrets de `config` effacés de tous les échanges de la requête en cours (et de ses tâches de fond)"""
+    return _CONFIG_SECRETS.set(frozenset(_config_secrets(config)))
+
+
+def reset_config(token):
+    _CONFIG_SECRETS.reset(token)
+
+
+class Redactor:
+    """Masquage des secrets d'un échange : ceux des champs nommés sont aussi effacés partout ailleurs"""
+
+    def __init__(self):
+        self.secrets = set(_CONFIG_SECRETS.get())
+
+    def field(self, key, value):
+        if value is None or not _SECRET_FIELD_RE.fullmatch(str(key)):
+            return value
+        value = str(value)
+        if len(value) >= _MIN_SECRET_LENGTH:
+            self.secrets.add(value.encode())
+        return MASK
+
+    def header(self, key, value):
+        if key.lower() not in _SECRET_HEADERS:
+            return value
+        # "Bearer <clé>" : la clé elle-même est un secret
+        for part in str(value).split():
+            if len(part) >= _MIN_SECRET_LENGTH:
+                self.secrets.add(part.encode())
+        return MASK
+
+    def scrub(self, data, keep_length=False):
+        """
+        Efface secrets et motifs connus de `data` (bytes). `keep_length` conserve
+        la longueur (corps de réponse : un .torrent reste décodable)
+        """
+        def mask(secret):
+            return b'*' * len(secret) if keep_length else MASK.encode()
+
+        for secret in sorted(self.secrets, key=len, reverse=True):
+            data = data.replace(secret, mask(secret))
+        for pattern in _SECRET_PATTERNS:
+            data = pattern.sub(lambda m: m.group(1) + mask(m.group(0)[len(m.group(1)):]), data)
+        return data
+
+    def url(self, url, params=None):
+        url = URL(url)
+        query = [(k, self.field(k, v)) for k, v in url.query.items()]
+        query += [(k, self.field(k, v)) for k, v in _items(params)]
+        base = url.with_query(None).with_fragment(None)
+        text = str(base) + ('?' + urlencode(sorted(query)) if query else '')
+        return self.scrub(text.encode()).decode()
+
+    def body(self, kwargs):
+        """Corps de requête masqué (bytes), None si absent ou opaque (FormData, flux)"""
+        if kwargs.get('json') is not None:
+            value = kwargs['json']
+            if isinstance(value, dict):
+                value = {k: self.field(k, v) for k, v in value.items()}
+            return self.scrub(json.dumps(value, sort_keys=True).encode())
+        data = kwargs.get('data')
+        if isinstance(data, (dict, list, tuple)):
+            return self.scrub(urlencode(sorted((k, self.field(k, v)) for k, v in _items(data))).encode())
+        if isinstance(data, str):
+            data = data.encode()
+        if isinstance(data, bytes):
+            return self.scrub(data)
+        return None
+
+
+def mask_config(value):
+    """Config utilisateur sans ses secrets (clés, passkeys, identifiants), pour le journal des requêtes entrantes"""
+    if isinstance(value, dict):
+        return {k: MASK if _SECRET_FIELD_RE.fullmatch(k) and v else mask_config(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [mask_config(v) for v in value]
+    return value
+
+
+def _items(mapping):
+    """Paires (clé, valeur) d'un dict ou d'une liste de paires, listes de valeurs dépliées"""
+    if not mapping:
+        return []
+    pairs = mapping.items() if isinstance(mapping, dict) else mapping
+    items = []
+    for key, value in pairs:
+        for v in (value if isinstance(value, (list, tuple)) else [value]):
+            items.append((str(key), str(v)))
+    return items
+
+
+def body_digest(masked_body):
+    return hashlib.sha1(masked_body).hexdigest()[:16] if masked_body else '-'
+
+
+def exchange_key(method, masked_url, digest):
+    return f"{method.upper()} {masked_url} {digest}"
+
+
+class Corpus:
+    """Corpus d'échanges sur disque ; les méthodes d'écriture/lecture font des I/O bloquantes (asyncio.to_thread)"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._exchanges = {}
+        self._served = {}
+        self.misses = 0
+
+    def _body_path(self, digest):
+        return os.path.join(self.directory, 'bodies', digest[:2], digest)
+
+    def write(self, service, entry, content):
+        """Ajoute un échange (et son corps s'il n'est pas déjà stocké)"""
+        with self._lock:
+            if content is not None:
+                digest = hashlib.sha1(content).hexdigest()
+                entry['content'] = digest
+                path = self._body_path(digest)
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    tmp_path = f"{path}.tmp"
+                    with open(tmp_path, 'wb') as f:
+                        f.write(zlib.compress(content, 6))
+                    os.replace(tmp_path, path)
+            with open(os.path.join(self.directory, f"{service}.jsonl"), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+
+    def write_inbound(self, entry):
+        """Requête reçue par l'addon (rejouée par le banc : python -m bench --replay)"""
+        with self._lock:
+            with open(os.path.join(self.directory, INBOUND_LOG), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+
+    def load(self):
+        """Charge les index (rejeu)"""
+        count = 0
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith('.jsonl'):
+                continue
+            with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    key = exchange_key(entry['method'], entry['url'], entry['body'])
+                    self._exchanges.setdefault(key, []).append(entry)
+                    count += 1
+        return count
+
+    def next(self, key):
+        """Prochain échange enregistré pour `key` (le dernier se répète), None si inconnu"""
+        entries = self._exchanges.get(key)
+        if not entries:
+            self.misses += 1
+            return None
+        served = self._served.get(key, 0)
+        self._served[key] = served + 1
+        return entries[min(served, len(entries) - 1)]
+
+    def content(self, digest):
+        with open(self._body_path(digest), 'rb') as f:
+            return zlib.decompress(f.read())
+
+
+def _mask_request(method, url, kwargs):
+    redactor = Redactor()
+    headers = {k: redactor.header(k, v) for k, v in (kwargs.get('headers') or {}).items()}
+    masked_url = redactor.url(url, kwargs.get('params'))
+    masked_body = redactor.body(kwargs)
+    return redactor, masked_url, masked_body, headers
+
+
+class RequestContext:
+    """Équivalent du _RequestContextManager d'aiohttp : s'utilise avec `async with` ou `await`"""
+
+    def __init__(self, coro):
+        self._coro = coro
+        self._resp = None
+
+    def __await__(self):
+        return self._coro.__await__()
+
+    async def __aenter__(self):
+        self._resp = await self._coro
+        return self._resp
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._resp.release()
+
+
+class _Session:
+    """Interface de ClientSession utilisée par les services"""
+
+    def request(self, method, url, **kwargs):
+        return RequestContext(self._request(method, url, **kwargs))
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+class RecordingSession(_Session):
+    """ClientSession réelle dont chaque échange est ajouté au corpus"""
+
+    def __init__(self, corpus, service, session):
+        self._corpus = corpus
+        self._service = service
+        self._session = session
+
+    def __getattr__(self, attr):
+        return getattr(self._session, attr)
+
+    async def close(self):
+        await self._session.close()
+
+    async def _request(self, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            resp = await self._session.request(method, url, **kwargs)
+            try:
+                # Corps lu d'avance : json()/text() le réutilisent
+                body = await resp.read()
+            except BaseException:
+                resp.release()
+                raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            await self._record(method, url, kwargs, time.perf_counter() - start, error=e)
+            raise
+        await self._record(method, url, kwargs, time.perf_counter() - start, resp=resp, body=body)
+        return resp
+
+    async def _record(self, method, url, kwargs, elapsed, resp=None, body=None, error=None):
+        redactor, masked_url, masked_body, headers = _mask_request(method, url, kwargs)
+        entry = {
+            "method": method.upper(),
+            "url": masked_url,
+            "body": body_digest(masked_body),
+            "elapsed": round(elapsed, 4),
+            "at": round(time.time(), 3),
+        }
+        content = None
+        if error is not None:
+            entry["error"] = 'timeout' if isinstance(error, asyncio.TimeoutError) else type(error).__name__
+        else:
+            entry["status"] = resp.status
+            entry["headers"] = [
+                (k, redactor.scrub(v.encode(), keep_length=True).decode())
+                for k, v in resp.headers.items() if k.lower() not in _DROPPED_HEADERS
+            ]
+            content = redactor.scrub(body, keep_length=True)
+        try:
+            await asyncio.to_thread(self._corpus.write, self._service, entry, content)
+        except OSError as e:
+            logging.warning(f"Upstream record: could not write to {self._corpus.directory}: {e}")
+
+
+class ReplayResponse:
+    """
+    Réponse rejouée, ou lue d'avance (upstream.hedged_get), compatible avec
+    l'usage que les services font de ClientResponse
+    """
+
+    def __init__(self, method, url, status, headers, body):
+        self.method = method
+        self.url = URL(url)
+        self.status = status
+        self.reason = http.HTTPStatus(status).phrase if status in http.HTTPStatus._value2member_map_ else ''
+        self.headers = CIMultiDictProxy(CIMultiDict(headers))
+        self._body = body
+
+    @property
+    def ok(self):
+        return self.status < 400
+
+    @property
+    def content_type(self):
+        return self.headers.get('Content-Type', 'application/octet-stream').split(';')[0].strip().lower()
+
+    @property
+    def charset(self):
+        match = re.search(r'charset=([\w-]+)', self.headers.get('Content-Type', ''), re.IGNORECASE)
+        return match.group(1) if match else None
+
+    @property
+    def request_info(self):
+        return aiohttp.RequestInfo(self.url, self.method, CIMultiDictProxy(CIMultiDict()), self.url)
+
+    async def read(self):
+        return self._body
+
+    async def text(self, encoding=None, errors='strict'):
+        return self._body.decode(encoding or self.charset or 'utf-8', errors)
+
+    async def json(self, *, encoding=None, loads=json.loads, content_type='application/json'):
+        # Même contrôle qu'aiohttp : une page d'erreur HTML lève ContentTypeError, pas JSONDecodeError
+        if content_type and not (self.content_type == content_type
+                                 or content_type == 'application/json' and 'json' in self.content_type):
+            raise aiohttp.ContentTypeError(
+                self.request_info, (), status=self.status,
+                message=f"Attempt to decode JSON with unexpected mimetype: {self.content_type}", headers=self.headers
+            )
+        return loads(await self.text(encoding))
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise aiohttp.ClientResponseError(
+                self.request_info, (), status=self.status, message=self.reason, headers=self.headers
+            )
+
+    def release(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+
+class ReplaySession(_Session):
+    """Session sans réseau : les réponses viennent du corpus, après leur durée d'origine × `speed`"""
+
+    def __init__(self, corpus, service, speed=1.0, observe=None):
+        self._corpus = corpus
+        self._service = service
+        self._speed = speed
+        self._observe = observe
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+    async def _request(self, method, url, **kwargs):
+        start = time.perf_counter()
+        _, masked_url, masked_body, _ = _mask_request(method, url, kwargs)
+        entry = self._corpus.next(exchange_key(method, masked_url, body_digest(masked_body)))
+        status, error = None, None
+        try:
+            if entry is None:
+                logging.warning(f"Upstream replay: no recorded exchange for {method.upper()} {masked_url}")
+                raise aiohttp.ClientConnectionError(f"no recorded exchange for {method.upper()} {masked_url}")
+            if self._speed > 0:
+                await asyncio.sleep(entry['elapsed'] * self._speed)
+            if 'error' in entry:
+                if entry['error'] == 'timeout':
+                    raise asyncio.TimeoutError()
+                raise aiohttp.ClientConnectionError(f"recorded {entry['error']}")
+            body = await asyncio.to_thread(self._corpus.content, entry['content']) if entry.get('content') else b''
+            status = entry['status']
+            return ReplayResponse(method.upper(), url, status, entry.get('headers', []), body)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = e
+            raise
+        finally:
+            if self._observe:
+                self._observe(method.upper(), URL(url), start, status, error)
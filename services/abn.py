@@ -1,19 +1,23 @@
-import aiohttp
+import upstream
+from timing import stage
 import logging
 import asyncio
+import aiohttp
 from html.parser import HTMLParser
 import re
 
+ABN_URL = "https://abn.lol"
+
 class ABNService:
     """
     Service pour le tracker ABNormal (ABN)
     Tracker privé français avec authentification par username/password
     """
     
-    def __init__(self, username, password, base_url="https://abn.lol"):
+    def __init__(self, username, password, base_url=None):
         self.username = username
         self.password = password
-        self.base_url = base_url.rstrip('/')
+        self.base_url = (base_url or upstream.base_url("abn", ABN_URL)).rstrip('/')
         self.session = None
         self._login_lock = None
     
@@ -25,22 +29,40 @@ class ABNService:
             logging.debug("ABN: Session closed")
         
     async def _ensure_session(self):
-        """Crée et authentifie une session persistante"""
+        """Crée et authentifie une session persistante (une seule connexion à la fois si l'instance est partagée)"""
         if self.session is not None:
             return True
-        
-        # Créer une session avec cookie jar
-        self.session = aiohttp.ClientSession(trust_env=True)
+        if self._login_lock is None:
+            self._login_lock = asyncio.Lock()
+        async with self._login_lock:
+            if self.session is not None:
+                return True
+            async with stage("abn_login"):
+                return await self._login()
+
+    @staticmethod
+    def _logged_out(response):
+        """Session expirée : ABN redirige vers la page de connexion"""
+        return response.url.path.rstrip('/').endswith('/Home/Login')
+
+    async def _expire(self, session):
+        """Oublie une session expirée (une seule fois si plusieurs requêtes le constatent)"""
+        if self.session is session:
+            self.session = None
+            await session.close()
+
+    async def _login(self):
+        # Créer une session avec cookie jar (publiée seulement une fois authentifiée)
+        session = upstream.session("abn")
         
         login_url = f"{self.base_url}/Home/Login"
         
         # Première requête pour obtenir le token CSRF
         try:
-            async with self.session.get(login_url, timeout=10) as resp:
+            async with session.get(login_url, timeout=upstream.timeout("abn", 10)) as resp:
                 if resp.status != 200:
                     logging.error(f"ABN: Failed to get login page: {resp.status}")
-                    await self.session.close()
-                    self.session = None
+                    await session.close()
                     return False
                     
                 html = await resp.text()
@@ -48,8 +70,7 @@ class ABNService:
                 token_match = re.search(r'name="__RequestVerificationToken".*?value="([^"]+)"', html)
                 if not token_match:
                     logging.error("ABN: Could not find CSRF token")
-                    await self.session.close()
-                    self.session = None
+                    await session.close()
                     return False
                     
                 csrf_token = token_match.group(1)
@@ -62,29 +83,26 @@ class ABNService:
                 '__RequestVerificationToken': csrf_token
             }
             
-            async with self.session.post(login_url, data=login_data, allow_redirects=True, timeout=10) as resp:
+            async with session.post(login_url, data=login_data, allow_redirects=True, timeout=upstream.timeout("abn", 10)) as resp:
                 if resp.status == 200:
                     # Vérifier qu'on est bien connecté
                     html = await resp.text()
                     if 'logoutForm' in html or 'Déconnexion' in html or 'Logout' in html:
                         logging.info("ABN: Login successful - session established")
+                        self.session = session
                         return True
                     else:
                         logging.error("ABN: Login failed - bad credentials")
-                        await self.session.close()
-                        self.session = None
+                        await session.close()
                         return False
                 else:
                     logging.error(f"ABN: Login failed with status {resp.status}")
-                    await self.session.close()
-                    self.session = None
+                    await session.close()
                     return False
                     
         except Exception as e:
             logging.error(f"ABN: Login exception: {e}")
-            if self.session:
-                await self.session.close()
-                self.session = None
+            await session.close()
             return False
     
     async def search(self, params):
@@ -133,14 +151,24 @@ class ABNService:
             full_url = f"{search_url}?{urlencode(search_params)}"
         
         try:
-            async with self.session.get(full_url, timeout=10) as response:
-                if response.status == 200:
-                    html = await response.text()
-                    results = self._parse_results(html)
-                    logging.info(f"ABN: Found {len(results)} results")
-                    return results
-                else:
-                    logging.warning(f"ABN: Search error {response.status}")
+            for attempt in range(2):
+                # Une autre requête a pu constater l'expiration entre-temps
+                if not await self._ensure_session():
+                    return []
+                session = self.session
+                async with session.get(full_url, timeout=upstream.timeout("abn", 10)) as response:
+                    expired = self._logged_out(response)
+                    if not expired and response.status == 200:
+                        html = await response.text()
+                        results = self._parse_results(html)
+                        logging.info(f"ABN: Found {len(results)} results")
+                        return results
+                    if not expired:
+                        logging.warning(f"ABN: Search error {response.status}")
+                        return []
+                logging.info("ABN: Session expired, logging in again")
+                await self._expire(session)
+                if attempt:
                     return []
         except Exception as e:
             logging.error(f"ABN: Search exception: {e}")
@@ -253,31 +281,53 @@ class ABNService:
         details_url = f"{self.base_url}/Torrent/Details?ReleaseId={torrent_id}"
         
         try:
-            async with self.session.get(details_url, timeout=5) as resp:
-                if resp.status == 200:
-                    html = await resp.text()
-                    # Chercher le hash dans la page de détails
-                    # Format ABN: Hash : <span class="text-italic">HASH_VALUE</span>
-                    hash_match = re.search(r'Hash\s*:\s*<span[^>]*>([a-fA-F0-9]{40})</span>', html, re.IGNORECASE)
-                    if hash_match:
-                        hash_value = hash_match.group(1).lower()
-                        logging.debug(f"ABN: Found hash for torrent {torrent_id}: {hash_value[:8]}...")
-                        return hash_value
-                    
-                    # Fallback: essayer un format plus simple
-                    hash_match = re.search(r'Hash[:\s]+([a-fA-F0-9]{40})', html, re.IGNORECASE)
-                    if hash_match:
-                        hash_value = hash_match.group(1).lower()
-                        logging.debug(f"ABN: Found hash (fallback) for torrent {torrent_id}: {hash_value[:8]}...")
-                        return hash_value
-                    
-                    logging.warning(f"ABN: No hash found in details page for torrent {torrent_id}")
-                else:
-                    logging.warning(f"ABN: Failed to get details page for torrent {torrent_id}: status {resp.status}")
+            for attempt in range(2):
+                # Session de l'instance partagée : une autre requête a pu l'expirer entre-temps
+                if not await self._ensure_session():
+                    return None
+                session = self.session
+                try:
+                    async with session.get(details_url, timeout=upstream.timeout("abn", 5)) as resp:
+                        expired = self._logged_out(resp)
+                        if not expired:
+                            return await self._hash_from_details(torrent_id, resp)
+                except aiohttp.ClientError:
+                    # Session fermée en cours d'appel par une autre requête qui l'a vue expirer
+                    if attempt or self.session is session:
+                        raise
+                    continue
+                logging.info("ABN: Session expired, logging in again")
+                await self._expire(session)
+                if attempt:
+                    return None
         except Exception as e:
             logging.error(f"ABN: Error getting hash for torrent {torrent_id}: {e}")
         
         return None
+
+    async def _hash_from_details(self, torrent_id, resp):
+        """Hash lu dans la page de détails d'un torrent, None s'il est absent"""
+        if resp.status != 200:
+            logging.warning(f"ABN: Failed to get details page for torrent {torrent_id}: status {resp.status}")
+            return None
+        html = await resp.text()
+        # Chercher le hash dans la page de détails
+        # Format ABN: Hash : <span class="text-italic">HASH_VALUE</span>
+        hash_match = re.search(r'Hash\s*:\s*<span[^>]*>([a-fA-F0-9]{40})</span>', html, re.IGNORECASE)
+        if hash_match:
+            hash_value = hash_match.group(1).lower()
+            logging.debug(f"ABN: Found hash for torrent {torrent_id}: {hash_value[:8]}...")
+            return hash_value
+
+        # Fallback: essayer un format plus simple
+        hash_match = re.search(r'Hash[:\s]+([a-fA-F0-9]{40})', html, re.IGNORECASE)
+        if hash_match:
+            hash_value = hash_match.group(1).lower()
+            logging.debug(f"ABN: Found hash (fallback) for torrent {torrent_id}: {hash_value[:8]}...")
+            return hash_value
+
+        logging.warning(f"ABN: No hash found in details page for torrent {torrent_id}")
+        return None
     
     async def enrich_with_hashes(self, results):
         """Enrichit les résultats avec les info_hash en récupérant les pages de détails"""
@@ -323,15 +373,23 @@ class ABNService:
     
     async def download_torrent(self, download_url):
         """Télécharge le fichier .torrent depuis ABN"""
-        # S'assurer qu'on est connecté
-        if not await self._ensure_session():
-            return None
-        
         try:
-            async with self.session.get(download_url, timeout=15) as resp:
-                if resp.status == 200:
-                    return await resp.read()
-                logging.error(f"ABN: Download error {resp.status}")
+            for attempt in range(2):
+                # S'assurer qu'on est connecté
+                if not await self._ensure_session():
+                    return None
+                session = self.session
+                async with session.get(download_url, timeout=upstream.timeout("abn", 15)) as resp:
+                    expired = self._logged_out(resp)
+                    if not expired and resp.status == 200:
+                        return await resp.read()
+                    if not expired:
+                        logging.error(f"ABN: Download error {resp.status}")
+                        return None
+                logging.info("ABN: Session expired, logging in again")
+                await self._expire(session)
+                if attempt:
+                    return None
         except Exception as e:
             logging.error(f"ABN: Download exception: {e}")
         
@@ -379,7 +437,8 @@ class ABNService:
                     seen_ids.add(r.get('torrent_id'))
         
         # Enrichir avec les hash si possible
-        all_results = await self.enrich_with_hashes(all_results)
+        async with stage("abn_hashes"):
+            all_results = await self.enrich_with_hashes(all_results)
         return all_results
     
     async def search_series(self, title, season, episode, original_title=None):
@@ -432,6 +491,7 @@ class ABNService:
                     seen_ids.add(r.get('torrent_id'))
         
         # Enrichir avec les hash
-        all_results = await self.enrich_with_hashes(all_results)
+        async with stage("abn_hashes"):
+            all_results = await self.enrich_with_hashes(all_results)
         return all_results
 
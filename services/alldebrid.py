@@ -1,4 +1,6 @@
 import aiohttp
+import upstream
+from timing import stage
 import logging
 import math
 import json
@@ -9,7 +11,7 @@ class AllDebridService:
     def __init__(self, api_key):
         self.api_key = api_key
         # On s'assure qu'il n'y a pas de slash final pour éviter les doubles //
-        self.base_url = "https://api.alldebrid.com/v4.1"
+        self.base_url = upstream.base_url("alldebrid", "https://api.alldebrid.com/v4.1")
         self.agent = "jackett"
 
     def _clean_hash(self, hash_str):
@@ -73,7 +75,7 @@ class AllDebridService:
             "apikey": self.api_key
         }
         
-        async with aiohttp.ClientSession(trust_env=True) as session:
+        async with upstream.session("alldebrid") as session:
             try:
                 # 1. Récupérer la liste
                 async with session.get(url_list, params=params) as resp:
@@ -176,14 +178,15 @@ class AllDebridService:
                 "magnets[]": batch
             }
             
-            async with aiohttp.ClientSession(trust_env=True) as session:
+            async with upstream.session("alldebrid") as session:
                 try:
                     async with session.post(url, data=data) as response:
                         if response.status == 200:
                             resp_json = await response.json()
                             
-                            if i == 0:
-                                logging.info(f"DEBUG AD Response (First Batch Sample): {json.dumps(resp_json)[:1000]}")
+                            # Sérialiser une grosse réponse bloque la boucle : seulement en debug
+                            if i == 0 and logging.getLogger().isEnabledFor(logging.DEBUG):
+                                logging.debug(f"AD Response (First Batch Sample): {json.dumps(resp_json)[:1000]}")
                             
                             if resp_json.get('status') == 'success':
                                 magnets_data = resp_json.get('data', {}).get('magnets', [])
@@ -218,9 +221,10 @@ class AllDebridService:
         
         # Nettoyage final (APRES)
         try:
-            # Petite pause pour laisser l'API respirer et indexer les nouveaux ajouts
-            await asyncio.sleep(1)
-            await self.cleanup()
+            async with stage("ad_cleanup"):
+                # Petite pause pour laisser l'API respirer et indexer les nouveaux ajouts
+                await asyncio.sleep(1)
+                await self.cleanup()
         except Exception as e:
             logging.error(f"Post-check cleanup failed: {e}")
 
@@ -234,7 +238,7 @@ class AllDebridService:
         magnet_hash = self._clean_hash(magnet_hash)
         logging.info(f"🔓 AD unlock_magnet: hash={magnet_hash}, S{season}E{episode}, type={media_type}")
         
-        async with aiohttp.ClientSession(trust_env=True) as session:
+        async with upstream.session("alldebrid") as session:
             # 1. Upload Magnet
             upload_url = f"{self.base_url}/magnet/upload"
             params = {
@@ -1,11 +1,11 @@
-import aiohttp
+import upstream
 import logging
 import asyncio
 
 class DebridLinkService:
     def __init__(self, api_key):
         self.api_key = api_key
-        self.base_url = "https://debrid-link.com/api/v2"
+        self.base_url = upstream.base_url("debridlink", "https://debrid-link.com/api/v2")
         
     async def check_availability(self, hashes):
         """
@@ -49,7 +49,7 @@ class DebridLinkService:
         
         add_url = f"{self.base_url}/seedbox/add"
         
-        async with aiohttp.ClientSession(trust_env=True) as session:
+        async with upstream.session("debridlink") as session:
             try:
                 # Ajouter le torrent par hash
                 payload = {
@@ -57,7 +57,7 @@ class DebridLinkService:
                     "wait": False
                 }
                 
-                async with session.post(add_url, json=payload, headers=headers, timeout=10) as resp:
+                async with session.post(add_url, json=payload, headers=headers, timeout=upstream.timeout("debridlink", 10)) as resp:
                     if resp.status != 200:
                         logging.warning(f"DebridLink: Failed to add {hash_value[:8]}... status {resp.status}")
                         return False
@@ -96,7 +96,7 @@ class DebridLinkService:
         """Supprime un torrent du seedbox"""
         try:
             remove_url = f"{self.base_url}/seedbox/{torrent_id}/remove"
-            async with session.delete(remove_url, headers=headers, timeout=5) as resp:
+            async with session.delete(remove_url, headers=headers, timeout=upstream.timeout("debridlink", 5)) as resp:
                 if resp.status == 200:
                     logging.debug(f"DebridLink: Removed torrent {torrent_id}")
                 else:
@@ -115,7 +115,7 @@ class DebridLinkService:
         
         add_url = f"{self.base_url}/seedbox/add"
         
-        async with aiohttp.ClientSession(trust_env=True) as session:
+        async with upstream.session("debridlink") as session:
             try:
                 # Ajouter le torrent
                 payload = {
@@ -123,7 +123,7 @@ class DebridLinkService:
                     "wait": False
                 }
                 
-                async with session.post(add_url, json=payload, headers=headers, timeout=15) as resp:
+                async with session.post(add_url, json=payload, headers=headers, timeout=upstream.timeout("debridlink", 15)) as resp:
                     if resp.status != 200:
                         logging.error(f"DebridLink: Failed to add torrent: {resp.status}")
                         return None
@@ -1,7 +1,236 @@
 import qbittorrentapi
+import asyncio
 import logging
+import re
+import threading
 import time
 import urllib.parse
+import upstream
+from cache import key_digest
+from torrent import parse_torrent, TorrentParseError
+
+VIDEO_EXTENSIONS = ('.mkv', '.mp4', '.avi', '.mov', '.wmv', '.m4v')
+
+# Priorités de fichiers qBittorrent
+PRIORITY_SKIP = 0
+PRIORITY_MAX = 7
+
+# États des pièces (torrents/pieceStates)
+PIECE_DOWNLOADED = 2
+
+# États d'un torrent dont les métadonnées ne sont pas encore connues
+METADATA_STATES = ('metaDL', 'forcedMetaDL', 'checkingResumeData')
+
+# Suivi de l'état via sync/maindata : intervalle entre deux requêtes, arrêt après inactivité
+SYNC_INTERVAL = 0.5
+SYNC_IDLE_TIMEOUT = 30
+
+
+class StreamTarget:
+    """Fichier servi au lecteur, avec sa position dans les pièces du torrent (si connue)"""
+    __slots__ = ('info_hash', 'file_name', 'url', 'file_size', 'first_piece', 'last_piece', 'piece_length',
+                 'file_index', 'file_offset')
+
+    def __init__(self, info_hash, file_name, url, file_size=None, first_piece=None, last_piece=None, piece_length=None,
+                 file_index=None, file_offset=None):
+        self.info_hash = info_hash.lower()
+        self.file_name = file_name
+        self.url = url
+        self.file_size = file_size
+        self.first_piece = first_piece
+        self.last_piece = last_piece
+        self.piece_length = piece_length
+        self.file_index = file_index
+        # Offset du fichier dans le torrent (octets), connu seulement via le .torrent local
+        self.file_offset = file_offset
+
+
+def select_target_file(files, season=None, episode=None):
+    """
+    Choisit le fichier à streamer parmi `files` (objets avec .name et .size) :
+    l'épisode demandé s'il est trouvé, sinon le plus gros fichier vidéo,
+    sinon le plus gros fichier.
+    """
+    if not files:
+        return None
+
+    if season is not None and episode is not None:
+        # Chercher le fichier correspondant à l'épisode
+        s_str = f"{int(season):02d}"
+        e_str = f"{int(episode):02d}"
+        
+        patterns = [
+            re.compile(rf'S{s_str}E{e_str}', re.IGNORECASE),
+            re.compile(rf'{int(season)}x{e_str}', re.IGNORECASE),
+            re.compile(rf'E{e_str}', re.IGNORECASE)
+        ]
+        
+        # Chercher parmi les fichiers (triés par taille décroissante)
+        for f in sorted(files, key=lambda x: x.size, reverse=True):
+            for pat in patterns:
+                if pat.search(f.name):
+                    logging.info(f"✅ Selected episode file: {f.name}")
+                    return f
+    
+    # Fallback: le plus gros fichier vidéo
+    video_files = [f for f in files if f.name.lower().endswith(VIDEO_EXTENSIONS)]
+    
+    if video_files:
+        largest = max(video_files, key=lambda x: x.size)
+        logging.info(f"✅ Selected largest video file: {largest.name} ({largest.size} bytes)")
+    else:
+        # Prendre le plus gros fichier tout court
+        largest = max(files, key=lambda x: x.size)
+        logging.info(f"✅ Selected largest file: {largest.name} ({largest.size} bytes)")
+    return largest
+
+
+def _has_metadata(torrent):
+    if 'has_metadata' in torrent:
+        return bool(torrent['has_metadata'])
+    return torrent.get('state') not in METADATA_STATES
+
+
+class MainDataWatcher:
+    """
+    Vue en mémoire de tous les torrents d'une instance qBittorrent, tenue à
+    jour par le protocole incrémental sync/maindata (paramètre rid).
+
+    Un seul thread par instance interroge le WebUI toutes les `interval`
+    secondes, quel que soit le nombre de streams en préparation ; les appelants
+    attendent un changement de la vue au lieu de relancer leurs propres
+    requêtes. Le thread s'arrête après `idle_timeout` secondes sans utilisation
+    et repart (avec une synchronisation complète) à la demande suivante.
+    Les méthodes sont bloquantes : elles s'utilisent depuis prepare_stream,
+    qui tourne déjà hors de la boucle asyncio.
+    """
+
+    def __init__(self, client, name, interval=SYNC_INTERVAL, idle_timeout=SYNC_IDLE_TIMEOUT):
+        self.client = client
+        self.name = name
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self.torrents = {}
+        self.server_state = {}
+        self.rid = 0
+        self.synced = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self._last_used = 0.0
+        # hash -> (progression du torrent au moment de la lecture, fichiers)
+        self._files = {}
+        self._files_lock = threading.Lock()
+
+    def _ensure_running(self):
+        # Appelé avec self._cond acquis
+        self._last_used = time.monotonic()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"qbit-sync-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if time.monotonic() - self._last_used > self.idle_timeout:
+                    # Au redémarrage, on repart d'une vue complète
+                    self._thread = None
+                    self.synced = False
+                    self.rid = 0
+                    return
+                rid = self.rid
+            try:
+                data = self.client.sync_maindata(rid=rid)
+            except Exception as e:
+                logging.warning(f"qBittorrent sync failed ({self.name}): {e}")
+                time.sleep(self.interval * 4)
+                continue
+            self._apply(data)
+            time.sleep(self.interval)
+
+    def _apply(self, data):
+        with self._cond:
+            if data.get('full_update'):
+                self.torrents = {}
+                self.server_state = {}
+            self.server_state.update(data.get('server_state') or {})
+            for h, fields in (data.get('torrents') or {}).items():
+                self.torrents.setdefault(h, {}).update(fields)
+            for h in data.get('torrents_removed') or ():
+                self.torrents.pop(h, None)
+                self._files.pop(h, None)
+            self.rid = data.get('rid', self.rid)
+            self.synced = True
+            self._cond.notify_all()
+
+    def wait_for(self, predicate, timeout):
+        """
+        Attend que `predicate(torrents)` retourne une valeur vraie et la
+        retourne, ou None après `timeout` secondes.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._ensure_running()
+            while True:
+                if self.synced:
+                    result = predicate(self.torrents)
+                    if result:
+                        return result
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+                self._last_used = time.monotonic()
+
+    def snapshot(self, timeout):
+        """Copie de la vue (torrents, server_state), ou None si la synchronisation n'a pas abouti"""
+        if not self.wait_for(lambda torrents: True, timeout):
+            return None
+        with self._cond:
+            return {h: dict(t) for h, t in self.torrents.items()}, dict(self.server_state)
+
+    def torrent(self, info_hash, timeout=0):
+        """Propriétés du torrent (seq_dl, f_l_piece_prio, state, progress...) ou None"""
+        h = info_hash.lower()
+        return self.wait_for(lambda torrents: torrents.get(h), timeout)
+
+    def files(self, info_hash, timeout):
+        """
+        Fichiers du torrent une fois ses métadonnées connues. La liste n'est
+        redemandée au WebUI que si la progression du torrent a changé.
+        """
+        h = info_hash.lower()
+        torrent = self.wait_for(lambda torrents: h in torrents and _has_metadata(torrents[h]) and torrents[h], timeout)
+        if not torrent:
+            return None
+        progress = torrent.get('progress')
+        # Un seul appel torrents_files même si plusieurs resolves attendent le même torrent
+        with self._files_lock:
+            cached = self._files.get(h)
+            if cached and cached[0] == progress:
+                return cached[1]
+            files = self.client.torrents_files(torrent_hash=h)
+            if files:
+                self._files[h] = (progress, files)
+            return files
+
+
+_WATCHERS = {}
+_WATCHERS_LOCK = threading.Lock()
+
+
+def get_watcher(host, port, username, password):
+    """Watcher partagé par tous les QBittorrentService d'une même instance (et mêmes identifiants)"""
+    key = (host, port, username, key_digest(password))
+    with _WATCHERS_LOCK:
+        watcher = _WATCHERS.get(key)
+        if watcher is None:
+            client = qbittorrentapi.Client(
+                host=host, port=port, username=username, password=password,
+                REQUESTS_ARGS={'timeout': 30, 'hooks': upstream.requests_hooks('qbittorrent')}
+            )
+            watcher = _WATCHERS[key] = MainDataWatcher(client, f"{host}:{port}")
+        return watcher
+
 
 class QBittorrentService:
     def __init__(self, host, username, password, public_url_base):
@@ -14,6 +243,8 @@ class QBittorrentService:
         
         self.host = host.rstrip('/')
         self.public_url_base = public_url_base.rstrip('/')
+        self._client_args = (parsed.hostname or 'localhost', parsed.port or 8080, username, password)
+        self._watcher = None
         
         # Créer le client qBittorrent
         try:
@@ -22,13 +253,29 @@ class QBittorrentService:
                 port=parsed.port or 8080,
                 username=username,
                 password=password,
-                REQUESTS_ARGS={'timeout': 30}
+                REQUESTS_ARGS={'timeout': 30, 'hooks': upstream.requests_hooks('qbittorrent')}
             )
             logging.info(f"qBittorrent client created for {parsed.hostname}:{parsed.port}")
         except Exception as e:
             logging.error(f"Failed to create qBittorrent client: {e}")
             self.client = None
 
+    @property
+    def watcher(self):
+        if self._watcher is None:
+            self._watcher = get_watcher(*self._client_args)
+        return self._watcher
+
+    @property
+    def instance_name(self):
+        """Identifiant lisible de l'instance (sans le mot de passe)"""
+        host, port, username, _ = self._client_args
+        return f"{username}@{host}:{port}"
+
+    @staticmethod
+    def _streaming_flags(torrent):
+        return bool(torrent.get('seq_dl')), bool(torrent.get('f_l_piece_prio'))
+
     def test_connection(self):
         """Test la connexion à qBittorrent"""
         if not self.client:
@@ -52,13 +299,15 @@ class QBittorrentService:
             logging.error(f"❌ qBittorrent Connection Error: {e}")
             return False
 
-    def add_torrent(self, torrent_data, is_file=False):
+    def add_torrent(self, torrent_data, is_file=False, paused=False, **options):
         """
         Ajoute un torrent à qBittorrent
         
         Args:
             torrent_data: Contenu binaire du .torrent ou URL magnet
             is_file: True si torrent_data est un fichier binaire
+            paused: True pour ajouter le torrent à l'arrêt
+            options: Options supplémentaires de torrents_add
         """
         if not self.client:
             logging.error("qBittorrent client not initialized")
@@ -67,9 +316,11 @@ class QBittorrentService:
         try:
             # Options de streaming (l'API les supporte bien)
             streaming_opts = {
-                'is_paused': False,
+                'is_paused': paused,
+                'is_stopped': paused,  # Nom utilisé à partir de qBittorrent 5
                 'is_sequential_download': True,
-                'is_first_last_piece_priority': True
+                'is_first_last_piece_priority': True,
+                **options
             }
             
             if is_file:
@@ -121,15 +372,13 @@ class QBittorrentService:
             
             logging.info(f"🔧 Forcing streaming options for torrent {h[:8]}...")
             
-            # Récupérer l'état actuel
-            props = self.client.torrents_properties(torrent_hash=h)
-            
-            # Debug: Afficher toutes les clés disponibles
-            logging.debug(f"   Available properties: {list(props.keys())}")
+            # État actuel, depuis la vue sync/maindata (le torrent vient peut-être d'être ajouté)
+            torrent = self.watcher.torrent(h, timeout=5)
+            if torrent is None:
+                logging.error(f"   ❌ Torrent {h[:8]} not found in qBittorrent")
+                return False
             
-            # Essayer différents noms possibles (props est un dict-like object)
-            seq_enabled = props.get('seq_dl', False) or props.get('is_sequential_download', False) or props.get('sequential_download', False)
-            first_last_enabled = props.get('f_l_piece_prio', False) or props.get('is_first_last_piece_priority', False) or props.get('first_last_piece_priority', False)
+            seq_enabled, first_last_enabled = self._streaming_flags(torrent)
             
             logging.info(f"   Current state: sequential={seq_enabled}, first_last={first_last_enabled}")
             
@@ -183,81 +432,27 @@ class QBittorrentService:
             
         h = info_hash.lower()
         
-        # En mode rapide, moins de retries et délais plus courts
+        # En mode rapide, attente plus courte
         if fast_mode:
             max_retries = 8
             retry_delay = 0.5  # 500ms entre chaque tentative
         else:
             retry_delay = 1.0  # 1s entre chaque tentative
         
-        # Attendre que les métadonnées soient disponibles
+        # Attendre que les métadonnées soient disponibles (notifié par le watcher)
         logging.info(f"🔍 Looking for files in torrent (fast_mode={fast_mode})...")
         
-        for retry in range(max_retries):
-            try:
-                files = self.client.torrents_files(torrent_hash=h)
-                
-                if files:
-                    logging.info(f"✅ Found {len(files)} files in torrent")
-                    
-                    # Sélection du fichier
-                    target_file = None
-                    
-                    if season is not None and episode is not None:
-                        # Chercher le fichier correspondant à l'épisode
-                        import re
-                        s_str = f"{int(season):02d}"
-                        e_str = f"{int(episode):02d}"
-                        
-                        patterns = [
-                            re.compile(rf'S{s_str}E{e_str}', re.IGNORECASE),
-                            re.compile(rf'{int(season)}x{e_str}', re.IGNORECASE),
-                            re.compile(rf'E{e_str}', re.IGNORECASE)
-                        ]
-                        
-                        # Chercher parmi les fichiers (triés par taille décroissante)
-                        sorted_files = sorted(files, key=lambda x: x.size, reverse=True)
-                        
-                        for f in sorted_files:
-                            fname = f.name
-                            for pat in patterns:
-                                if pat.search(fname):
-                                    target_file = fname
-                                    logging.info(f"✅ Selected episode file: {fname}")
-                                    break
-                            if target_file:
-                                break
-                    
-                    # Fallback: le plus gros fichier vidéo
-                    if not target_file:
-                        video_exts = ['.mkv', '.mp4', '.avi', '.mov', '.wmv', '.m4v']
-                        video_files = [f for f in files if any(f.name.lower().endswith(ext) for ext in video_exts)]
-                        
-                        if video_files:
-                            largest = max(video_files, key=lambda x: x.size)
-                            target_file = largest.name
-                            logging.info(f"✅ Selected largest video file: {target_file} ({largest.size} bytes)")
-                        else:
-                            # Prendre le plus gros fichier tout court
-                            largest = max(files, key=lambda x: x.size)
-                            target_file = largest.name
-                            logging.info(f"✅ Selected largest file: {target_file} ({largest.size} bytes)")
-                    
-                    return target_file
-                    
-            except Exception as e:
-                if retry < max_retries - 1:
-                    logging.debug(f"⏳ Waiting for metadata... ({retry + 1}/{max_retries})")
-                    time.sleep(retry_delay)
-                else:
-                    logging.error(f"Failed to get torrent files: {e}")
-            
-            # Pas d'exception mais pas de fichiers non plus
-            if retry < max_retries - 1:
-                logging.debug(f"⏳ No files yet, retrying... ({retry + 1}/{max_retries})")
-                time.sleep(retry_delay)
+        try:
+            files = self.watcher.files(h, timeout=max_retries * retry_delay)
+        except Exception as e:
+            logging.error(f"Failed to get torrent files: {e}")
+            return None
+        
+        if files:
+            logging.info(f"✅ Found {len(files)} files in torrent")
+            return select_target_file(files, season, episode).name
                     
-        logging.error(f"❌ Could not find files after {max_retries} retries")
+        logging.error(f"❌ Could not find files after {max_retries * retry_delay:.1f}s")
         return None
 
     def verify_and_fix_streaming_options(self, info_hash):
@@ -272,15 +467,12 @@ class QBittorrentService:
             
             logging.info(f"🔍 Verifying streaming options for torrent {h[:8]}...")
             
-            # Récupérer les propriétés du torrent
-            props = self.client.torrents_properties(torrent_hash=h)
+            torrent = self.watcher.torrent(h, timeout=5)
+            if torrent is None:
+                logging.error(f"❌ Torrent {h[:8]} not found in qBittorrent")
+                return False
             
-            # Debug: Afficher toutes les clés disponibles
-            logging.debug(f"   Available properties: {list(props.keys())}")
-            
-            # Essayer différents noms possibles
-            seq_enabled = props.get('seq_dl', False) or props.get('is_sequential_download', False) or props.get('sequential_download', False)
-            first_last_enabled = props.get('f_l_piece_prio', False) or props.get('is_first_last_piece_priority', False) or props.get('first_last_piece_priority', False)
+            seq_enabled, first_last_enabled = self._streaming_flags(torrent)
             
             logging.info(f"📊 Current status (from qBittorrent):")
             logging.info(f"   props.seq_dl = {seq_enabled} {'✅ ON' if seq_enabled else '❌ OFF'}")
@@ -291,11 +483,12 @@ class QBittorrentService:
                 logging.warning("⚠️ Streaming options NOT applied correctly, forcing again...")
                 self.configure_sequential(info_hash)
                 
-                # Vérifier à nouveau
-                time.sleep(0.5)
-                props2 = self.client.torrents_properties(torrent_hash=h)
-                seq2 = props2.get('seq_dl', False) or props2.get('is_sequential_download', False)
-                first_last2 = props2.get('f_l_piece_prio', False) or props2.get('is_first_last_piece_priority', False)
+                # Vérifier à nouveau, dès que la vue reflète le changement
+                torrent = self.watcher.wait_for(
+                    lambda torrents: all(self._streaming_flags(torrents.get(h, {}))) and torrents[h],
+                    timeout=2
+                ) or self.watcher.torrent(h) or {}
+                seq2, first_last2 = self._streaming_flags(torrent)
                 logging.info(f"📊 After second attempt:")
                 logging.info(f"   sequential = {seq2}")
                 logging.info(f"   first_last = {first_last2}")
@@ -312,9 +505,82 @@ class QBittorrentService:
             logging.error(traceback.format_exc())
             return False
 
+    def torrent_exists(self, info_hash):
+        """Indique si le torrent est déjà présent dans qBittorrent"""
+        try:
+            return bool(self.client.torrents_info(torrent_hashes=info_hash.lower()))
+        except Exception as e:
+            logging.debug(f"torrents_info failed: {e}")
+            return False
+
+    def set_file_priorities(self, info_hash, target_index, skip_indexes=(), max_wait=2.0):
+        """
+        Donne la priorité maximale au fichier cible et désactive `skip_indexes`.
+        Juste après un ajout, qBittorrent peut mettre quelques millisecondes à
+        enregistrer le torrent : on réessaie brièvement.
+        """
+        h = info_hash.lower()
+        deadline = time.monotonic() + max_wait
+        while True:
+            try:
+                if skip_indexes:
+                    self.client.torrents_file_priority(torrent_hash=h, file_ids=list(skip_indexes), priority=PRIORITY_SKIP)
+                self.client.torrents_file_priority(torrent_hash=h, file_ids=target_index, priority=PRIORITY_MAX)
+                return True
+            except qbittorrentapi.NotFound404Error:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self.watcher.torrent(h, timeout=remaining) is None:
+                    logging.warning(f"⚠️ Torrent {h[:8]} not registered yet, file priorities not set")
+                    return False
+            except Exception as e:
+                logging.error(f"❌ Failed to set file priorities: {e}")
+                return False
+
+    def _manage_parsed_stream(self, torrent_data, meta, season=None, episode=None):
+        """
+        Chemin rapide : la liste des fichiers vient du .torrent lui-même, le
+        fichier cible est choisi avant l'ajout et les autres fichiers ne sont
+        jamais téléchargés. Aucune attente des métadonnées.
+        """
+        target = select_target_file(meta.files, season, episode)
+        h = meta.info_hash
+
+        if self.torrent_exists(h):
+            # Déjà présent (autre épisode du même pack ?) : on ne touche qu'au fichier cible
+            logging.info(f"ℹ️ Torrent {h[:8]} already in qBittorrent, prioritizing {target.name}")
+            self.set_file_priorities(h, target.index)
+            self.client.torrents_start(torrent_hashes=h)
+        else:
+            # Ajout à l'arrêt pour que les priorités soient en place avant le premier octet
+            if not self.add_torrent(torrent_data, is_file=True, paused=True, content_layout='Original'):
+                return None
+            skip = [f.index for f in meta.files if f.index != target.index]
+            self.set_file_priorities(h, target.index, skip)
+            self.client.torrents_start(torrent_hashes=h)
+            logging.info(f"⚡ Torrent {h[:8]} added, downloading only {target.name}")
+
+        return StreamTarget(
+            h, target.name, self.build_stream_url(target.name),
+            file_size=target.size,
+            first_piece=target.first_piece,
+            last_piece=target.last_piece,
+            piece_length=meta.piece_length,
+            file_index=target.index,
+            file_offset=target.offset
+        )
+
+    def build_stream_url(self, file_name):
+        safe_path = urllib.parse.quote(file_name)
+        return f"{self.public_url_base}/{safe_path}"
+
     def manage_stream(self, torrent_data, info_hash, is_file=False, season=None, episode=None):
+        """Comme prepare_stream, mais ne retourne que l'URL de streaming"""
+        target = self.prepare_stream(torrent_data, info_hash, is_file, season, episode)
+        return target.url if target else None
+
+    def prepare_stream(self, torrent_data, info_hash, is_file=False, season=None, episode=None):
         """
-        Orchestre l'ajout du torrent et retourne l'URL de streaming IMMÉDIATEMENT
+        Orchestre l'ajout du torrent et retourne la cible de streaming IMMÉDIATEMENT
         Le téléchargement se fait en arrière-plan, le player lit au fur et à mesure
         
         Args:
@@ -325,16 +591,36 @@ class QBittorrentService:
             episode: Numéro d'épisode (pour séries)
             
         Returns:
-            URL HTTP du fichier vidéo pour streaming (même si téléchargement en cours)
+            StreamTarget (URL HTTP du fichier vidéo, même si téléchargement en cours) ou None
         """
+        if not self.client:
+            logging.error("qBittorrent client not initialized")
+            return None
+
+        # 0. Si on a le .torrent, on connaît déjà les fichiers : pas besoin d'attendre qBittorrent
+        if is_file:
+            try:
+                meta = parse_torrent(torrent_data)
+            except TorrentParseError as e:
+                logging.warning(f"Local .torrent parsing failed ({e}), falling back to qBittorrent metadata")
+            else:
+                if meta.files:
+                    if info_hash and meta.info_hash != info_hash.lower():
+                        logging.info(f"Info hash from .torrent ({meta.info_hash[:8]}) differs from tracker ({info_hash[:8]})")
+                    try:
+                        return self._manage_parsed_stream(torrent_data, meta, season, episode)
+                    except Exception as e:
+                        logging.error(f"❌ qBittorrent fast path failed: {e}")
+                        return None
+
         # 1. Ajouter le torrent avec les options de streaming
         if not self.add_torrent(torrent_data, is_file):
             return None
         
         logging.info("⚡ Torrent added, preparing instant stream...")
         
-        # 2. Petite pause pour que qBittorrent initialise le torrent
-        time.sleep(1.5)
+        # 2. Attendre que qBittorrent ait enregistré le torrent (vue sync/maindata)
+        self.watcher.torrent(info_hash, timeout=5)
         
         # 3. FORCER les options de streaming en parallèle de l'obtention des fichiers
         # (ne pas attendre, c'est juste pour être sûr)
@@ -350,11 +636,62 @@ class QBittorrentService:
         
         # 5. Construire l'URL de streaming et la retourner IMMÉDIATEMENT
         # Le téléchargement continue en background, le player va lire au fur et à mesure
-        safe_path = urllib.parse.quote(target_file)
-        stream_url = f"{self.public_url_base}/{safe_path}"
+        stream_url = self.build_stream_url(target_file)
         
         logging.info(f"🎬 INSTANT STREAM ready: {stream_url}")
         logging.info(f"   ⚡ Player will read file as it downloads (sequential mode)")
         logging.info(f"   📥 qBittorrent is downloading in background...")
         
-        return stream_url
+        return StreamTarget(info_hash, target_file, stream_url)
+
+    def _load_piece_layout(self, target):
+        """Complète la position du fichier dans les pièces via l'API (chemin sans .torrent local)"""
+        props = self.client.torrents_properties(torrent_hash=target.info_hash)
+        target.piece_length = props.get('piece_size')
+        for f in self.client.torrents_files(torrent_hash=target.info_hash):
+            if f.name == target.file_name:
+                target.first_piece, target.last_piece = f.piece_range
+                target.file_size = f.size
+                target.file_index = f.index
+                return
+
+    def _missing_pieces(self, target, buffer_bytes, tail_bytes):
+        """Pièces d'en-tête (+ buffer) et de fin du fichier pas encore téléchargées"""
+        states = self.client.torrents_piece_states(torrent_hash=target.info_hash)
+        plen = target.piece_length
+        head_end = min(target.first_piece + max(buffer_bytes, 1) // plen, target.last_piece)
+        tail_start = max(target.last_piece - tail_bytes // plen, head_end)
+        wanted = list(range(target.first_piece, head_end + 1)) + list(range(tail_start, target.last_piece + 1))
+        return [i for i in wanted if i >= len(states) or states[i] != PIECE_DOWNLOADED]
+
+    async def wait_until_ready(self, target, buffer_bytes, tail_bytes, timeout):
+        """
+        Attend que le début du fichier (en-tête + buffer) et sa fin (index
+        MKV/MP4, téléchargée en priorité grâce à first/last piece) soient
+        disponibles, ou que `timeout` soit écoulé.
+        Retourne (prêt, secondes écoulées).
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        interval = 0.25
+        try:
+            if target.first_piece is None or not target.piece_length:
+                await asyncio.to_thread(self._load_piece_layout, target)
+            if target.first_piece is None or not target.piece_length:
+                logging.warning(f"⚠️ Piece layout unknown for {target.file_name}, skipping readiness gate")
+                return False, loop.time() - start
+
+            while True:
+                missing = await asyncio.to_thread(self._missing_pieces, target, buffer_bytes, tail_bytes)
+                elapsed = loop.time() - start
+                if not missing:
+                    logging.info(f"✅ Stream ready in {elapsed:.2f}s ({target.file_name})")
+                    return True, elapsed
+                if elapsed + interval > timeout:
+                    logging.warning(f"⏱️ Stream not ready after {elapsed:.2f}s ({len(missing)} pieces missing), redirecting anyway")
+                    return False, elapsed
+                await asyncio.sleep(interval)
+                interval = min(interval * 1.5, 1.0)
+        except Exception as e:
+            logging.error(f"❌ Readiness gate failed: {e}")
+            return False, loop.time() - start
@@ -1,11 +1,11 @@
-import aiohttp
+import upstream
 import logging
 import urllib.parse
 
 class SharewoodService:
     def __init__(self, passkey):
         self.passkey = passkey
-        self.base_url = "https://www.sharewood.tv/api"
+        self.base_url = upstream.base_url("sharewood", "https://www.sharewood.tv/api")
 
     async def download_torrent(self, session, download_url):
         # L'URL Sharewood nécessite le passkey, souvent inclus ou à ajouter
@@ -31,9 +31,9 @@ class SharewoodService:
         log_url = url.replace(self.passkey, '***PASSKEY***')
         logging.info(f"Sharewood Request: {log_url}")
 
-        async with aiohttp.ClientSession(trust_env=True) as session:
+        async with upstream.session("sharewood") as session:
             try:
-                async with session.get(url, timeout=20) as response:
+                async with session.get(url, timeout=upstream.timeout("sharewood", 20)) as response:
                     if response.status == 200:
                         data = await response.json()
                         # L'API retourne une liste d'objets directement
@@ -1,10 +1,10 @@
-import aiohttp
+import upstream
 import logging
 
 class TMDBService:
     def __init__(self, api_key):
         self.api_key = api_key
-        self.base_url = "https://api.themoviedb.org/3"
+        self.base_url = upstream.base_url("tmdb", "https://api.themoviedb.org/3")
 
     async def get_tmdb_id(self, imdb_id, media_type):
         """
@@ -16,9 +16,9 @@ class TMDBService:
             "external_source": "imdb_id"
         }
         
-        async with aiohttp.ClientSession(trust_env=True) as session:
+        async with upstream.session("tmdb") as session:
             try:
-                async with session.get(url, params=params) as response:
+                async with upstream.hedged_get(session, "tmdb", url, 10, params=params) as response:
                     if response.status == 200:
                         data = await response.json()
                         results = []
@@ -33,3 +33,22 @@ class TMDBService:
                 logging.error(f"Erreur TMDB Find: {e}")
         return None
 
+
+    async def get_details(self, tmdb_id, media_type, language="fr-FR"):
+        """
+        Récupère les détails (titre, année, saisons...) d'un film ou d'une série
+        """
+        url = f"{self.base_url}/{'movie' if media_type == 'movie' else 'tv'}/{tmdb_id}"
+        params = {
+            "api_key": self.api_key,
+            "language": language
+        }
+
+        async with upstream.session("tmdb") as session:
+            try:
+                async with upstream.hedged_get(session, "tmdb", url, 10, params=params) as response:
+                    if response.status == 200:
+                        return await response.json()
+            except Exception as e:
+                logging.error(f"Erreur TMDB Details: {e}")
+        return None
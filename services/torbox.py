@@ -2,7 +2,7 @@
 TorBox Debrid Service
 Converti en async avec aiohttp et compatible avec l'architecture Frenchio
 """
-import aiohttp
+import upstream
 import asyncio
 import logging
 import re
@@ -10,7 +10,7 @@ import re
 class TorBoxService:
     def __init__(self, api_key):
         self.api_key = api_key
-        self.base_url = "https://api.torbox.app/v1/api"
+        self.base_url = upstream.base_url("torbox", "https://api.torbox.app/v1/api")
         self.headers = {
             "Authorization": f"Bearer {api_key}",
         }
@@ -32,7 +32,7 @@ class TorBoxService:
             "list_files": "true"
         }
         
-        async with aiohttp.ClientSession(trust_env=True) as session:
+        async with upstream.session("torbox") as session:
             try:
                 async with session.get(url, headers=self.headers, params=params) as response:
                     if response.status != 200:
@@ -74,7 +74,7 @@ class TorBoxService:
             "seed": 2  # Mode de seed
         }
         
-        async with aiohttp.ClientSession(trust_env=True) as session:
+        async with upstream.session("torbox") as session:
             try:
                 async with session.post(url, headers=self.headers, data=data) as response:
                     if response.status != 200:
@@ -118,7 +118,7 @@ class TorBoxService:
             "list_files": "true"
         }
         
-        async with aiohttp.ClientSession(trust_env=True) as session:
+        async with upstream.session("torbox") as session:
             try:
                 async with session.get(url, headers=self.headers, params=params) as response:
                     if response.status != 200:
@@ -149,7 +149,7 @@ class TorBoxService:
         url = f"{self.base_url}/torrents/mylist"
         params = {"id": torrent_id}
         
-        async with aiohttp.ClientSession(trust_env=True) as session:
+        async with upstream.session("torbox") as session:
             try:
                 async with session.get(url, headers=self.headers, params=params) as response:
                     if response.status != 200:
@@ -221,7 +221,7 @@ class TorBoxService:
         }
         
         for attempt in range(max_retries):
-            async with aiohttp.ClientSession(trust_env=True) as session:
+            async with upstream.session("torbox") as session:
                 try:
                     if attempt > 0:
                         logging.info(f"TorBox: Retry attempt {attempt + 1}/{max_retries}")
@@ -1,4 +1,4 @@
-import aiohttp
+import upstream
 import asyncio
 import logging
 import json
@@ -31,7 +31,7 @@ class Unit3DService:
         logging.info(f"[{tracker['url']}] Requesting: {log_url}")
 
         try:
-            async with session.get(full_url, timeout=15) as response:
+            async with upstream.hedged_get(session, None, full_url, 15) as response:
                 logging.info(f"[{tracker['url']}] Status: {response.status}")
                 
                 if response.status == 200:
@@ -122,7 +122,7 @@ class Unit3DService:
             pack_params = {'seasonNumber': season}
             params_list.append(pack_params)
 
-        async with aiohttp.ClientSession(trust_env=True) as session:
+        async with upstream.session() as session:
             for tracker in self.trackers:
                 for common_params in params_list:
                     # Recherche TMDB
@@ -1,12 +1,150 @@
-import aiohttp
+import upstream
+import metrics
+import breaker
 import logging
 import asyncio
+import time
+import aiohttp
+
+YGG_URL = "http://89.168.37.159:8888"
+
+
+class Mirror:
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        # Latence moyenne exponentielle (s), None tant que le miroir n'a pas répondu
+        self.ewma = None
+        self.failures = 0
+        self.down_until = 0.0
+        self.failed_at = 0.0
+
+    def healthy(self, now):
+        return now >= self.down_until
+
+
+class MirrorPool:
+    """
+    Miroirs de l'API YGG, du plus rapide au plus lent (moyenne exponentielle
+    des latences). Un miroir en échec est écarté `cooldown` secondes, doublées
+    à chaque échec consécutif (jusqu'à `max_cooldown`) ; la sonde de fond
+    (`start()`) mesure aussi les miroirs inutilisés pour qu'un miroir rétabli
+    ou devenu plus rapide reprenne le trafic.
+    """
+
+    def __init__(self, urls, alpha=0.3, cooldown=30, max_cooldown=300, probe_interval=30, hedge=True):
+        self.mirrors = [Mirror(url) for url in dict.fromkeys(urls)]
+        self.alpha = alpha
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.probe_interval = probe_interval
+        self.hedge = hedge
+        self._task = None
+
+    def ranked(self):
+        """Miroirs en bonne santé, les plus rapides d'abord (un miroir jamais mesuré passe devant pour l'être) ;
+        s'ils sont tous écartés, tous, du premier rétabli au dernier"""
+        now = time.monotonic()
+        healthy = [m for m in self.mirrors if m.healthy(now)]
+        if not healthy:
+            return sorted(self.mirrors, key=lambda m: m.down_until)
+        return sorted(healthy, key=lambda m: m.ewma or 0.0)
+
+    def observe(self, mirror, duration):
+        mirror.ewma = duration if mirror.ewma is None else self.alpha * duration + (1 - self.alpha) * mirror.ewma
+
+    def success(self, mirror, duration):
+        self.observe(mirror, duration)
+        if mirror.down_until:
+            logging.info(f"YGG mirror {mirror.url} back")
+        mirror.failures = 0
+        mirror.down_until = 0.0
+
+    def failure(self, mirror, error):
+        now = time.monotonic()
+        mirror.failures += 1
+        mirror.failed_at = now
+        if len(self.mirrors) > 1:
+            cooldown = min(self.cooldown * 2 ** (mirror.failures - 1), self.max_cooldown)
+            mirror.down_until = now + cooldown
+            logging.warning(f"YGG mirror {mirror.url} failed ({type(error).__name__} {error}), skipped for {cooldown:.0f}s")
+
+    async def probe(self):
+        """Mesure chaque miroir, écartés compris (toute réponse HTTP sous 500 compte comme un succès)"""
+        async with upstream.session("ygg") as session:
+            async def check(mirror):
+                t0 = time.perf_counter()
+                try:
+                    async with session.get(f"{mirror.url}/", timeout=upstream.timeout("ygg", 10)) as resp:
+                        if resp.status >= 500:
+                            raise aiohttp.ClientResponseError(resp.request_info, (), status=resp.status)
+                except asyncio.CancelledError:
+                    raise
+                except breaker.CircuitOpenError:
+                    # Disjoncteur du miroir ouvert : pas d'appel, rien à mesurer
+                    return
+                except Exception as e:
+                    if mirror.healthy(time.monotonic()):
+                        self.failure(mirror, e)
+                    return
+                self.success(mirror, time.perf_counter() - t0)
+
+            await asyncio.gather(*(check(m) for m in self.mirrors))
+
+    def start(self):
+        if self._task is None and len(self.mirrors) > 1:
+            self._task = asyncio.create_task(self._probe_loop())
+
+    async def _probe_loop(self):
+        while True:
+            try:
+                await self.probe()
+            except Exception as e:
+                logging.warning(f"YGG mirror probe failed: {e}")
+            await asyncio.sleep(self.probe_interval)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+# Miroirs partagés par toutes les requêtes (use_mirrors), sinon YGG_URL / UPSTREAM_URL_YGG seul
+MIRRORS = None
+
+
+def use_mirrors(pool):
+    global MIRRORS
+    MIRRORS = pool
+
+
+def _mirror_latencies():
+    return [((m.url,), m.ewma) for m in (MIRRORS.mirrors if MIRRORS else ()) if m.ewma is not None]
+
+
+def _mirror_states():
+    now = time.monotonic()
+    return [((m.url,), 1 if m.healthy(now) else 0) for m in (MIRRORS.mirrors if MIRRORS else ())]
+
+
+metrics.REGISTRY.computed(
+    'frenchio_ygg_mirror_latency_seconds', "Latence moyenne (exponentielle) de chaque miroir YGG",
+    'gauge', ('mirror',), _mirror_latencies
+)
+metrics.REGISTRY.computed(
+    'frenchio_ygg_mirror_up', "Miroir YGG utilisable (1) ou écarté après un échec (0)",
+    'gauge', ('mirror',), _mirror_states
+)
+
 
 class YggService:
-    def __init__(self, passkey, url="http://89.168.37.159:8888"): 
+    def __init__(self, passkey, url=None, mirrors=None):
         # URL par défaut basée sur yggapi.eu (standard pour ces docs), configurable si besoin
         self.passkey = passkey
-        self.base_url = url
+        if mirrors is None:
+            mirrors = MIRRORS if url is None and MIRRORS else MirrorPool([url or upstream.base_url("ygg", YGG_URL)])
+        self.mirrors = mirrors
+        self.base_url = mirrors.ranked()[0].url
 
     async def download_torrent(self, session, download_url):
         # YGG nécessite ?passkey=... pour télécharger
@@ -25,64 +163,113 @@ class YggService:
             pass
         return None
 
+    async def _search_on(self, session, mirror, params):
+        """Recherche sur un miroir : (miroir, résultats) ; erreur réseau ou 5xx = échec du miroir"""
+        t0 = time.perf_counter()
+        try:
+            async with session.get(f"{mirror.url}/torrents", params=params,
+                                   timeout=upstream.timeout("ygg", 20)) as response:
+                if response.status >= 500:
+                    raise aiohttp.ClientResponseError(response.request_info, (), status=response.status)
+                results = await response.json() if response.status == 200 else None
+        except asyncio.CancelledError:
+            # Course perdue contre l'autre miroir : sa durée est un minorant, le miroir recule dans le classement
+            self.mirrors.observe(mirror, time.perf_counter() - t0)
+            raise
+        except breaker.CircuitOpenError:
+            # Refusé sans appel réseau (disjoncteur du miroir) : pas un nouvel échec, on passe au suivant
+            raise
+        except Exception as e:
+            self.mirrors.failure(mirror, e)
+            raise
+        self.mirrors.success(mirror, time.perf_counter() - t0)
+        if results is None:
+            logging.warning(f"YGG Error {response.status}")
+        return mirror, results or []
+
+    async def _search(self, session, params):
+        """
+        Miroir le plus rapide, doublé par le second s'il tarde (hedging), puis
+        bascule sur les suivants en cas d'échec
+        """
+        start = time.monotonic()
+        mirrors = self.mirrors.ranked()
+        first, others = mirrors[0], mirrors[1:]
+        try:
+            if others and self.mirrors.hedge:
+                return await upstream.hedged(
+                    "ygg",
+                    lambda: self._search_on(session, first, params),
+                    lambda: self._search_on(session, others[0], params)
+                )
+            return await self._search_on(session, first, params)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            error = e
+        for mirror in others:
+            if mirror.failed_at >= start:
+                # Déjà essayé (seconde tentative du hedging)
+                continue
+            logging.info(f"YGG: failing over to {mirror.url}")
+            try:
+                return await self._search_on(session, mirror, params)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                error = e
+        raise error
+
     async def search(self, params):
         """
         Recherche générique sur YGG
         La passkey n'est PAS nécessaire pour la recherche, seulement pour le téléchargement
         """
-        search_url = f"{self.base_url}/torrents"
-        
         # On log l'appel (sans passkey car elle n'est pas dans l'URL de recherche ici, mais utilisée plus tard)
         logging.info(f"YGG Search Params: {params}")
 
-        async with aiohttp.ClientSession(trust_env=True) as session:
+        async with upstream.session("ygg") as session:
             try:
-                async with session.get(search_url, params=params, timeout=20) as response:
-                    if response.status == 200:
-                        results = await response.json()
-                        # results est une liste de TorrentResult
-                        if not results:
-                            return []
-                        
-                        logging.info(f"YGG found {len(results)} results")
-                        
-                        # Problème : on a besoin du hash pour AllDebrid.
-                        # TorrentResult n'a PAS de hash selon la doc.
-                        # On doit récupérer les détails pour chaque torrent.
-                        # On le fait en parallèle.
-                        
-                        tasks = [self.get_details(session, t['id']) for t in results]
-                        details_results = await asyncio.gather(*tasks)
-                        
-                        normalized = []
-                        for res in details_results:
-                            if not res: continue
-                            
-                            # On construit le lien de téléchargement avec la passkey
-                            download_url = f"{self.base_url}/torrent/{res['id']}/download?passkey={self.passkey}"
-                            
-                            item = {
-                                "name": res.get("title"),
-                                "size": res.get("size", 0),
-                                "tracker_name": "YGG",
-                                "info_hash": res.get("hash"),
-                                "magnet": None, 
-                                "link": download_url,
-                                "source": "ygg"
-                            }
-                            normalized.append(item)
-                        return normalized
-                    else:
-                        logging.warning(f"YGG Error {response.status}")
+                mirror, results = await self._search(session, params)
+                # results est une liste de TorrentResult
+                if not results:
+                    return []
+
+                logging.info(f"YGG found {len(results)} results on {mirror.url}")
+                # Détails et liens de téléchargement sur le miroir qui a répondu
+                base_url = mirror.url
+
+                # Problème : on a besoin du hash pour AllDebrid.
+                # TorrentResult n'a PAS de hash selon la doc.
+                # On doit récupérer les détails pour chaque torrent.
+                # On le fait en parallèle.
+
+                tasks = [self.get_details(session, t['id'], base_url) for t in results]
+                details_results = await asyncio.gather(*tasks)
+
+                normalized = []
+                for res in details_results:
+                    if not res: continue
+
+                    # On construit le lien de téléchargement avec la passkey
+                    download_url = f"{base_url}/torrent/{res['id']}/download?passkey={self.passkey}"
+
+                    item = {
+                        "name": res.get("title"),
+                        "size": res.get("size", 0),
+                        "tracker_name": "YGG",
+                        "info_hash": res.get("hash"),
+                        "magnet": None,
+                        "link": download_url,
+                        "source": "ygg"
+                    }
+                    normalized.append(item)
+                return normalized
             except Exception as e:
                 logging.error(f"YGG Exception: {e}")
         return []
 
-    async def get_details(self, session, torrent_id):
+    async def get_details(self, session, torrent_id, base_url=None):
         """Récupère les détails (notamment le hash)"""
-        url = f"{self.base_url}/torrent/{torrent_id}"
+        url = f"{base_url or self.base_url}/torrent/{torrent_id}"
         try:
-            async with session.get(url) as response:
+            async with upstream.hedged_get(session, "ygg", url, 10) as response:
                 if response.status == 200:
                     return await response.json()
         except Exception:
@@ -0,0 +1,225 @@
+"""
+Cache partagé : espaces de noms typés sur un backend interchangeable
+
+Les caches locaux (TTLCache, ResolveCache) vivent dans la mémoire d'un
+processus : chaque worker, réplique ou redémarrage repart à froid. Un
+SharedStore leur ajoute un second niveau commun, porté par un backend
+(cachebackends.py) : mémoire du processus, fichier SQLite pour plusieurs
+workers d'une même machine, ou serveur Redis (protocole RESP) pour plusieurs
+machines. Les backends ne voient que des clés texte et des octets.
+
+- Espaces de noms typés : chaque cache déclare le sien avec le type de ses
+  valeurs (namespace("search", list)). Une valeur d'un autre type, d'un
+  autre format ou illisible est traitée comme absente.
+- Sérialisation binaire compacte : marshal (types de base, tuples conservés),
+  compressé par zlib au-delà de COMPRESS_MIN octets, derrière un en-tête
+  (version du format, options, expiration en temps mur). Les valeurs ne
+  viennent que des backends de l'application : marshal n'est pas fait pour
+  lire des données d'origine inconnue.
+- Fusion des chargements entre processus : verrous à durée limitée, un seul
+  worker charge une clé, les autres attendent son résultat.
+- Un backend en panne n'interrompt pas les requêtes : l'opération compte
+  comme un manque (ou une écriture perdue) et l'erreur est comptée.
+"""
+import asyncio
+import json
+import logging
+import marshal
+import os
+import secrets
+import sqlite3
+import struct
+import time
+import zlib
+
+import metrics
+from cachebackends import RedisError
+
+FORMAT_VERSION = 1
+# Charges utiles compressées au-delà de cette taille (si la compression fait gagner)
+COMPRESS_MIN = 512
+_HEADER = struct.Struct('>BBd')
+_COMPRESSED = 1
+
+# Erreurs d'un backend qui ne doivent pas faire échouer une requête
+BACKEND_ERRORS = (OSError, asyncio.TimeoutError, sqlite3.Error, RedisError)
+
+SHARED_LOOKUPS = metrics.REGISTRY.counter(
+    'frenchio_shared_store_lookups_total', "Lectures du cache partagé", ('namespace', 'result'))
+SHARED_WAITS = metrics.REGISTRY.counter(
+    'frenchio_shared_store_waits_total', "Chargements laissés à un autre processus (verrou partagé)", ('namespace',))
+SHARED_WRITTEN = metrics.REGISTRY.counter(
+    'frenchio_shared_store_written_bytes_total', "Octets écrits dans le cache partagé (après compression)",
+    ('namespace',))
+SHARED_ERRORS = metrics.REGISTRY.counter(
+    'frenchio_shared_store_errors_total', "Opérations du cache partagé en échec (backend indisponible)",
+    ('operation',))
+
+
+def encode_key(key):
+    """Clé de cache (tuple de chaînes, nombres, None) en texte stable"""
+    return json.dumps(key, separators=(',', ':'))
+
+
+def pack(value, expires):
+    payload = marshal.dumps(value)
+    flags = 0
+    if len(payload) >= COMPRESS_MIN:
+        compressed = zlib.compress(payload, 6)
+        if len(compressed) < len(payload):
+            payload, flags = compressed, _COMPRESSED
+    return _HEADER.pack(FORMAT_VERSION, flags, expires) + payload
+
+
+def unpack(data):
+    """(valeur, expiration), None si le format est inconnu ou illisible"""
+    if data is None or len(data) < _HEADER.size:
+        return None
+    version, flags, expires = _HEADER.unpack_from(data)
+    if version != FORMAT_VERSION:
+        return None
+    payload = data[_HEADER.size:]
+    try:
+        if flags & _COMPRESSED:
+            payload = zlib.decompress(payload)
+        return marshal.loads(payload), expires
+    except (ValueError, EOFError, TypeError, zlib.error):
+        return None
+
+
+class Namespace:
+    """Espace de noms d'un cache : clés (tuples) et valeurs de type `value_type`"""
+
+    def __init__(self, store, name, value_type):
+        self.store = store
+        self.name = name
+        self.value_type = value_type
+
+    def _key(self, key):
+        return f"{self.name}:{encode_key(key)}"
+
+    def _decode(self, data, now):
+        item = unpack(data)
+        if item is None or item[1] <= now or not isinstance(item[0], self.value_type):
+            return None
+        return item[0], item[1] - now
+
+    async def get_many(self, keys):
+        """{clé: (valeur, durée de vie restante)} des clés présentes, valides et non expirées"""
+        if not keys:
+            return {}
+        encoded = {self._key(k): k for k in keys}
+        raw = await self.store.call('get', self.store.backend.get_many(list(encoded)), {})
+        now = time.time()
+        found = {}
+        for full_key, data in raw.items():
+            item = self._decode(data, now)
+            if item is not None:
+                found[encoded[full_key]] = item
+        SHARED_LOOKUPS.inc(self.name, 'hit', amount=len(found))
+        SHARED_LOOKUPS.inc(self.name, 'miss', amount=len(keys) - len(found))
+        return found
+
+    async def get(self, key):
+        """(valeur, durée de vie restante), ou None"""
+        return (await self.get_many([key])).get(key)
+
+    async def set_many(self, items, ttl):
+        expires = time.time() + ttl
+        rows = []
+        for key, value in items:
+            if not isinstance(value, self.value_type):
+                raise TypeError(f"{self.name}: expected {self.value_type.__name__}, got {type(value).__name__}")
+            try:
+                rows.append((self._key(key), pack(value, expires)))
+            except ValueError as e:
+                # Objet que marshal ne sait pas écrire : gardé en local seulement
+                logging.warning(f"Shared cache {self.name}: value not serializable ({e})")
+        if rows:
+            SHARED_WRITTEN.inc(self.name, amount=sum(len(data) for _, data in rows))
+            await self.store.call('set', self.store.backend.set_many(rows, ttl))
+
+    async def set(self, key, value, ttl):
+        await self.set_many([(key, value)], ttl)
+
+    async def delete(self, key):
+        await self.store.call('delete', self.store.backend.delete(self._key(key)))
+
+    async def load(self, key, loader, ttl, cache_if=bool):
+        """
+        Valeur partagée de `key`, chargée via `loader()` par un seul processus à
+        la fois. Retourne (valeur, durée de vie restante) ; la durée vaut `ttl`
+        si la valeur vient d'être chargée ici.
+        """
+        store = self.store
+        lock_key = f"lock:{self._key(key)}"
+        deadline = time.monotonic() + store.lock_lease
+        waited = False
+        while True:
+            hit = await self.get(key)
+            if hit is not None:
+                return hit
+            # Backend indisponible : chargement local sans attendre
+            if await store.call('lock', store.backend.acquire(lock_key, store.owner, store.lock_lease), True):
+                try:
+                    value = await loader()
+                    if cache_if(value):
+                        await self.set(key, value, ttl)
+                    return value, ttl
+                finally:
+                    await store.call('lock', store.backend.release(lock_key, store.owner))
+            if waited and not await store.call('lock', store.backend.locked(lock_key), False):
+                # Chargement terminé ailleurs : son résultat, ou rien de gardé (erreur, résultat vide)
+                hit = await self.get(key)
+                if hit is not None:
+                    return hit
+                break
+            if not waited:
+                SHARED_WAITS.inc(self.name)
+                waited = True
+            if time.monotonic() > deadline:
+                break
+            await asyncio.sleep(store.poll_interval)
+        return await loader(), ttl
+
+
+class SharedStore:
+    def __init__(self, backend, lock_lease=30, poll_interval=0.05, error_log_interval=60):
+        self.backend = backend
+        self.lock_lease = lock_lease
+        self.poll_interval = poll_interval
+        self.error_log_interval = error_log_interval
+        # Propriétaire des verrous pris par ce processus
+        self.owner = f"{os.getpid()}-{secrets.token_hex(4)}"
+        self.namespaces = {}
+        self._logged_at = 0.0
+        metrics.REGISTRY.computed(
+            'frenchio_shared_store_entries', "Entrées du cache partagé (backends mémoire et SQLite)",
+            'gauge', (), lambda: [((), usage[0])] if (usage := backend.usage()) else [])
+        metrics.REGISTRY.computed(
+            'frenchio_shared_store_bytes', "Taille des entrées du cache partagé (backends mémoire et SQLite)",
+            'gauge', (), lambda: [((), usage[1])] if (usage := backend.usage()) else [])
+
+    def namespace(self, name, value_type):
+        if name in self.namespaces:
+            raise ValueError(f"shared cache namespace {name!r} already declared")
+        namespace = self.namespaces[name] = Namespace(self, name, value_type)
+        return namespace
+
+    async def call(self, operation, coroutine, default=None):
+        """Résultat de `coroutine` (opération du backend), `default` si le backend est en erreur"""
+        try:
+            return await coroutine
+        except BACKEND_ERRORS as e:
+            SHARED_ERRORS.inc(operation)
+            now = time.monotonic()
+            if now - self._logged_at >= self.error_log_interval:
+                self._logged_at = now
+                logging.warning(f"Shared cache: {operation} failed on {self.backend.name}: {type(e).__name__} {e}")
+            return default
+
+    def start(self):
+        self.backend.start()
+
+    async def close(self):
+        await self.backend.close()
@@ -0,0 +1,106 @@
+"""
+Chronométrage des étapes d'une requête (en-tête Server-Timing et log)
+
+Le chronomètre de la requête en cours vit dans une ContextVar : les services
+n'ont rien à faire passer, `with stage("nom"):` suffit. Hors requête (tâches
+de fond lancées après la réponse, scripts), les étapes ne coûtent rien.
+"""
+import contextvars
+import re
+import time
+
+_current = contextvars.ContextVar('frenchio_timing', default=None)
+
+_TOKEN_RE = re.compile(r'[^A-Za-z0-9_-]')
+
+
+def metric_name(name):
+    """Nom utilisable comme métrique Server-Timing (token HTTP)"""
+    return _TOKEN_RE.sub('_', name)
+
+
+class RequestTiming:
+    """
+    Durées cumulées par étape. Avec `trace=True`, chaque étape est aussi
+    gardée individuellement (début relatif, durée, détail) pour le log.
+    """
+
+    __slots__ = ('start', 'stages', 'trace', 'done')
+
+    def __init__(self, trace=False):
+        self.start = time.perf_counter()
+        # nom -> [durée totale, nombre d'occurrences]
+        self.stages = {}
+        self.trace = [] if trace else None
+        self.done = False
+
+    def add(self, name, started, duration, detail=None):
+        if self.done:
+            return
+        entry = self.stages.get(name)
+        if entry is None:
+            self.stages[name] = [duration, 1]
+        else:
+            entry[0] += duration
+            entry[1] += 1
+        if self.trace is not None:
+            self.trace.append((name, round((started - self.start) * 1000, 1), round(duration * 1000, 1), detail))
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def header(self, total):
+        parts = []
+        for name, (duration, count) in self.stages.items():
+            part = f"{name};dur={duration * 1000:.1f}"
+            if count > 1:
+                part += f';desc="x{count}"'
+            parts.append(part)
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ', '.join(parts)
+
+    def summary(self):
+        return {name: round(duration * 1000, 1) for name, (duration, _) in self.stages.items()}
+
+
+def begin(trace=False):
+    """Démarre le chronomètre de la requête courante, retourne (timing, jeton de ContextVar)"""
+    timing = RequestTiming(trace)
+    return timing, _current.set(timing)
+
+
+def end(timing, token):
+    # Les tâches de fond héritent du contexte : on ignore ce qu'elles mesurent après la réponse
+    timing.done = True
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+class stage:
+    """Chronomètre une étape : `with stage("tmdb"):` ou `async with stage("tmdb"):`"""
+
+    __slots__ = ('name', 'timing', 't0')
+
+    def __init__(self, name):
+        self.name = metric_name(name)
+        self.timing = None
+
+    def __enter__(self):
+        self.timing = _current.get()
+        if self.timing is not None:
+            self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.timing is not None:
+            self.timing.add(self.name, self.t0, time.perf_counter() - self.t0)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
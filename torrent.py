@@ -0,0 +1,147 @@
+"""
+Lecture locale des fichiers .torrent (bencode)
+
+Permet de connaître l'info hash, la liste des fichiers et leur placement dans
+les pièces sans attendre que qBittorrent ait chargé les métadonnées.
+"""
+import hashlib
+
+
+class TorrentParseError(ValueError):
+    pass
+
+
+def _decode(data, i):
+    """Décode la valeur bencodée à la position i, retourne (valeur, position suivante)"""
+    c = data[i]
+    if c == 0x64:  # d
+        i += 1
+        result = {}
+        while data[i] != 0x65:  # e
+            key, i = _decode_bytes(data, i)
+            result[key], i = _decode(data, i)
+        return result, i + 1
+    if c == 0x6c:  # l
+        i += 1
+        result = []
+        while data[i] != 0x65:
+            value, i = _decode(data, i)
+            result.append(value)
+        return result, i + 1
+    if c == 0x69:  # i
+        end = data.index(b'e', i)
+        return int(data[i + 1:end]), end + 1
+    return _decode_bytes(data, i)
+
+
+def _decode_bytes(data, i):
+    colon = data.index(b':', i)
+    start = colon + 1
+    end = start + int(data[i:colon])
+    if end > len(data):
+        raise TorrentParseError("truncated string")
+    return data[start:end], end
+
+
+def bdecode(data):
+    """Décode un document bencodé complet"""
+    try:
+        value, end = _decode(data, 0)
+    except (IndexError, ValueError) as e:
+        raise TorrentParseError(f"invalid bencode: {e}") from e
+    if end != len(data):
+        raise TorrentParseError("trailing data after bencoded value")
+    return value
+
+
+def _info_span(data):
+    """Retourne (dict info décodé, octets bruts du dict info) pour le calcul du hash"""
+    if not data or data[0] != 0x64:
+        raise TorrentParseError("torrent is not a dictionary")
+    i = 1
+    while data[i] != 0x65:
+        key, i = _decode_bytes(data, i)
+        start = i
+        value, i = _decode(data, i)
+        if key == b'info':
+            return value, data[start:i]
+    raise TorrentParseError("missing info dictionary")
+
+
+def _text(value):
+    return value.decode('utf-8', errors='replace') if isinstance(value, bytes) else str(value)
+
+
+class TorrentFile:
+    __slots__ = ('index', 'name', 'size', 'offset', 'first_piece', 'last_piece')
+
+    def __init__(self, index, name, size, offset, piece_length):
+        self.index = index
+        self.name = name
+        self.size = size
+        self.offset = offset
+        self.first_piece = offset // piece_length
+        self.last_piece = (offset + max(size, 1) - 1) // piece_length
+
+
+class TorrentInfo:
+    __slots__ = ('info_hash', 'name', 'piece_length', 'num_pieces', 'total_size', 'files')
+
+    def __init__(self, info_hash, name, piece_length, num_pieces, total_size, files):
+        self.info_hash = info_hash
+        self.name = name
+        self.piece_length = piece_length
+        self.num_pieces = num_pieces
+        self.total_size = total_size
+        self.files = files
+
+
+def parse_torrent(data):
+    """
+    Analyse un .torrent (v1 ou hybride) et retourne un TorrentInfo.
+
+    Les noms de fichiers suivent la disposition "Original" de qBittorrent
+    (dossier racine inclus pour les torrents multi-fichiers). Les fichiers de
+    padding (BEP 47) sont comptés dans les offsets mais pas dans les index,
+    comme le fait qBittorrent.
+    """
+    try:
+        info, raw_info = _info_span(data)
+    except (IndexError, ValueError) as e:
+        raise TorrentParseError(f"invalid torrent: {e}") from e
+
+    pieces = info.get(b'pieces')
+    piece_length = info.get(b'piece length')
+    if not isinstance(pieces, bytes) or not isinstance(piece_length, int) or piece_length <= 0:
+        # Torrent v2 pur : qBittorrent l'identifie par un autre hash
+        raise TorrentParseError("not a v1/hybrid torrent")
+
+    name = _text(info.get(b'name.utf-8') or info.get(b'name', b''))
+    files = []
+    offset = 0
+
+    if b'files' in info:
+        index = 0
+        for entry in info[b'files']:
+            size = entry.get(b'length', 0)
+            if b'p' in entry.get(b'attr', b''):
+                offset += size
+                continue
+            parts = entry.get(b'path.utf-8') or entry.get(b'path') or []
+            path = '/'.join(_text(p) for p in parts)
+            files.append(TorrentFile(index, f"{name}/{path}", size, offset, piece_length))
+            offset += size
+            index += 1
+    else:
+        size = info.get(b'length', 0)
+        files.append(TorrentFile(0, name, size, 0, piece_length))
+        offset = size
+
+    return TorrentInfo(
+        info_hash=hashlib.sha1(raw_info).hexdigest(),
+        name=name,
+        piece_length=piece_length,
+        num_pieces=len(pieces) // 20,
+        total_size=offset,
+        files=files
+    )
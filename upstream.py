@@ -0,0 +1,214 @@
+"""
+Sessions HTTP vers les services externes (TMDB, trackers, débrideurs)
+
+Toutes les sessions passent par `session()` : proxy lu depuis l'environnement
+(trust_env), chronométrage de chaque appel dans la requête en cours et
+métriques par service externe. Avec `use_breakers()`, un disjoncteur par
+service refuse immédiatement les appels vers un service en panne (voir
+breaker.py). Avec `use_latency()`, les timeouts suivent la latence observée
+de chaque service et les GET idempotents peuvent être doublés (voir
+latency.py). Avec `use_corpus()`, les échanges sont enregistrés sur disque ou
+rejoués sans réseau (voir replay.py).
+"""
+import asyncio
+import logging
+import os
+import time
+
+import aiohttp
+
+from yarl import URL
+
+import breaker
+import metrics
+import replay
+import timing
+
+# Disjoncteurs (use_breakers) : None = désactivés
+_BREAKERS = None
+# Liens CDN des débrideurs : un hôte par lien, pas de disjoncteur
+_BREAKER_EXEMPT = ('cdn',)
+# Services à miroirs : un disjoncteur par hôte, un miroir en panne ne coupe pas les autres
+_BREAKER_PER_HOST = ('ygg',)
+
+
+def use_breakers(registry):
+    global _BREAKERS
+    _BREAKERS = registry
+
+
+def _check_breaker(name, url):
+    """Disjoncteur du service et drapeau de sonde ; lève CircuitOpenError si le service est coupé"""
+    if _BREAKERS is None or name in _BREAKER_EXEMPT:
+        return None, False
+    if name in _BREAKER_PER_HOST:
+        name = f"{name}:{url.host}"
+    circuit = _BREAKERS.get(name or url.host or 'unknown')
+    allowed = circuit.allow()
+    if not allowed:
+        breaker.BREAKER_REJECTED.inc(circuit.name)
+        raise breaker.CircuitOpenError(circuit.name, circuit.retry_in())
+    return circuit, allowed == 'probe'
+
+
+# Latence par service (use_latency) : None = timeouts fixes, pas de hedging
+_LATENCY = None
+
+
+def use_latency(tracker):
+    global _LATENCY
+    _LATENCY = tracker
+
+
+def timeout(name, default):
+    """
+    Timeout d'un appel à `name` (label du service, ou hôte pour les trackers
+    UNIT3D) : `default` au démarrage, puis suivant le p99 observé, sans jamais
+    dépasser `default`
+    """
+    if _LATENCY is not None:
+        default = _LATENCY.timeout(name, default)
+    return aiohttp.ClientTimeout(total=default)
+
+
+async def hedged(name, attempt, second=None):
+    """
+    Résultat de `attempt()`, doublé par `second()` (par défaut `attempt`) si
+    la réponse tarde ; sans suivi de latence, `attempt()` seul
+    """
+    if _LATENCY is None:
+        return await attempt()
+    return await _LATENCY.hedged(name, attempt, second)
+
+
+def hedged_get(session, name, url, default_timeout, **kwargs):
+    """
+    GET idempotent pouvant être doublé si la réponse tarde (voir latency.py).
+    S'utilise comme `session.get` ; le corps est lu avant le retour, la réponse
+    reste utilisable après la fermeture de la connexion.
+    """
+    name = name or URL(url).host or 'unknown'
+
+    async def attempt():
+        async with session.get(url, timeout=timeout(name, default_timeout), **kwargs) as resp:
+            body = await resp.read()
+            return replay.ReplayResponse('GET', str(resp.url), resp.status, resp.headers, body)
+
+    return replay.RequestContext(hedged(name, attempt))
+
+
+def _observe(name, request_timing, method, url, t0, status=None, exception=None):
+    """Latence d'un appel dans les métriques et dans le chronométrage de la requête en cours"""
+    duration = time.perf_counter() - t0
+    host = url.host or 'unknown'
+    metrics.observe_upstream(name or host, duration, status, exception)
+    if _LATENCY is not None and not isinstance(exception, asyncio.CancelledError):
+        # Un appel coupé par son timeout compte pour la durée du timeout (voir latency.py)
+        _LATENCY.observe(name or host, duration)
+    if request_timing is not None:
+        # Ni chemin ni query dans le détail : ils contiennent souvent passkeys et clés API
+        request_timing.add(
+            timing.metric_name(f"up_{name or host}"), t0, duration,
+            f"{method} {host} {status or type(exception).__name__}"
+        )
+
+
+def _trace_config(name):
+    """TraceConfig d'un service ; sans nom, le service est identifié par l'hôte appelé"""
+
+    async def on_request_start(session, ctx, params):
+        # Refus avant tout appel réseau : ni métrique de latence, ni chronométrage
+        ctx.breaker, ctx.probe = _check_breaker(name, params.url)
+        ctx.timing = timing.current()
+        ctx.t0 = time.perf_counter()
+
+    async def on_request_end(session, ctx, params):
+        _observe(name, ctx.timing, params.method, params.url, ctx.t0, status=params.response.status)
+        if ctx.breaker:
+            ctx.breaker.record(time.perf_counter() - ctx.t0, status=params.response.status, probe=ctx.probe)
+
+    async def on_request_exception(session, ctx, params):
+        _observe(name, ctx.timing, params.method, params.url, ctx.t0, exception=params.exception)
+        if ctx.breaker:
+            ctx.breaker.record(time.perf_counter() - ctx.t0, exception=params.exception, probe=ctx.probe)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+
+_TRACE_CONFIGS = {}
+
+# Corpus d'échanges (use_corpus) : None = appels réels sans enregistrement
+_CORPUS = None
+_MODE = None
+_REPLAY_SPEED = 1.0
+
+
+def use_corpus(mode, directory, speed=1.0):
+    """
+    `record` : les échanges réels sont ajoutés au corpus `directory`.
+    `replay` : plus aucun appel réseau, les réponses viennent du corpus après
+    leur durée d'origine multipliée par `speed` (0 = immédiat).
+    """
+    global _CORPUS, _MODE, _REPLAY_SPEED
+    if mode not in ('record', 'replay'):
+        raise ValueError(f"unknown upstream mode {mode!r}")
+    corpus = replay.Corpus(directory)
+    if mode == 'record':
+        os.makedirs(directory, exist_ok=True)
+        logging.info(f"Upstream: recording exchanges to {directory}")
+    else:
+        logging.info(f"Upstream: replaying {corpus.load()} exchanges from {directory}")
+    _CORPUS, _MODE, _REPLAY_SPEED = corpus, mode, speed
+
+
+def recording():
+    return _MODE == 'record'
+
+
+def replaying():
+    return _MODE == 'replay'
+
+
+async def record_inbound(path, config):
+    """Mode enregistrement : note une requête reçue (config sans ses secrets) pour la rejouer au banc"""
+    entry = {"path": path, "config": replay.mask_config(config), "at": round(time.time(), 3)}
+    try:
+        await asyncio.to_thread(_CORPUS.write_inbound, entry)
+    except OSError as e:
+        logging.warning(f"Upstream record: could not write to {_CORPUS.directory}: {e}")
+
+
+def base_url(name, default):
+    """URL de base d'un service, remplaçable par UPSTREAM_URL_<NOM> (miroir, serveurs factices du banc)"""
+    return os.getenv(f"UPSTREAM_URL_{name.upper()}", default).rstrip('/')
+
+
+def session(name=None, **kwargs):
+    """ClientSession à utiliser pour tout appel sortant (`name` : label du service dans les métriques)"""
+    if _MODE == 'replay':
+        def observe(*args):
+            _observe(name, timing.current(), *args)
+        return replay.ReplaySession(_CORPUS, name or 'other', _REPLAY_SPEED, observe=observe)
+    trace_config = _TRACE_CONFIGS.get(name)
+    if trace_config is None:
+        trace_config = _TRACE_CONFIGS[name] = _trace_config(name)
+    client = aiohttp.ClientSession(trust_env=True, trace_configs=[trace_config], **kwargs)
+    if _MODE == 'record':
+        return replay.RecordingSession(_CORPUS, name or 'other', client)
+    return client
+
+
+def requests_hooks(name):
+    """
+    Hooks `requests` pour les clients synchrones (qBittorrent) : latence et
+    erreurs HTTP dans les métriques. Les erreurs de connexion ne passent pas
+    par les hooks et ne sont pas comptées.
+    """
+    def on_response(response, *args, **kwargs):
+        metrics.observe_upstream(name, response.elapsed.total_seconds(), response.status_code)
+
+    return {'response': on_response}
@@ -1,3 +1,4 @@
+import logging
 import re
 
 def format_size(size_bytes):
@@ -116,3 +117,54 @@ def check_season_episode(name, target_season, target_episode):
     # Si on a trouvé des patterns SxxExx mais aucun ne correspond
     # (Ex: trouvé S05E03 alors qu'on veut S05E07)
     return False
+
+def filter_torrents(all_torrents, config, stream_type, imdb_id, tmdb_id, season, episode):
+    """Filtre (taille, IDs, saison/épisode) et déduplique par info_hash"""
+    # Filtrage par taille si configuré
+    max_size_gb = config.get('max_size', 0)
+    if max_size_gb > 0:
+        max_size_bytes = max_size_gb * 1024 * 1024 * 1024  # Conversion Go -> bytes
+        before_filter = len(all_torrents)
+        all_torrents = [t for t in all_torrents if t.get('size', 0) <= max_size_bytes]
+        filtered_count = before_filter - len(all_torrents)
+        if filtered_count > 0:
+            logging.info(f"Filtered {filtered_count} torrents exceeding {max_size_gb} Go")
+    
+    unique_torrents = {}
+    
+    for t in all_torrents:
+        # Filtrage Strict pour UNIT3D (Anti-bruit ID)
+        if t.get('source') == 'unit3d': # ou le nom interne utilisé dans le service
+            # UNIT3D est cherché par ID, donc le résultat DOIT avoir l'ID correspondant
+            # ou au moins ne pas avoir un ID contradictoire (0 ou différent)
+            
+            res_tmdb = t.get('tmdb_id') or t.get('tmdb')
+            res_imdb = t.get('imdb_id') or t.get('imdb')
+            
+            # Si TMDB ID présent et non nul, il doit matcher
+            if res_tmdb and str(res_tmdb) != "0" and tmdb_id and str(res_tmdb) != str(tmdb_id):
+                continue
+                
+            # Si IMDB ID présent et non nul, il doit matcher (en ignorant 'tt')
+            if res_imdb and str(res_imdb) != "0" and imdb_id:
+                clean_res = str(res_imdb).replace('tt', '')
+                clean_req = str(imdb_id).replace('tt', '')
+                if clean_res != clean_req:
+                    continue
+
+        # Filtrage Série (SxxExx)
+        # Si c'est une série, on vérifie que le titre correspond à la saison/épisode demandé
+        # pour éviter d'afficher E03 quand on veut E07 (souvent le cas avec recherche floue)
+        if stream_type == 'series' and season is not None:
+            if not check_season_episode(t.get('name', ''), season, episode):
+                continue
+
+        # Info Hash est la clé unique (minuscule pour éviter les doublons de casse)
+        ih = t.get('info_hash')
+        if ih:
+            ih = ih.lower()
+            if ih not in unique_torrents:
+                unique_torrents[ih] = t
+            
+    # Liste finale des torrents uniques
+    return list(unique_torrents.values())
@@ -0,0 +1,155 @@
+"""
+Mode multi-processus : un superviseur et WORKERS processus serveurs
+
+Un seul processus asyncio n'utilise qu'un cœur : parsing des noms de
+release, décodage JSON des réponses des trackers et appels qBittorrent se
+partagent ce cœur. Avec WORKERS > 1, `python main.py` devient un superviseur
+qui lance WORKERS processus (`main.py` relancé avec FRENCHIO_WORKER=<n>) et
+ne sert rien lui-même :
+
+- écoute : chaque worker ouvre son propre socket avec SO_REUSEPORT (le noyau
+  répartit les connexions), ou, sans SO_REUSEPORT, tous acceptent sur un
+  socket ouvert par le superviseur et hérité (FRENCHIO_LISTEN_FD) ;
+- état partagé : caches et fusion des chargements passent par le cache
+  partagé (sharedstore.py) : fichier SQLite commun (SHARED_STORE_PATH, fichier
+  temporaire par défaut) ou Redis (CACHE_BACKEND=redis) ;
+- un worker qui s'arrête est relancé, avec un délai croissant s'il s'arrête
+  dès son démarrage ;
+- SIGTERM / SIGINT : transmis aux workers, qui finissent leurs requêtes en
+  cours (shutdown_timeout d'aiohttp) ; ceux encore vivants après le délai
+  sont tués.
+"""
+import logging
+import os
+import signal
+import socket
+import subprocess
+import tempfile
+import time
+
+WORKER_ENV = 'FRENCHIO_WORKER'
+LISTEN_FD_ENV = 'FRENCHIO_LISTEN_FD'
+# worker_id() du superviseur
+SUPERVISOR = -1
+
+
+def worker_id():
+    """Numéro du worker courant, SUPERVISOR pour le superviseur, None en mode mono-processus"""
+    value = os.getenv(WORKER_ENV)
+    if value is not None:
+        return int(value)
+    if int(os.getenv('WORKERS', '1')) > 1:
+        return SUPERVISOR
+    return None
+
+
+def listen_socket(host, port, reuse_port=False, backlog=512):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+def worker_socket(host, port):
+    """Socket d'écoute d'un worker : celui hérité du superviseur, sinon le sien (SO_REUSEPORT)"""
+    fd = os.getenv(LISTEN_FD_ENV)
+    if fd is not None:
+        return socket.socket(fileno=int(fd))
+    return listen_socket(host, port, reuse_port=True)
+
+
+class Supervisor:
+    def __init__(self, argv, workers, host, port, reuse_port=True, shutdown_timeout=30,
+                 restart_delay=1.0, max_restart_delay=30.0):
+        self.argv = argv
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port and hasattr(socket, 'SO_REUSEPORT')
+        self.shutdown_timeout = shutdown_timeout
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.processes = {}
+        self._stopping = False
+
+    def _spawn(self, number, env, sock):
+        env = {**env, WORKER_ENV: str(number)}
+        process = subprocess.Popen(self.argv, env=env, pass_fds=(sock.fileno(),) if sock else ())
+        process.started_at = time.monotonic()
+        logging.info(f"Worker {number} started (pid {process.pid})")
+        return process
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+
+    def run(self):
+        env = dict(os.environ)
+        created_store = None
+        if not env.get('SHARED_STORE_PATH') and env.get('CACHE_BACKEND', 'sqlite').lower() in ('', 'sqlite'):
+            created_store = env['SHARED_STORE_PATH'] = os.path.join(
+                tempfile.gettempdir(), f"frenchio-shared-{os.getpid()}.db")
+
+        sock = None
+        if self.reuse_port:
+            # Vérifie l'adresse tout de suite plutôt que de voir chaque worker échouer
+            listen_socket(self.host, self.port, reuse_port=True).close()
+        else:
+            sock = listen_socket(self.host, self.port)
+            env[LISTEN_FD_ENV] = str(sock.fileno())
+        mode = "SO_REUSEPORT" if self.reuse_port else "shared socket"
+        logging.info(f"Supervisor: {self.workers} workers on {self.host}:{self.port} ({mode})")
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        failures = {}
+        respawn_at = {}
+        self.processes = {n: self._spawn(n, env, sock) for n in range(self.workers)}
+        try:
+            while not self._stopping:
+                now = time.monotonic()
+                for number, process in list(self.processes.items()):
+                    if process is None:
+                        if now >= respawn_at[number]:
+                            self.processes[number] = self._spawn(number, env, sock)
+                        continue
+                    code = process.poll()
+                    if code is None:
+                        continue
+                    # Arrêt dès le démarrage : délai croissant pour ne pas boucler
+                    failures[number] = failures.get(number, 0) + 1 if now - process.started_at < 10 else 0
+                    delay = min(self.restart_delay * 2 ** failures[number], self.max_restart_delay)
+                    logging.warning(f"Worker {number} (pid {process.pid}) exited with {code}, restarting in {delay:.0f}s")
+                    self.processes[number] = None
+                    respawn_at[number] = now + delay
+                time.sleep(0.2)
+        finally:
+            self._shutdown()
+            if sock:
+                sock.close()
+            if created_store:
+                for suffix in ('', '-wal', '-shm'):
+                    try:
+                        os.unlink(created_store + suffix)
+                    except FileNotFoundError:
+                        pass
+
+    def _shutdown(self):
+        alive = [p for p in self.processes.values() if p is not None and p.poll() is None]
+        logging.info(f"Supervisor: stopping {len(alive)} workers")
+        for process in alive:
+            process.send_signal(signal.SIGTERM)
+        # Marge au-delà du shutdown_timeout des workers pour leur nettoyage
+        deadline = time.monotonic() + self.shutdown_timeout + 5
+        for process in alive:
+            try:
+                process.wait(max(deadline - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                logging.warning(f"Worker pid {process.pid} did not stop in time, killing it")
+                process.kill()
+                process.wait()